@@ -1,87 +1,314 @@
+import time
+import threading
+import httpx
 import ollama
 import logging
-from decouple import config
-from typing import Optional, Dict, Any
+from decouple import config, Csv
+from typing import Optional, Dict, Any, Callable, List
+from model_router import ModelRouter
+from conversation import estimate_tokens
+from prompts import build_messages, prefix_key
+from metrics import ERRORS, observe_generation
+
+logging.basicConfig(level=logging.INFO)
 
 class OllamaService:
     def __init__(self):
         self.host = config("OLLAMA_HOST", default="localhost")
         self.port = config("OLLAMA_PORT", default=11434, cast=int)
         self.model = config("OLLAMA_MODEL")
+        self.large_model = config("OLLAMA_LARGE_MODEL", default="")
+        self.large_model_tokens = config("LARGE_MODEL_PROMPT_TOKENS", default=400, cast=int)
+        self.embed_model = config("FAQ_EMBED_MODEL", default="nomic-embed-text")
+        self.pull_embed_model = config("FAQ_ENABLED", default=False, cast=bool) and \
+            config("FAQ_EMBEDDER", default="ollama") == "ollama"
         self.base_url = f"http://{self.host}:{self.port}"
+        self.hosts = config("OLLAMA_HOSTS", default="", cast=Csv()) or [self.base_url]
+        
+        self.keep_alive = config("OLLAMA_KEEP_ALIVE", default="30m")
+        self.idle_unload = config("OLLAMA_IDLE_UNLOAD", default=1800, cast=int)
+        # With idle unloading on, requests pin the model and the keep-alive scheduler releases it
+        self.request_keep_alive = -1 if self.idle_unload > 0 else self.keep_alive
+        self.model_ready_ttl = config("OLLAMA_MODEL_READY_TTL", default=300, cast=int)
+        self.model_info_ttl = config("OLLAMA_MODEL_INFO_TTL", default=3600, cast=int)
+        self.model_ready_until = 0.0
+        self.model_info_cache = None
+        self.model_info_until = 0.0
         
-        self.client = ollama.Client(host=self.base_url)
+        self.limits = httpx.Limits(
+            max_connections=config("OLLAMA_MAX_CONNECTIONS", default=20, cast=int),
+            max_keepalive_connections=config("OLLAMA_MAX_KEEPALIVE", default=10, cast=int),
+            keepalive_expiry=config("OLLAMA_KEEPALIVE_EXPIRY", default=300, cast=float)
+        )
+        self.router = ModelRouter(self.hosts, self.limits)
         
-        logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
+    
+    def models(self) -> List[str]:
+        return [model for model in (self.model, self.large_model) if model]
         
-    def check_model_availability(self) -> bool:
+    def check_model_availability(self, backend) -> bool:
         try:
-            models = self.client.list()
-            available_models = [model['name'] for model in models['models']]
-            return self.model in available_models
+            models = backend.client.list()
+            backend.models = {model['name'] for model in models['models']}
+            return True
         except Exception as e:
-            self.logger.error(f"Model check error: {e}")
+            self.logger.error(f"Model check error ({backend.url}): {e}")
             return False
     
-    def pull_model(self) -> bool:
+    def pull_model(self, backend, model: str) -> bool:
         try:
-            self.logger.info(f"Pulling model: {self.model}")
-            self.client.pull(self.model)
-            self.logger.info(f"Model successfully pulled: {self.model}")
+            self.logger.info(f"Pulling model {model} on {backend.url}")
+            backend.client.pull(model)
+            backend.models.add(model)
+            self.logger.info(f"Model successfully pulled: {model}")
             return True
         except Exception as e:
-            self.logger.error(f"Model pull error: {e}")
+            self.logger.error(f"Model pull error ({backend.url}): {e}")
             return False
     
     def ensure_model_ready(self) -> bool:
-        if not self.check_model_availability():
-            self.logger.info(f"Model {self.model} not available, pulling...")
-            return self.pull_model()
+        if time.time() < self.model_ready_until:
+            return True
+        
+        ready = False
+        for backend in self.router.backends:
+            if not self.check_model_availability(backend):
+                continue
+            for model in self.models() + ([self.embed_model] if self.pull_embed_model else []):
+                if model not in backend.models:
+                    self.logger.info(f"Model {model} not available on {backend.url}, pulling...")
+                    self.pull_model(backend, model)
+            ready = ready or self.model in backend.models
+        
+        if not ready:
+            return False
+        
+        self.model_ready_until = time.time() + self.model_ready_ttl
         return True
     
-    def generate_response(self, prompt: str, system_prompt: Optional[str] = None) -> Dict[str, Any]:
+    def warm_up(self) -> bool:
+        if not self.ensure_model_ready():
+            return False
+        
+        warmed = False
+        for backend in self.router.backends:
+            for model in self.models():
+                if backend.models is None or model not in backend.models:
+                    continue
+                try:
+                    backend.client.generate(model=model, prompt='', keep_alive=self.request_keep_alive)
+                    warmed = True
+                except Exception as e:
+                    self.logger.error(f"Model warm-up error ({backend.url}, {model}): {e}")
+        return warmed
+    
+    def unload(self) -> int:
+        unloaded = 0
+        for backend in self.router.backends:
+            try:
+                loaded = {model['name'] for model in backend.client.ps()['models']}
+            except Exception as e:
+                self.logger.error(f"Loaded model check error ({backend.url}): {e}")
+                continue
+            for model in self.models():
+                if model not in loaded:
+                    continue
+                try:
+                    backend.client.generate(model=model, prompt='', keep_alive=0)
+                    unloaded += 1
+                except Exception as e:
+                    self.logger.error(f"Model unload error ({backend.url}, {model}): {e}")
+        return unloaded
+    
+    def invalidate_model_ready(self):
+        self.model_ready_until = 0.0
+    
+    def consume_stream(self, chunks, on_chunk: Callable[[str], None],
+                       should_stop: Optional[Callable[[], bool]] = None):
+        parts = []
+        final_chunk = {}
+        
+        for chunk in chunks:
+            piece = chunk.get('message', {}).get('content', '')
+            if piece:
+                parts.append(piece)
+                on_chunk(piece)
+            if chunk.get('done'):
+                final_chunk = chunk
+            elif should_stop is not None and should_stop():
+                # Closing the stream drops the HTTP connection, which makes Ollama stop generating
+                chunks.close()
+                return ''.join(parts), None
+        
+        return ''.join(parts), final_chunk
+    
+    async def consume_stream_async(self, chunks, on_chunk: Callable[[str], None],
+                                   should_stop: Optional[Callable[[], bool]] = None):
+        parts = []
+        final_chunk = {}
+        
+        async for chunk in chunks:
+            piece = chunk.get('message', {}).get('content', '')
+            if piece:
+                parts.append(piece)
+                on_chunk(piece)
+            if chunk.get('done'):
+                final_chunk = chunk
+            elif should_stop is not None and should_stop():
+                await chunks.aclose()
+                return ''.join(parts), None
+        
+        return ''.join(parts), final_chunk
+    
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return sum(estimate_tokens(message['content']) for message in messages)
+    
+    def select_model(self, messages: List[Dict[str, str]]) -> str:
+        if self.large_model and self.prompt_tokens(messages) > self.large_model_tokens:
+            return self.large_model
+        return self.model
+    
+    def build_result(self, content: str, response: Dict[str, Any], model: str) -> Dict[str, Any]:
+        return {
+            'success': True,
+            'response': content,
+            'model': model,
+            'tokens': response.get('eval_count', 0),
+            'duration': response.get('total_duration', 0),
+            'eval_duration': response.get('eval_duration', 0),
+            'prompt_tokens': response.get('prompt_eval_count', 0),
+            'prompt_eval_duration': response.get('prompt_eval_duration', 0)
+        }
+    
+    def build_cancelled(self, content: str, model: str) -> Dict[str, Any]:
+        self.logger.info(f"AI response generation cancelled after {len(content)} characters")
+        return {
+            'success': False,
+            'cancelled': True,
+            'error': 'Cancelled',
+            'response': content,
+            'model': model
+        }
+    
+    def build_error(self, error: Exception) -> Dict[str, Any]:
+        self.logger.error(f"AI response generation error: {error}")
+        ERRORS.labels('ollama', type(error).__name__).inc()
+        if isinstance(error, ollama.ResponseError) and error.status_code == 404:
+            self.invalidate_model_ready()
+        return {
+            'success': False,
+            'error': str(error),
+            'response': "Sorry, I cannot respond at the moment. Please try again later."
+        }
+    
+    def generate_response(self, prompt: str, system_prompt: Optional[str] = None,
+                          on_chunk: Optional[Callable[[str], None]] = None,
+                          history: Optional[List[Dict[str, str]]] = None,
+                          should_stop: Optional[Callable[[], bool]] = None,
+                          options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         try:
-            messages = []
+            self.logger.info(f"Generating AI response for: {prompt[:50]}...")
             
-            if system_prompt:
-                messages.append({
-                    'role': 'system',
-                    'content': system_prompt
-                })
+            messages = build_messages(prompt, system_prompt, history)
+            model = self.select_model(messages)
+            streamed = []
             
-            messages.append({
-                'role': 'user',
-                'content': prompt
-            })
+            def forward(piece):
+                streamed.append(piece)
+                on_chunk(piece)
             
+            def request(backend):
+                response = backend.client.chat(model=model, messages=messages, stream=on_chunk is not None,
+                                               options=options, keep_alive=self.request_keep_alive)
+                if on_chunk is None:
+                    return response['message']['content'], response
+                return self.consume_stream(response, forward, should_stop)
+            
+            started = time.time()
+            content, response = self.router.call(model, request, can_retry=lambda: not streamed,
+                                                 affinity=prefix_key(messages))
+            if response is None:
+                return self.build_cancelled(content, model)
+            observe_generation(model, time.time() - started, response, self.prompt_tokens(messages))
+            return self.build_result(content, response, model)
+            
+        except Exception as e:
+            return self.build_error(e)
+    
+    async def generate_response_async(self, prompt: str, system_prompt: Optional[str] = None,
+                                      on_chunk: Optional[Callable[[str], None]] = None,
+                                      history: Optional[List[Dict[str, str]]] = None,
+                                      should_stop: Optional[Callable[[], bool]] = None,
+                                      options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        try:
             self.logger.info(f"Generating AI response for: {prompt[:50]}...")
             
-            response = self.client.chat(
-                model=self.model,
-                messages=messages,
-                stream=False
-            )
+            messages = build_messages(prompt, system_prompt, history)
+            model = self.select_model(messages)
+            streamed = []
             
-            return {
-                'success': True,
-                'response': response['message']['content'],
-                'model': self.model,
-                'tokens': response.get('eval_count', 0),
-                'duration': response.get('total_duration', 0)
-            }
+            def forward(piece):
+                streamed.append(piece)
+                on_chunk(piece)
+            
+            async def request(backend):
+                response = await backend.get_async_client().chat(model=model, messages=messages,
+                                                                 stream=on_chunk is not None, options=options,
+                                                                 keep_alive=self.request_keep_alive)
+                if on_chunk is None:
+                    return response['message']['content'], response
+                return await self.consume_stream_async(response, forward, should_stop)
+            
+            started = time.time()
+            content, response = await self.router.call_async(model, request, can_retry=lambda: not streamed,
+                                                             affinity=prefix_key(messages))
+            if response is None:
+                return self.build_cancelled(content, model)
+            observe_generation(model, time.time() - started, response, self.prompt_tokens(messages))
+            return self.build_result(content, response, model)
             
         except Exception as e:
-            self.logger.error(f"AI response generation error: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'response': "Sorry, I cannot respond at the moment. Please try again later."
-            }
+            return self.build_error(e)
+    
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        def request(backend):
+            return [backend.client.embeddings(model=self.embed_model, prompt=text)['embedding'] for text in texts]
+        
+        return self.router.call(self.embed_model, request)
+    
+    def summarize_conversation(self, previous_summary: Optional[str], messages: List[Dict[str, str]]) -> Optional[str]:
+        try:
+            transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+            if previous_summary:
+                transcript = f"Earlier summary: {previous_summary}\n{transcript}"
+            
+            messages = [
+                {
+                    'role': 'system',
+                    'content': "Summarize the conversation below in a few sentences, keeping facts the user may refer to later."
+                },
+                {
+                    'role': 'user',
+                    'content': transcript
+                }
+            ]
+            response = self.router.call(
+                self.model,
+                lambda backend: backend.client.chat(model=self.model, messages=messages, stream=False,
+                                                    keep_alive=self.request_keep_alive)
+            )
+            return response['message']['content']
+        except Exception as e:
+            self.logger.error(f"Conversation summary error: {e}")
+            return None
     
     def get_model_info(self) -> Dict[str, Any]:
+        if self.model_info_cache and time.time() < self.model_info_until:
+            return self.model_info_cache
+        
         try:
-            info = self.client.show(self.model)
+            info = self.router.call(self.model, lambda backend: backend.client.show(self.model))
             
             def estimate_size(parameters_str):
                 try:
@@ -105,16 +332,30 @@ class OllamaService:
             parameters = info.get('details', {}).get('parameter_size', 'Unknown')
             estimated_size = estimate_size(parameters) if parameters != 'Unknown' else 'Unknown'
             
-            return {
+            self.model_info_cache = {
                 'success': True,
                 'model': self.model,
                 'size': estimated_size,
                 'parameters': parameters,
                 'family': info.get('details', {}).get('family', 'Unknown')
             }
+            self.model_info_until = time.time() + self.model_info_ttl
+            return self.model_info_cache
         except Exception as e:
             self.logger.error(f"Model information retrieval error: {e}")
             return {
                 'success': False,
                 'error': str(e)
-            }
\ No newline at end of file
+            }
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_ollama_service() -> OllamaService:
+    global _service
+    
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = OllamaService()
+    return _service
@@ -0,0 +1,728 @@
+import io
+import sys
+import time
+import json
+import asyncio
+import logging
+import redis.asyncio as aioredis
+from termcolor import colored
+from telebot.async_telebot import AsyncTeleBot
+from decouple import config
+from task_queue import (
+    redis_host,
+    redis_port,
+    redis_password,
+    redis_db,
+    enqueue_ai_request,
+    get_jobs_status,
+    get_queue_stats,
+    cancel_ai_request,
+    clear_finished_jobs,
+    reset_conversation,
+    task_queues,
+    fair_scheduler,
+    generation_budget,
+    JOB_EVENTS_CHANNEL,
+    DEFAULT_SYSTEM_PROMPT
+)
+from response_cache import ResponseCache, make_cache_key
+from faq_index import FaqIndex
+from job_state import AsyncPendingJobStore
+from delivery_journal import AsyncDeliveryJournal
+from rate_limit import AsyncRateLimiter, AsyncAdmissionController
+from conversation import AsyncConversationStore
+from outbox import AsyncOutbox, FollowUp, retry_after, is_bad_request, is_not_modified
+from splitter import MessageSplitter, split_message, render_html
+from metrics import (
+    ENQUEUE_LATENCY,
+    END_TO_END_LATENCY,
+    REJECTED_REQUESTS,
+    ERRORS,
+    QueueCollector,
+    start_metrics_server,
+    instrument_telebot
+)
+from bot import (
+    WELCOME_TEXT,
+    HELP_TEXT,
+    format_stats_text,
+    format_model_info_text,
+    rate_limited_text,
+    overloaded_text,
+    thinking_text
+)
+
+class AsyncTelegramBot:
+    def __init__(self):
+        self.API_TOKEN = config("API_TOKEN", cast=str)
+        self.bot = AsyncTeleBot(self.API_TOKEN)
+        self.redis = aioredis.Redis(
+            host=redis_host,
+            port=redis_port,
+            password=redis_password,
+            db=redis_db
+        )
+
+        # Hot-path state lives on the async client; only RQ calls go through worker threads
+        self.pending_jobs = AsyncPendingJobStore(self.redis)
+        self.delivery_journal = AsyncDeliveryJournal(self.redis, self.pending_jobs.consumer)
+        self.rate_limiter = AsyncRateLimiter(self.redis)
+        self.admission_controller = AsyncAdmissionController(self.redis, task_queues, fair_scheduler)
+        self.conversation_store = AsyncConversationStore(self.redis)
+        self.active_jobs = {}
+        self.job_owners = {}
+        self.early_events = {}
+        self.local_deliveries = {}
+        self.job_sweep_interval = config("JOB_SWEEP_INTERVAL", default=30, cast=int)
+        self.delivery_grace = config("DELIVERY_GRACE", default=3, cast=float)
+        self.supersede_pending = config("SUPERSEDE_PENDING", default=False, cast=bool)
+        self.response_cache = ResponseCache()
+        self.model_name = config("OLLAMA_MODEL")
+        self.faq_index = FaqIndex(f"{self.model_name}\x00{DEFAULT_SYSTEM_PROMPT}")
+        self.stream_edit_interval = config("STREAM_EDIT_INTERVAL", default=1.5, cast=float)
+        self.stream_max_edits_per_second = config("STREAM_MAX_EDITS_PER_SECOND", default=20, cast=int)
+        self.parse_mode = 'HTML' if config("ANSWER_HTML", default=False, cast=bool) else None
+        self.document_after = config("DOCUMENT_AFTER_MESSAGES", default=3, cast=int)
+        self.background_tasks = set()
+        self.outbox = AsyncOutbox()
+        self.edit_in_place = config("EDIT_IN_PLACE", default=True, cast=bool)
+
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler('logs/bot.log'),
+                logging.StreamHandler(sys.stdout)
+            ]
+        )
+        self.logger = logging.getLogger(__name__)
+
+        self.register_handlers()
+
+    def register_handlers(self):
+        @self.bot.message_handler(commands=['start'])
+        async def send_welcome(message):
+            await self.bot.reply_to(message, WELCOME_TEXT, parse_mode='Markdown')
+
+        @self.bot.message_handler(commands=['help'])
+        async def send_help(message):
+            await self.bot.reply_to(message, HELP_TEXT, parse_mode='Markdown')
+
+        @self.bot.message_handler(commands=['stats'])
+        async def send_stats(message):
+            try:
+                stats = await asyncio.to_thread(get_queue_stats)
+                stats_text = format_stats_text(stats, self.response_cache.stats(), await self.pending_jobs.count(),
+                                               self.faq_index.stats())
+                await self.bot.reply_to(message, stats_text, parse_mode='Markdown')
+            except Exception as e:
+                await self.bot.reply_to(message, f"Error getting statistics: {str(e)}")
+
+        @self.bot.message_handler(commands=['model'])
+        async def send_model_info(message):
+            try:
+                from ai_service import get_ollama_service
+                model_info = await asyncio.to_thread(get_ollama_service().get_model_info)
+                await self.bot.reply_to(message, format_model_info_text(model_info), parse_mode='Markdown')
+            except Exception as e:
+                await self.bot.reply_to(message, f"Error getting model information: {str(e)}")
+
+        @self.bot.message_handler(commands=['clear'])
+        async def clear_jobs(message):
+            try:
+                await asyncio.to_thread(clear_finished_jobs)
+                await self.bot.reply_to(message, "✅ Completed jobs cleared!")
+            except Exception as e:
+                await self.bot.reply_to(message, f"❌ Job clearing error: {str(e)}")
+
+        @self.bot.message_handler(commands=['reset'])
+        async def reset_history(message):
+            try:
+                await asyncio.to_thread(reset_conversation, message.chat.id)
+                await self.bot.reply_to(message, "🧹 Conversation history cleared!")
+            except Exception as e:
+                await self.bot.reply_to(message, f"❌ Conversation reset error: {str(e)}")
+
+        @self.bot.message_handler(commands=['cancel'])
+        async def cancel_request(message):
+            try:
+                if not await self.cancel_user_job(message.from_user.id, "🛑 Your question was cancelled."):
+                    await self.bot.reply_to(message, "ℹ️ You have no pending question to cancel.")
+            except Exception as e:
+                await self.bot.reply_to(message, f"❌ Cancel error: {str(e)}")
+
+        @self.bot.message_handler(func=lambda message: True)
+        async def handle_message(message):
+            user_id = message.from_user.id
+            message_text = message.text
+            received_at = time.time()
+
+            try:
+                wait_seconds = await self.rate_limiter.acquire(user_id, message.chat.id)
+                if wait_seconds:
+                    REJECTED_REQUESTS.labels('rate_limited').inc()
+                    await self.bot.reply_to(message, rate_limited_text(wait_seconds))
+                    return
+
+                if not await self.acquire_user(user_id):
+                    REJECTED_REQUESTS.labels('busy').inc()
+                    await self.rate_limiter.refund(user_id, message.chat.id)
+                    await self.bot.reply_to(
+                        message,
+                        "⏳ Your previous question is still being processed. Please wait..."
+                    )
+                    return
+            except Exception as e:
+                self.logger.error(f"Message processing error: {e}")
+                await self.bot.reply_to(message, "❌ An error occurred. Please try again.")
+                return
+
+            try:
+                cache_key = await self.get_cache_key(message)
+                faq_vector = None
+                if cache_key:
+                    source = 'cache'
+                    cached_response = self.response_cache.get(cache_key)
+                    if cached_response is None and self.faq_index.enabled:
+                        source = 'faq'
+                        cached_response, faq_vector = await asyncio.to_thread(self.faq_index.lookup, message_text)
+                        if cached_response is not None:
+                            self.response_cache.put(cache_key, cached_response)
+                    if cached_response is not None:
+                        await self.send_cached_response(message, cached_response)
+                        await self.pending_jobs.release_user(user_id)
+                        END_TO_END_LATENCY.labels(source).observe(time.time() - received_at)
+                        return
+
+                admission = await self.admission_controller.check()
+                if not admission['admitted']:
+                    self.logger.warning(f"Request rejected for user {user_id}: queue {admission['queue_length']}, estimated wait {admission['estimated_wait']:.0f}s")
+                    await self.pending_jobs.release_user(user_id)
+                    REJECTED_REQUESTS.labels('overloaded').inc()
+                    await self.bot.reply_to(message, overloaded_text(admission))
+                    return
+
+                budget = generation_budget.plan(admission, message_text, await self.redis.hgetall(generation_budget.stats_key))
+                processing_msg = await self.bot.reply_to(message, thinking_text(admission, budget))
+
+                start_time = time.time()
+                job_id = await asyncio.to_thread(
+                    enqueue_ai_request,
+                    user_id,
+                    message_text,
+                    chat_id=message.chat.id,
+                    coalesce_key=cache_key,
+                    budget=budget
+                )
+                ENQUEUE_LATENCY.observe(time.time() - start_time)
+
+                await self.track_job(user_id, {
+                    'job_id': job_id,
+                    'user_id': user_id,
+                    'message_text': message_text,
+                    'message_id': message.message_id,
+                    'processing_msg_id': processing_msg.message_id,
+                    'chat_id': message.chat.id,
+                    'start_time': start_time,
+                    'deadline': start_time + budget['expires_in'],
+                    'received_at': received_at,
+                    'cache_key': cache_key,
+                    'faq_vector': faq_vector
+                })
+
+                self.logger.info(f"AI request enqueued for user {user_id}: {job_id}")
+
+            except Exception as e:
+                self.logger.error(f"Message processing error: {e}")
+                await self.pending_jobs.release_user(user_id)
+                await self.bot.reply_to(
+                    message,
+                    "❌ An error occurred. Please try again."
+                )
+
+    async def acquire_user(self, user_id):
+        # The Redis reservation is taken before any other await, so a second message from the same
+        # user in the same update batch, or on another replica, sees the user as busy
+        if await self.pending_jobs.acquire_user(user_id):
+            return True
+        return (
+            self.supersede_pending
+            and await self.cancel_user_job(user_id, "↪️ Replaced by your newer question.")
+            and await self.pending_jobs.acquire_user(user_id)
+        )
+
+    async def cancel_user_job(self, user_id, notice):
+        job_id = await self.pending_jobs.active_job(user_id)
+        if job_id is None:
+            return False
+
+        job_info = await self.pending_jobs.claim_user(job_id, user_id)
+        if job_info is None:
+            return False
+
+        job_info = self.forget_local_job(job_id, user_id) or job_info
+        self.spawn(self.cancel_job(job_id))
+        self.replace_processing_message(job_info, notice)
+
+        self.logger.info(f"Job {job_id} cancelled for user {user_id}")
+        return True
+
+    async def cancel_job(self, job_id):
+        try:
+            if await self.pending_jobs.waiters(job_id):
+                return
+            outcome = await asyncio.to_thread(cancel_ai_request, job_id)
+            self.logger.info(f"Cancel requested for job {job_id}: {outcome}")
+        except Exception as e:
+            self.logger.error(f"Job cancel error for {job_id}: {e}")
+
+    async def get_cache_key(self, message):
+        if await self.conversation_store.has_history(message.chat.id):
+            return None
+        return make_cache_key(message.text, DEFAULT_SYSTEM_PROMPT, self.model_name)
+
+    async def send_cached_response(self, message, response_text):
+        chat_id = message.chat.id
+
+        chunks = split_message(response_text) or [response_text]
+        sent = self.outbox.submit(chat_id, self.bot.send_message, chat_id, self.format_answer(chunks[0]),
+                                  parse_mode=self.parse_mode)
+        self.send_remaining_chunks(chat_id, chunks, response_text, sent)
+
+        try:
+            await self.conversation_store.append_exchange(chat_id, message.text, response_text)
+        except Exception as e:
+            self.logger.error(f"Conversation update error for cached response: {e}")
+
+        self.logger.info(f"Cached AI response sent for user {message.from_user.id}")
+
+    def spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    async def track_job(self, user_id, job_info):
+        job_id = job_info['job_id']
+        await self.pending_jobs.track(user_id, job_info)
+        self.active_jobs[user_id] = job_info
+        self.job_owners.setdefault(job_id, set()).add(user_id)
+
+        early_event = self.early_events.get(job_id)
+        if early_event:
+            self.dispatch_job_event(early_event)
+
+    def forget_local_job(self, job_id, user_id):
+        owners = self.job_owners.get(job_id, set())
+        owners.discard(user_id)
+        if not owners:
+            self.job_owners.pop(job_id, None)
+
+        job_info = self.active_jobs.get(user_id)
+        if job_info is not None and job_info.get('job_id') == job_id:
+            return self.active_jobs.pop(user_id)
+        return None
+
+    def dispatch_job_event(self, event):
+        job_id = event.get('job_id')
+
+        if event['status'] == 'streaming':
+            self.apply_stream_event(event)
+            return
+
+        if event['status'] not in ('finished', 'failed'):
+            return
+
+        if job_id not in self.job_owners:
+            self.early_events[job_id] = event
+            return
+
+        self.spawn(self.deliver_job(job_id, event))
+
+    async def deliver_job(self, job_id, event):
+        for user_id, job_info in await self.pending_jobs.claim_job(job_id):
+            await self.deliver_user(job_id, user_id, job_info, event)
+
+    async def deliver_user(self, job_id, user_id, job_info, event):
+        job_info = self.forget_local_job(job_id, user_id) or job_info
+        self.local_deliveries[job_id] = self.local_deliveries.get(job_id, 0) + 1
+
+        if event['status'] == 'finished' and 'result' in event:
+            sent = await self.handle_job_completion(user_id, job_info, event['result'])
+        else:
+            sent = await self.handle_job_failure(user_id, job_info, event.get('error', 'Unknown error'))
+
+        # The claim is settled once the last message went out, so a crash before that replays the delivery
+        delivery_id = event.get('delivery_id')
+        if sent is None:
+            await self.settle_delivery(job_id, user_id, delivery_id)
+        else:
+            sent.add_done_callback(lambda sent: self.spawn(self.settle_delivery(job_id, user_id, delivery_id, sent)))
+
+        self.logger.info(
+            f"Job {job_id} delivered to user {user_id} in {time.time() - job_info['start_time']:.2f}s "
+            f"({time.time() - event.get('published_at', time.time()):.3f}s after completion)"
+        )
+
+    async def settle_delivery(self, job_id, user_id, delivery_id, sent=None):
+        self.local_deliveries[job_id] -= 1
+        if not self.local_deliveries[job_id]:
+            del self.local_deliveries[job_id]
+
+        if sent is not None and (sent.cancelled() or sent.exception() is not None):
+            # The claim and journal entry stay in place, so the lease takeover retries the delivery
+            self.logger.warning(f"Delivery of job {job_id} to user {user_id} failed, leaving it for a retry")
+            return
+
+        try:
+            if not await self.pending_jobs.settle(job_id, user_id) and delivery_id:
+                await self.delivery_journal.ack([delivery_id])
+        except Exception as e:
+            self.logger.error(f"Delivery settle error for job {job_id}: {e}")
+
+    async def resolve_deliveries(self, entries):
+        # Journal entries inside the grace period are left to the pub/sub path and returned for a later pass
+        now = time.time()
+        waiting, stale, events = [], [], {}
+        for entry_id, event in entries:
+            if event is None:
+                stale.append(entry_id)
+            elif now - event['published_at'] < self.delivery_grace:
+                waiting.append((entry_id, event))
+            elif event['job_id'] not in self.local_deliveries:
+                events[event['job_id']] = event
+
+        recovered = await self.pending_jobs.recover(list(events))
+        for job_id, (claims, delivering) in recovered.items():
+            if not claims and not delivering:
+                # Nobody is waiting for this answer any more, or it already went out
+                stale.append(events[job_id]['delivery_id'])
+            for user_id, job_info in claims:
+                await self.deliver_user(job_id, user_id, job_info, events[job_id])
+
+        await self.delivery_journal.ack(stale)
+        return waiting
+
+    async def replay_deliveries(self):
+        # Walks this consumer's unacknowledged entries, including those left behind by a previous run
+        waiting = []
+        after = '0'
+        while True:
+            entries = await self.delivery_journal.pending(after)
+            if not entries:
+                return waiting
+            after = entries[-1][0]
+            waiting.extend(await self.resolve_deliveries(entries))
+
+    def apply_stream_event(self, event):
+        for user_id in self.job_owners.get(event['job_id'], ()):
+            job_info = self.active_jobs.get(user_id)
+            if job_info is None or job_info.get('stream_broken'):
+                continue
+
+            if 'stream' not in job_info:
+                job_info['stream'] = MessageSplitter(max_chunks=self.document_after)
+            if event['offset'] != job_info['stream'].length:
+                job_info['stream_broken'] = True
+                continue
+
+            job_info['stream'].feed(event['text'])
+
+    async def render_stream(self, job_info, chunks, final=False):
+        if job_info.get('stream_final'):
+            return
+
+        chat_id = job_info['chat_id']
+        message_ids = job_info.setdefault('stream_message_ids', [job_info['processing_msg_id']])
+        shown = job_info.setdefault('stream_segments', {})
+
+        called = False
+        for index, chunk, sealed in chunks:
+            text = self.format_answer(chunk).strip()
+            if shown.get(index) is True:
+                continue
+
+            if shown.get(index) != text:
+                if called:
+                    # The outbox paces every request, so the remaining segments go out on its next turns
+                    return FollowUp(self.render_stream, job_info, chunks, final)
+                called = True
+                if index < len(message_ids):
+                    await self.edit_stream_message(text, chat_id, message_ids[index])
+                else:
+                    sent = await self.bot.send_message(chat_id, text, parse_mode=self.parse_mode)
+                    message_ids.append(sent.message_id)
+                    await self.pending_jobs.update(job_info['user_id'], job_info)
+
+            shown[index] = True if sealed else text
+            if sealed and 'stream' in job_info:
+                job_info['stream'].delivered(index)
+
+        job_info['stream_final'] = final
+
+        if 'first_edit_time' not in job_info:
+            job_info['first_edit_time'] = time.time()
+            self.logger.info(
+                f"First tokens shown for job {job_info['job_id']} "
+                f"after {job_info['first_edit_time'] - job_info['start_time']:.2f}s"
+            )
+
+    async def edit_stream_message(self, text, chat_id, message_id):
+        try:
+            await self.bot.edit_message_text(text, chat_id, message_id, parse_mode=self.parse_mode)
+        except Exception as e:
+            if not is_not_modified(e):
+                raise
+
+    async def flush_streams(self):
+        now = time.time()
+        edit_budget = max(1, int(self.stream_max_edits_per_second * self.stream_edit_interval))
+
+        dirty_jobs = sorted((
+            job_info for job_info in self.active_jobs.values()
+            if 'stream' in job_info and job_info['stream'].total()
+            and job_info.get('stream_rendered') != job_info['stream'].length
+            and now - job_info.get('stream_edited_at', 0) >= self.stream_edit_interval
+            and not job_info.get('stream_queued')
+        ), key=lambda job_info: job_info.get('stream_edited_at', 0))
+
+        for job_info in dirty_jobs[:edit_budget]:
+            job_info['stream_queued'] = True
+            future = self.outbox.submit(job_info['chat_id'], self.render_stream, job_info, job_info['stream'].chunks())
+            future.add_done_callback(lambda _, job_info=job_info: job_info.pop('stream_queued', None))
+            job_info['stream_rendered'] = job_info['stream'].length
+            job_info['stream_edited_at'] = time.time()
+
+    async def reconcile_active_jobs(self):
+        job_ids = await self.pending_jobs.pending_job_ids()
+        statuses = await asyncio.to_thread(get_jobs_status, job_ids)
+        for job_id, status in statuses.items():
+            if status['status'] in ('finished', 'failed'):
+                self.spawn(self.deliver_job(job_id, status))
+
+    async def listen_job_events(self):
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(JOB_EVENTS_CHANNEL)
+                await self.reconcile_active_jobs()
+
+                async for message in pubsub.listen():
+                    try:
+                        self.dispatch_job_event(json.loads(message['data']))
+                    except Exception as e:
+                        self.logger.error(f"Job event handling error: {e}")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Job event listener error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.aclose()
+
+    async def sweep_jobs(self):
+        while True:
+            await asyncio.sleep(self.job_sweep_interval)
+
+            try:
+                await self.reconcile_active_jobs()
+                now = time.time()
+
+                for job_id, event in list(self.early_events.items()):
+                    if now - event.get('published_at', now) > self.job_sweep_interval:
+                        del self.early_events[job_id]
+
+                for job_id, user_id in await self.pending_jobs.expired():
+                    job_info = await self.pending_jobs.claim_user(job_id, user_id)
+                    if job_info is not None:
+                        job_info = self.forget_local_job(job_id, user_id) or job_info
+                        self.spawn(self.cancel_job(job_id))
+                        self.spawn(self.handle_job_timeout(user_id, job_info))
+
+            except Exception as e:
+                self.logger.error(f"Job sweep error: {e}")
+
+    async def journal_deliveries(self):
+        while True:
+            try:
+                await self.delivery_journal.ensure_group()
+                waiting, replayed_at = [], 0.0
+                while True:
+                    if time.time() - replayed_at >= self.delivery_journal.claim_idle:
+                        await self.delivery_journal.claim_stale()
+                        waiting = await self.replay_deliveries()
+                        replayed_at = time.time()
+
+                    entries = await self.delivery_journal.read(int(self.delivery_grace * 1000))
+                    waiting = await self.resolve_deliveries(waiting + entries)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Delivery journal error: {e}")
+                await asyncio.sleep(5)
+
+    async def stream_jobs(self):
+        while True:
+            await asyncio.sleep(self.stream_edit_interval)
+
+            try:
+                await self.flush_streams()
+            except Exception as e:
+                self.logger.error(f"Stream flush error: {e}")
+
+    async def handle_job_completion(self, user_id, job_info, result):
+        try:
+            chat_id = job_info['chat_id']
+
+            if result['success'] and job_info.get('cache_key'):
+                self.response_cache.put(job_info['cache_key'], result['response'])
+                if job_info.get('faq_vector') is not None:
+                    await asyncio.to_thread(
+                        self.faq_index.add, job_info['message_text'], result['response'], job_info['faq_vector']
+                    )
+
+            if result['success'] and result.get('user_id') != user_id:
+                try:
+                    await self.conversation_store.append_exchange(chat_id, job_info['message_text'], result['response'])
+                except Exception as e:
+                    self.logger.error(f"Conversation update error for coalesced response: {e}")
+
+            if not result['success'] or not result['response'].strip():
+                error_response = result.get('response', '').strip() or 'An error occurred.'
+                return self.replace_processing_message(job_info, f"❌ {error_response}")
+
+            if 'stream_message_ids' in job_info or 'stream_rendered' in job_info:
+                sent = self.finish_stream(job_info, result['response'])
+            else:
+                sent = self.send_answer(job_info, result['response'])
+
+            sent.add_done_callback(lambda _: self.observe_delivery(user_id, job_info, result))
+            self.logger.info(f"AI response queued for user {user_id}")
+            return sent
+
+        except Exception as e:
+            self.logger.error(f"Job completion handling error: {e}")
+
+    def format_answer(self, text):
+        return render_html(text) if self.parse_mode == 'HTML' else text
+
+    def finish_stream(self, job_info, response_text):
+        splitter = job_info.setdefault('stream', MessageSplitter(max_chunks=self.document_after))
+        splitter.feed(response_text[splitter.length:])
+
+        chat_id = job_info['chat_id']
+        sent = self.outbox.submit(chat_id, self.render_stream, job_info, splitter.chunks(), True)
+        if self.document_after and splitter.total() > self.document_after:
+            sent = self.outbox.submit(chat_id, self.upload_answer, chat_id, response_text)
+        return sent
+
+    async def upload_answer(self, chat_id, text):
+        return await self.bot.send_document(chat_id, io.BytesIO(text.encode()), visible_file_name='answer.md',
+                                            caption="📎 The full answer is attached.")
+
+    async def edit_or_send(self, chat_id, message_id, text, parse_mode=None):
+        try:
+            return await self.bot.edit_message_text(text, chat_id, message_id, parse_mode=parse_mode)
+        except Exception as e:
+            if is_not_modified(e):
+                return None
+            if not is_bad_request(e):
+                raise
+            return FollowUp(self.bot.send_message, chat_id, text, parse_mode=parse_mode)
+
+    async def delete_quietly(self, chat_id, message_id):
+        try:
+            await self.bot.delete_message(chat_id, message_id)
+        except Exception as e:
+            if retry_after(e) is not None:
+                raise
+
+    def replace_processing_message(self, job_info, text, parse_mode=None):
+        chat_id = job_info['chat_id']
+        if self.edit_in_place:
+            return self.outbox.submit(chat_id, self.edit_or_send, chat_id, job_info['processing_msg_id'], text, parse_mode)
+
+        self.outbox.submit(chat_id, self.delete_quietly, chat_id, job_info['processing_msg_id'])
+        return self.outbox.submit(chat_id, self.bot.send_message, chat_id, text, parse_mode=parse_mode)
+
+    def send_answer(self, job_info, text):
+        chunks = split_message(text) or [text]
+        sent = self.replace_processing_message(job_info, self.format_answer(chunks[0]), self.parse_mode)
+        return self.send_remaining_chunks(job_info['chat_id'], chunks, text, sent)
+
+    def send_remaining_chunks(self, chat_id, chunks, text, sent):
+        if self.document_after and len(chunks) > self.document_after:
+            return self.outbox.submit(chat_id, self.upload_answer, chat_id, text)
+
+        for chunk in chunks[1:]:
+            sent = self.outbox.submit(chat_id, self.bot.send_message, chat_id, self.format_answer(chunk),
+                                      parse_mode=self.parse_mode)
+        return sent
+
+    def observe_delivery(self, user_id, job_info, result):
+        source = 'coalesced' if result.get('user_id') != user_id else 'generated'
+        END_TO_END_LATENCY.labels(source).observe(time.time() - job_info.get('received_at', job_info['start_time']))
+
+    async def handle_job_failure(self, user_id, job_info, error_msg):
+        ERRORS.labels('job', 'failed').inc()
+        try:
+            self.logger.error(f"Job failed for user {user_id}: {error_msg}")
+            return self.replace_processing_message(job_info, "❌ Your request failed. Please try again.")
+
+        except Exception as e:
+            self.logger.error(f"Job failure handling error: {e}")
+
+    async def handle_job_timeout(self, user_id, job_info):
+        ERRORS.labels('job', 'timeout').inc()
+        try:
+            self.replace_processing_message(job_info, "⏰ Your request timed out. Please try again.")
+            self.logger.warning(f"Job timed out for user {user_id}")
+
+        except Exception as e:
+            self.logger.error(f"Job timeout handling error: {e}")
+
+    async def main(self):
+        self.spawn(self.listen_job_events())
+        self.spawn(self.sweep_jobs())
+        self.spawn(self.stream_jobs())
+        self.spawn(self.journal_deliveries())
+
+        try:
+            await self.bot.polling(non_stop=True, interval=0, timeout=20)
+        finally:
+            for task in list(self.background_tasks):
+                task.cancel()
+            await self.bot.close_session()
+            await self.redis.aclose()
+
+    def run(self):
+        try:
+            print(colored("[+] Starting async bot...", "blue"))
+
+            instrument_telebot()
+            start_metrics_server(config("BOT_METRICS_PORT", default=9100, cast=int), [QueueCollector(get_queue_stats)])
+
+            try:
+                from ai_service import get_ollama_service
+                if not get_ollama_service().ensure_model_ready():
+                    print(colored("[-] AI model not ready, but bot is starting...", "yellow"))
+                else:
+                    print(colored("[+] AI model ready", "green"))
+            except Exception as e:
+                print(colored(f"[-] AI service check failed, but bot is starting: {e}", "yellow"))
+
+            print(colored("[+] Async bot started and running...", "green"))
+
+            asyncio.run(self.main())
+
+        except KeyboardInterrupt:
+            print(colored("\n[-] Bot stopped", "yellow"))
+        except Exception as e:
+            self.logger.error(f"Bot error: {e}")
+            print(colored(f"[-] Bot error: {e}", "red"))
+
+if __name__ == "__main__":
+    bot_instance = AsyncTelegramBot()
+    bot_instance.run()
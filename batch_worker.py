@@ -0,0 +1,192 @@
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import logging
+import traceback
+import redis.asyncio as aioredis
+from rq.job import JobStatus
+from rq.exceptions import NoSuchJobError
+from rq.utils import utcnow
+from decouple import config
+from termcolor import colored
+from task_queue import (
+    redis_host,
+    redis_port,
+    redis_password,
+    redis_db,
+    redis_client,
+    task_queues,
+    queues_by_name,
+    fair_scheduler,
+    admission_controller,
+    process_ai_request_async,
+    prune_registries,
+    RESULT_TTL,
+    REGISTRY_PRUNE_INTERVAL
+)
+from compact_job import CompactJob, CompactSerializer
+
+class BatchWorker:
+    def __init__(self):
+        self.batch_size = config("BATCH_SIZE", default=8, cast=int)
+        self.batch_window = config("BATCH_WINDOW", default=0.05, cast=float)
+        self.heartbeat_interval = 10
+        self.name = f"batch-{socket.gethostname()}-{os.getpid()}"
+        self.queue_keys = [queue.key for queue in task_queues]
+        self.active = set()
+        self.running = True
+        self.logger = logging.getLogger(__name__)
+        self.redis = aioredis.Redis(
+            host=redis_host,
+            port=redis_port,
+            password=redis_password,
+            db=redis_db
+        )
+
+    async def pop_next(self):
+        for key in self.queue_keys:
+            job_id = await self.redis.lpop(key)
+            if job_id:
+                return job_id.decode()
+        return None
+
+    async def collect(self, count):
+        popped = await self.redis.blpop(self.queue_keys, timeout=1)
+        if not popped:
+            return []
+
+        job_ids = [popped[1].decode()]
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while len(job_ids) < count and asyncio.get_running_loop().time() < deadline:
+            job_id = await self.pop_next()
+            if job_id:
+                job_ids.append(job_id)
+            else:
+                await asyncio.sleep(0.005)
+        return job_ids
+
+    def start_job(self, job_id):
+        try:
+            job = CompactJob.fetch(job_id, connection=redis_client, serializer=CompactSerializer)
+        except NoSuchJobError:
+            self.logger.warning(f"Skipping missing job {job_id}")
+            for queue in task_queues:
+                fair_scheduler.dispatch(queue)
+            return None
+
+        with redis_client.pipeline() as pipe:
+            job.heartbeat(utcnow(), job.timeout + 60, pipeline=pipe)
+            job.prepare_for_execution(self.name, pipeline=pipe)
+            pipe.execute()
+        return job
+
+    def finish_job(self, job, result):
+        queue = queues_by_name[job.origin]
+        job.ended_at = utcnow()
+        job._result = result
+
+        try:
+            if job.success_callback:
+                job.success_callback(job, redis_client, result)
+        except Exception:
+            self.fail_job(job, sys.exc_info())
+            return
+
+        with redis_client.pipeline() as pipe:
+            result_ttl = job.get_result_ttl(RESULT_TTL)
+            job._handle_success(result_ttl, pipeline=pipe)
+            job.cleanup(result_ttl, pipeline=pipe, remove_from_queue=False)
+            queue.started_job_registry.remove(job, pipeline=pipe)
+            pipe.execute()
+
+    def fail_job(self, job, exc_info):
+        queue = queues_by_name[job.origin]
+        job.ended_at = utcnow()
+        exc_string = ''.join(traceback.format_exception(*exc_info))
+
+        try:
+            if job.failure_callback:
+                job.failure_callback(job, redis_client, *exc_info)
+        except Exception as e:
+            self.logger.error(f"Failure callback error - Job ID: {job.id}, Error: {e}")
+
+        with redis_client.pipeline() as pipe:
+            job.set_status(JobStatus.FAILED, pipeline=pipe)
+            queue.started_job_registry.remove(job, pipeline=pipe)
+            job._handle_failure(exc_string, pipeline=pipe)
+            pipe.execute()
+
+    async def run_job(self, job_id):
+        job = await asyncio.to_thread(self.start_job, job_id)
+        if job is None:
+            return
+
+        try:
+            result = await asyncio.wait_for(process_ai_request_async(job, self.redis), timeout=job.timeout)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.fail_job, job, sys.exc_info())
+            raise
+        except Exception:
+            self.logger.error(f"Job failed - Job ID: {job.id}")
+            await asyncio.to_thread(self.fail_job, job, sys.exc_info())
+        else:
+            await asyncio.to_thread(self.finish_job, job, result)
+
+    def spawn(self, job_id):
+        task = asyncio.create_task(self.run_job(job_id))
+        self.active.add(task)
+        task.add_done_callback(self.active.discard)
+
+    async def heartbeat(self):
+        last_pruned = 0.0
+        while self.running:
+            try:
+                await asyncio.to_thread(
+                    admission_controller.register_slots, self.name, self.batch_size, self.heartbeat_interval * 3
+                )
+                if time.time() - last_pruned >= REGISTRY_PRUNE_INTERVAL:
+                    await asyncio.to_thread(prune_registries)
+                    last_pruned = time.time()
+            except Exception as e:
+                self.logger.error(f"Heartbeat error: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def stop(self):
+        # Like RQ's warm shutdown: the first signal drains the running jobs, a second one abandons them
+        if not self.running:
+            for task in self.active:
+                task.cancel()
+            return
+        print(colored(f"[-] Stopping batch worker, waiting for {len(self.active)} running job(s)...", "yellow"))
+        self.running = False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.stop)
+
+        for queue in task_queues:
+            await asyncio.to_thread(fair_scheduler.dispatch, queue)
+
+        heartbeat = asyncio.create_task(self.heartbeat())
+        print(colored(f"[+] Batch worker started - Queues: {', '.join(queue.name for queue in task_queues)}, batch size: {self.batch_size}", "green"))
+
+        try:
+            while self.running:
+                free = self.batch_size - len(self.active)
+                if free <= 0:
+                    await asyncio.wait(self.active, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                for job_id in await self.collect(free):
+                    self.spawn(job_id)
+        finally:
+            self.running = False
+            heartbeat.cancel()
+            if self.active:
+                await asyncio.wait(self.active)
+            await asyncio.to_thread(admission_controller.unregister_slots, self.name, self.batch_size)
+            await self.redis.aclose()
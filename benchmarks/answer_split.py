@@ -0,0 +1,93 @@
+import sys
+import os
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+from splitter import MessageSplitter, MESSAGE_LIMIT, FENCE_LINE, utf16_length
+
+WORDS = "model kuyruk cevap soru bellek önbellek sohbet işlem zaman sunucu istek yanıt 🚀 👍🏽 ğüşıöç".split()
+
+def paragraph(rng):
+    sentences = []
+    for _ in range(rng.randint(2, 6)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+        sentences.append(' '.join(words).capitalize() + rng.choice('.!?'))
+    return ' '.join(sentences)
+
+def code_block(rng):
+    lines = [f"    value_{i} = compute({rng.randint(0, 999)})  # {rng.choice(WORDS)}" for i in range(rng.randint(5, 60))]
+    return "```python\ndef handler():\n" + '\n'.join(lines) + "\n```"
+
+def answer(rng, length):
+    parts = []
+    while sum(len(part) for part in parts) < length:
+        parts.append(code_block(rng) if rng.random() < 0.25 else paragraph(rng))
+    return '\n\n'.join(parts)
+
+def tokens(rng, text):
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 8)
+        yield text[position:position + size]
+        position += size
+
+def slice_chunks(text):
+    return [text[i:i + MESSAGE_LIMIT] for i in range(0, len(text), MESSAGE_LIMIT)]
+
+def stream_chunks(rng, text, max_chunks):
+    splitter = MessageSplitter(max_chunks=max_chunks)
+    chunks = []
+    peak = 0
+    for token in tokens(rng, text):
+        splitter.feed(token)
+        for index, chunk, sealed in splitter.chunks():
+            if sealed:
+                chunks.append(chunk)
+                splitter.delivered(index)
+        peak = max(peak, len(splitter.tail) + sum(len(chunk) for chunk in splitter.sealed.values()))
+    chunks.extend(chunk for _, chunk, _ in splitter.chunks())
+    return chunks, splitter.total(), peak
+
+def damage(chunks):
+    cut_words = sum(1 for left, right in zip(chunks, chunks[1:])
+                    if left and right and not left[-1].isspace() and not right[0].isspace())
+    unbalanced = sum(1 for chunk in chunks if len(FENCE_LINE.findall(chunk)) % 2)
+    too_long = sum(1 for chunk in chunks if utf16_length(chunk) > MESSAGE_LIMIT)
+    return cut_words, unbalanced, too_long
+
+def main():
+    parser = argparse.ArgumentParser(description="Long answers split by fixed 4096-character slices vs the streaming Markdown-aware splitter")
+    parser.add_argument("--answers", type=int, default=200)
+    parser.add_argument("--min-length", type=int, default=2000)
+    parser.add_argument("--max-length", type=int, default=30000)
+    parser.add_argument("--document-after", type=int, default=3, help="Upload a document above this many messages, 0 = never")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    answers = [answer(rng, rng.randint(args.min_length, args.max_length)) for _ in range(args.answers)]
+    print(colored(f"{args.answers} answers of {args.min_length}-{args.max_length} characters "
+                  f"({sum(map(len, answers)) / len(answers):.0f} on average)", "cyan"))
+
+    totals = {'slice': [0, 0, 0, 0, 0], 'splitter': [0, 0, 0, 0, 0]}
+    for text in answers:
+        sliced = slice_chunks(text)
+        for index, value in enumerate((len(sliced),) + damage(sliced) + (len(text),)):
+            totals['slice'][index] += value
+
+        chunks, total, peak = stream_chunks(rng, text, args.document_after)
+        sends = total if not args.document_after or total <= args.document_after else args.document_after + 1
+        for index, value in enumerate((sends,) + damage(chunks) + (peak,)):
+            totals['splitter'][index] += value
+
+    for mode, (sends, cut_words, unbalanced, too_long, buffered) in totals.items():
+        print(f"  {mode:<9} sends/answer {sends / len(answers):5.2f}  words cut {cut_words:>5}  "
+              f"unbalanced code blocks {unbalanced:>5}  over the UTF-16 limit {too_long:>5}  "
+              f"buffered chars/answer {buffered / len(answers):8.0f}")
+
+if __name__ == "__main__":
+    main()
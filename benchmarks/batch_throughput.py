@@ -0,0 +1,84 @@
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+from task_queue import redis_client, enqueue_ai_request, JOB_EVENTS_CHANNEL
+
+def start_workers(mode, processes, batch_size, env):
+    env = dict(env, WORKER_MODE=mode, BATCH_SIZE=str(batch_size), FAIR_DISPATCH_WINDOW=str(max(2, batch_size)))
+    os.makedirs(os.path.join(ROOT, 'logs'), exist_ok=True)
+    return [
+        subprocess.Popen([sys.executable, 'worker.py'], cwd=ROOT, env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(processes)
+    ]
+
+def run_jobs(jobs, timeout):
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(JOB_EVENTS_CHANNEL)
+
+    started = time.time()
+    pending = {
+        enqueue_ai_request(100000 + i, f"benchmark question {i} {started}", chat_id=100000 + i)
+        for i in range(jobs)
+    }
+    tokens = 0
+    deadline = started + timeout
+
+    while pending and time.time() < deadline:
+        message = pubsub.get_message(timeout=1)
+        if not message:
+            continue
+        event = json.loads(message['data'])
+        if event['job_id'] in pending and event['status'] in ('finished', 'failed'):
+            pending.discard(event['job_id'])
+            tokens += event.get('result', {}).get('tokens', 0)
+
+    pubsub.close()
+    return time.time() - started, tokens, len(pending)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generation throughput of RQ workers vs the batch worker")
+    parser.add_argument("--mode", choices=["rq", "batch"], default="batch")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start")
+    parser.add_argument("--batch-size", type=int, default=8, help="Concurrent jobs per batch worker")
+    parser.add_argument("--jobs", type=int, default=64)
+    parser.add_argument("--tokens", type=int, default=50)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--parallel", type=int, default=8, help="Stub server generation slots (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    ollama = StubOllamaServer(tokens=args.tokens, token_latency=args.token_latency, parallel=args.parallel).start()
+    env = dict(os.environ)
+    env['OLLAMA_HOST'], env['OLLAMA_PORT'] = ollama.server_address[0], str(ollama.server_address[1])
+    env['CONVERSATION_ENABLED'] = 'False'
+    env.setdefault('OLLAMA_MODEL', ollama.model)
+    ollama.model = env['OLLAMA_MODEL']
+
+    workers = start_workers(args.mode, args.processes, args.batch_size, env)
+    try:
+        time.sleep(2)
+        elapsed, tokens, unfinished = run_jobs(args.jobs, args.timeout)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        ollama.stop()
+
+    concurrency = args.batch_size if args.mode == "batch" else 1
+    print(colored(f"[{args.mode} worker] {args.processes} process(es) x {concurrency} concurrent job(s), "
+                  f"server parallelism {args.parallel or 'unlimited'}", "cyan"))
+    print(f"  Jobs: {args.jobs - unfinished} finished ({unfinished} unfinished) in {elapsed:.2f}s")
+    print(f"  Throughput: {tokens / elapsed:.1f} tokens/s, {(args.jobs - unfinished) / elapsed:.2f} jobs/s")
+    print(f"  Peak concurrent generations: {ollama.peak_generating}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import sys
+import os
+import time
+import asyncio
+import argparse
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+from fake_telegram import FakeTelegramServer
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def start_workers(count, env):
+    os.makedirs(os.path.join(ROOT, 'logs'), exist_ok=True)
+    return [
+        subprocess.Popen([sys.executable, 'worker.py'], cwd=ROOT, env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for _ in range(count)
+    ]
+
+def start_bot(runtime, api_url):
+    import telebot.apihelper
+    import telebot.asyncio_helper
+    telebot.apihelper.API_URL = api_url
+    telebot.asyncio_helper.API_URL = api_url
+
+    if runtime == 'async':
+        from async_bot import AsyncTelegramBot
+        bot_instance = AsyncTelegramBot()
+        target = lambda: asyncio.run(bot_instance.main())
+    else:
+        from bot import TelegramBot
+        bot_instance = TelegramBot()
+        target = lambda: bot_instance.bot.polling(none_stop=True, interval=0, timeout=1)
+
+    threading.Thread(target=target, daemon=True).start()
+    return bot_instance
+
+def run_workload(telegram, users, rounds, tokens, timeout):
+    latencies = []
+    pending = {}
+    remaining = {user_id: rounds for user_id in range(1, users + 1)}
+    seen = 0
+    deadline = time.time() + timeout
+
+    for user_id in remaining:
+        pending[user_id] = telegram.inject_message(user_id, f"question {user_id} {rounds}")
+
+    while pending and time.time() < deadline:
+        outbox = telegram.outbox[seen:]
+        seen += len(outbox)
+
+        for sent_at, method, chat_id, text in outbox:
+            if chat_id in pending and text.count('token') >= tokens:
+                latencies.append(sent_at - pending.pop(chat_id))
+                remaining[chat_id] -= 1
+                if remaining[chat_id] > 0:
+                    pending[chat_id] = telegram.inject_message(chat_id, f"question {chat_id} {remaining[chat_id]}")
+
+        time.sleep(0.01)
+
+    return latencies, len(pending)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot against fake Telegram and Ollama servers")
+    parser.add_argument("--runtime", choices=["async", "sync"], default="async")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3, help="Messages per user, sent one after another")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--send-latency", type=float, default=0.02, help="Fake Telegram API latency in seconds")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    ollama = StubOllamaServer(tokens=args.tokens, token_latency=args.token_latency).start()
+    telegram = FakeTelegramServer(send_latency=args.send_latency).start()
+
+    os.environ.setdefault('API_TOKEN', '123456:LOADTEST')
+    os.environ['OLLAMA_HOST'], os.environ['OLLAMA_PORT'] = ollama.server_address[0], str(ollama.server_address[1])
+    os.environ['RESPONSE_CACHE_ENABLED'] = 'False'
+    os.environ['CONVERSATION_ENABLED'] = 'False'
+    os.environ.setdefault('OLLAMA_MODEL', ollama.model)
+    ollama.model = os.environ['OLLAMA_MODEL']
+
+    workers = start_workers(args.workers, dict(os.environ))
+    try:
+        start_bot(args.runtime, telegram.api_url)
+        started = time.time()
+        latencies, unanswered = run_workload(telegram, args.users, args.rounds, args.tokens, args.timeout)
+        elapsed = time.time() - started
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+    print(colored(f"[{args.runtime} runtime] {args.users} users x {args.rounds} rounds", "cyan"))
+    print(f"  Answered: {len(latencies)} ({unanswered} unanswered)")
+    print(f"  Throughput: {len(latencies) / elapsed:.1f} answers/s")
+    print(f"  Latency p50: {percentile(latencies, 50) * 1000:.0f} ms")
+    print(f"  Latency p95: {percentile(latencies, 95) * 1000:.0f} ms")
+    print(f"  Latency p99: {percentile(latencies, 99) * 1000:.0f} ms")
+    print(f"  Telegram API calls: {dict(sorted(telegram.calls.items()))}")
+
+if __name__ == "__main__":
+    main()
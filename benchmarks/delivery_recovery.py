@@ -0,0 +1,130 @@
+import sys
+import os
+import json
+import time
+import logging
+import argparse
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+from fake_telegram import FakeTelegramServer
+from bot_load import start_bot
+
+JOB_PREFIX = "bench_recovery_"
+
+def seed_crashed_run(redis_client, args):
+    from job_state import PendingJobStore
+    from delivery_journal import DeliveryJournal, DELIVERY_STREAM
+
+    # The crashed bot tracked every question; the answers finished while it was down or mid-send
+    crashed = PendingJobStore(redis_client)
+    journal = DeliveryJournal(redis_client, crashed.consumer)
+    journal.ensure_group()
+    now = time.time()
+    answer = "recovered answer " * (args.answer_chars // 17)
+
+    with redis_client.pipeline(transaction=False) as pipe:
+        for i in range(args.jobs):
+            user_id = i + 1
+            job_info = {
+                'job_id': f"{JOB_PREFIX}{i}",
+                'user_id': user_id,
+                'message_text': f"question {i}",
+                'message_id': 1,
+                'processing_msg_id': 2,
+                'chat_id': user_id,
+                'start_time': now,
+                'deadline': now + 600,
+                'received_at': now
+            }
+            pipe.hset(crashed.pending_key(job_info['job_id']), user_id, crashed.encode(job_info))
+            pipe.zadd(crashed.index_key, {f"{job_info['job_id']}:{user_id}": job_info['deadline']})
+            pipe.xadd(DELIVERY_STREAM, {
+                'job_id': job_info['job_id'],
+                'status': 'finished',
+                'payload': json.dumps({'result': {'success': True, 'response': answer, 'user_id': user_id}})
+            })
+        pipe.execute()
+
+    read = int(args.jobs * args.read_share)
+    claimed = int(args.jobs * args.claimed_share)
+    while read:
+        read -= len(journal.read(block=100)[:read])
+    for i in range(claimed):
+        crashed.claim_job(f"{JOB_PREFIX}{i}")
+    return claimed
+
+def remaining(redis_client, args):
+    from delivery_journal import DELIVERY_STREAM
+    with redis_client.pipeline(transaction=False) as pipe:
+        pipe.zcount("ai_jobs:pending_index", '-inf', '+inf')
+        # A sample of the jobs is enough to see whether claimed deliveries are still being sent
+        for i in range(0, args.jobs, max(1, args.jobs // 100)):
+            pipe.exists(f"ai_jobs:delivering:{JOB_PREFIX}{i}")
+        pipe.xlen(DELIVERY_STREAM)
+        replies = pipe.execute()
+    return replies[0], sum(replies[1:-1]), replies[-1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Bot restart with a backlog of finished but undelivered answers in the delivery journal")
+    parser.add_argument("--runtime", choices=["async", "sync"], default="async")
+    parser.add_argument("--jobs", type=int, default=10000, help="Answers waiting for delivery when the bot starts")
+    parser.add_argument("--read-share", type=float, default=0.5, help="Share of journal entries the crashed bot had read")
+    parser.add_argument("--claimed-share", type=float, default=0.1, help="Share of deliveries the crashed bot was sending")
+    parser.add_argument("--answer-chars", type=int, default=500)
+    parser.add_argument("--downtime", type=float, default=5, help="Seconds between the crash and the restart")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+
+    telegram = FakeTelegramServer().start()
+    os.environ.update({
+        'API_TOKEN': '123456:RECOVERY',
+        'DELIVERY_STREAM': 'bench:deliveries',
+        'BOT_CONSUMER_NAME': 'bench-bot',
+        'OUTBOX_GLOBAL_RATE': '0',
+        'METRICS_ENABLED': 'False',
+        'CONVERSATION_ENABLED': 'False'
+    })
+    os.environ.setdefault('OLLAMA_MODEL', 'bench')
+    logging.disable(logging.WARNING)
+
+    from task_queue import redis_client
+    from delivery_journal import DELIVERY_STREAM
+    redis_client.delete(DELIVERY_STREAM)
+
+    started = time.perf_counter()
+    claimed = seed_crashed_run(redis_client, args)
+    print(colored(f"[{args.runtime} bot] {args.jobs} undelivered answers: {claimed} mid-send, "
+                  f"{int(args.jobs * args.read_share) - claimed} read but unclaimed, the rest never read "
+                  f"(seeded in {time.perf_counter() - started:.1f}s)", "cyan"))
+
+    time.sleep(args.downtime)
+    started = time.perf_counter()
+    start_bot(args.runtime, telegram.api_url)
+    claimed_at = None
+    deadline = time.time() + args.timeout
+    while time.time() < deadline:
+        pending, delivering, backlog = remaining(redis_client, args)
+        if claimed_at is None and not pending:
+            claimed_at = time.perf_counter() - started
+        if not pending and not delivering and not backlog:
+            break
+        time.sleep(0.05)
+    acked_at = time.perf_counter() - started
+
+    edits = Counter(chat_id for _, method, chat_id, _ in telegram.outbox if method == 'editMessageText')
+    lost = sum(1 for user_id in range(1, args.jobs + 1) if not edits[user_id])
+    duplicated = sum(count - 1 for count in edits.values() if count > 1)
+    print(f"  every pending answer claimed after {claimed_at or float('nan'):6.2f}s")
+    print(f"  every delivery sent and acknowledged after {acked_at:6.2f}s "
+          f"(Telegram's 30 messages/s would take {args.jobs / 30:.0f}s for the sends alone)")
+    print(f"  answers lost: {lost}, delivered twice: {duplicated}, journal entries left: {remaining(redis_client, args)[2]}")
+
+    redis_client.delete(DELIVERY_STREAM)
+    sys.exit(1 if lost or duplicated else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import time
+import random
+import asyncio
+import urllib.parse
+import argparse
+import itertools
+import threading
+from collections import deque
+from aiohttp import web
+
+SEND_METHODS = ('sendMessage', 'editMessageText', 'sendDocument', 'deleteMessage')
+
+class FakeTelegramServer:
+    def __init__(self, host='127.0.0.1', port=0, send_latency=0.0, flood_ratio=0.0, chat_limit=0, flood_wait=1, seed=1):
+        self.host = host
+        self.port = port
+        self.send_latency = send_latency
+        self.flood_ratio = flood_ratio
+        self.chat_limit = chat_limit
+        self.flood_wait = flood_wait
+        self.rng = random.Random(seed)
+        self.chat_calls = {}
+        self.flood_waits = 0
+        self.updates = []
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.calls = {}
+        self.outbox = []
+        self.loop = None
+        self.runner = None
+        self.new_update = None
+        self.ready = threading.Event()
+
+    @property
+    def api_url(self):
+        return f"http://{self.host}:{self.port}/bot{{0}}/{{1}}"
+
+    def message_payload(self, chat_id, text, message_id=None):
+        return {
+            'message_id': message_id or next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'text': text
+        }
+
+    def inject_message(self, user_id, text, chat_id=None):
+        chat_id = chat_id or user_id
+        message = self.message_payload(chat_id, text)
+        message['from'] = {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+
+        update = {'update_id': next(self.update_ids), 'message': message}
+        self.loop.call_soon_threadsafe(self.push_update, update)
+        return time.time()
+
+    def push_update(self, update):
+        self.updates.append(update)
+        self.new_update.set()
+
+    async def read_params(self, request):
+        params = dict(request.query)
+        if not request.can_read_body:
+            return params
+
+        if request.content_type.startswith('multipart/'):
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    params[part.name] = await part.read()
+                else:
+                    params[part.name] = await part.text()
+        else:
+            params.update(urllib.parse.parse_qsl((await request.read()).decode()))
+        return params
+
+    def flooded(self, chat_id):
+        if self.flood_ratio and self.rng.random() < self.flood_ratio:
+            return True
+        if not self.chat_limit:
+            return False
+
+        now = time.time()
+        calls = self.chat_calls.setdefault(chat_id, deque())
+        while calls and now - calls[0] >= 1:
+            calls.popleft()
+        if len(calls) >= self.chat_limit:
+            return True
+        calls.append(now)
+        return False
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await self.read_params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self.get_updates(params)})
+
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)
+
+        if method in SEND_METHODS and self.flooded(params.get('chat_id')):
+            self.flood_waits += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.flood_wait}",
+                'parameters': {'retry_after': self.flood_wait}
+            }, status=429)
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+        elif method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            message_id = int(params['message_id']) if 'message_id' in params else None
+            result = self.message_payload(params.get('chat_id', 0), params.get('text', ''), message_id)
+            self.outbox.append((time.time(), method, int(params.get('chat_id', 0)), params.get('text', '')))
+        else:
+            result = True
+
+        return web.json_response({'ok': True, 'result': result})
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset', 0))
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+
+        if not self.updates:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout=float(params.get('timeout', 0)) or 0.1)
+            except asyncio.TimeoutError:
+                pass
+
+        return self.updates[:int(params.get('limit', 100))]
+
+    async def serve(self):
+        self.new_update = asyncio.Event()
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.ready.set()
+
+    def start(self):
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.serve())
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Telegram Bot API server")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--send-latency", type=float, default=0.0)
+    parser.add_argument("--flood-ratio", type=float, default=0.0, help="Share of send calls answered with 429")
+    parser.add_argument("--chat-limit", type=int, default=0, help="Send calls per chat per second before 429 (0 = unlimited)")
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(port=args.port, send_latency=args.send_latency,
+                                flood_ratio=args.flood_ratio, chat_limit=args.chat_limit).start()
+    print(f"Fake Telegram API listening on {server.api_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
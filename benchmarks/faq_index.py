@@ -0,0 +1,101 @@
+import sys
+import os
+import time
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+
+PREFIXES = ["how do I", "how can I", "what is the best way to", "is there a way to", "can you tell me how to",
+            "what should I do to", "explain how to"]
+SUFFIXES = ["", "?", " please", " quickly?", " step by step", " on my phone?"]
+SYLLABLES = "ka lo mi ne ru sa te vo zi ba de fu gi ho ja ky".split()
+
+def topics(count, rng):
+    # Three made-up content words per topic, so different topics rarely share more than one of them
+    vocabulary = sorted({''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(count * 3)})
+    result = set()
+    while len(result) < count:
+        result.add(tuple(rng.sample(vocabulary, 3)))
+    return sorted(result)
+
+def ask(rng, topic):
+    verb, qualifier, noun = topic
+    return f"{rng.choice(PREFIXES)} {verb} my {qualifier} {noun}{rng.choice(SUFFIXES)}"
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Semantic FAQ index: inserts, batched search, restart from the memory-mapped file and paraphrase hits")
+    parser.add_argument("--size", type=int, default=2000, help="Indexed questions")
+    parser.add_argument("--queries", type=int, default=2000, help="Reworded questions asked afterwards")
+    parser.add_argument("--batch", type=int, default=32, help="Queries per batched search")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--dim", type=int, default=512, help="Hashing embedder dimensions")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="faq_index_")
+    os.environ.update({
+        'FAQ_ENABLED': 'True',
+        'FAQ_EMBEDDER': 'hashing',
+        'FAQ_HASHING_DIM': str(args.dim),
+        'FAQ_INDEX_SIZE': str(args.size),
+        'FAQ_SIMILARITY_THRESHOLD': str(args.threshold),
+        'FAQ_INDEX_PATH': os.path.join(directory, 'faq_index.npy')
+    })
+    logging.disable(logging.WARNING)
+    from faq_index import FaqIndex
+
+    rng = random.Random(args.seed)
+    every_topic = topics(args.size * 2, rng)
+    known, unknown = every_topic[::2], every_topic[1::2]
+    questions = [ask(rng, topic) for topic in known]
+    answers = {topic: f"Answer about {' '.join(topic)}" for topic in known}
+    print(colored(f"{args.size} indexed questions, {args.queries} reworded questions, "
+                  f"{args.dim}-dimensional hashing embedder", "cyan"))
+
+    try:
+        index = FaqIndex("benchmark")
+        vectors, embed_time = timed(index.embed, questions)
+        started = time.perf_counter()
+        for question, topic, vector in zip(questions, known, vectors):
+            index.add(question, answers[topic], vector)
+        insert_time = time.perf_counter() - started
+        print(f"  build    embed {embed_time / args.size * 1e6:7.1f} us/question  "
+              f"insert {insert_time / args.size * 1e6:7.1f} us/question")
+
+        restarted, load_time = timed(FaqIndex, "benchmark")
+        print(f"  restart  memory-mapped load {load_time * 1000:7.1f} ms for {restarted.size} answers "
+              f"(re-embedding all questions: {embed_time * 1000:.1f} ms locally, {args.size} Ollama calls otherwise)")
+
+        # Half of the questions were answered before in other words, the other half are new
+        asked = [rng.choice(known if i % 2 else unknown) for i in range(args.queries)]
+        query_vectors = restarted.embed([ask(rng, topic) for topic in asked])
+        _, single_time = timed(lambda: [restarted.search(vector[None, :]) for vector in query_vectors])
+        matches, batch_time = timed(lambda: [match for start in range(0, len(query_vectors), args.batch)
+                                             for match in restarted.search(query_vectors[start:start + args.batch])])
+        print(f"  search   one at a time {single_time / args.queries * 1e6:7.1f} us/query  "
+              f"batches of {args.batch} {batch_time / args.queries * 1e6:7.1f} us/query")
+
+        hits = wrong = 0
+        for topic, (row, score) in zip(asked, matches):
+            if score >= args.threshold:
+                hits += topic in answers
+                wrong += restarted.answers[row] != answers.get(topic)
+        print(f"  answers  {hits / (args.queries // 2):6.1%} of reworded known questions answered without generation, "
+              f"{wrong} of {args.queries} questions given another question's answer")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rq.job import Job, JobStatus
+from termcolor import colored
+from task_queue import redis_client, get_job_status, publish_job_event, JOB_EVENTS_CHANNEL
+
+def commands_processed():
+    return redis_client.info('stats')['total_commands_processed']
+
+def create_jobs(count):
+    jobs = []
+    for i in range(count):
+        job = Job.create(print, args=(i,), id=f"bench_delivery_{i}", connection=redis_client)
+        job.save()
+        jobs.append(job)
+    return jobs
+
+def finish_jobs(jobs, finish_window, publish):
+    finished_at = {}
+    schedule = sorted((random.uniform(0, finish_window), job) for job in jobs)
+    started = time.time()
+
+    for offset, job in schedule:
+        time.sleep(max(0, started + offset - time.time()))
+        job.set_status(JobStatus.FINISHED)
+        finished_at[job.id] = time.time()
+        if publish:
+            publish_job_event(redis_client, job.id, 'finished', {'result': {'success': True}})
+
+    return finished_at
+
+def run_polling(jobs, finish_window, interval):
+    delivered_at = {}
+    pending = {job.id for job in jobs}
+
+    def poll():
+        while pending:
+            for job_id in list(pending):
+                if get_job_status(job_id)['status'] == JobStatus.FINISHED:
+                    delivered_at[job_id] = time.time()
+                    pending.discard(job_id)
+            time.sleep(interval)
+
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+    finished_at = finish_jobs(jobs, finish_window, publish=False)
+    poller.join()
+    return finished_at, delivered_at
+
+def run_push(jobs, finish_window):
+    delivered_at = {}
+    pending = {job.id for job in jobs}
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(JOB_EVENTS_CHANNEL)
+
+    def listen():
+        for message in pubsub.listen():
+            event = json.loads(message['data'])
+            if event['job_id'] in pending:
+                delivered_at[event['job_id']] = time.time()
+                pending.discard(event['job_id'])
+            if not pending:
+                break
+
+    listener = threading.Thread(target=listen, daemon=True)
+    listener.start()
+    finished_at = finish_jobs(jobs, finish_window, publish=True)
+    listener.join()
+    pubsub.close()
+    return finished_at, delivered_at
+
+def report(name, finished_at, delivered_at, elapsed, commands):
+    latencies = [delivered_at[job_id] - finished_at[job_id] for job_id in finished_at]
+    print(colored(f"[{name}]", "cyan"))
+    print(f"  Median delivery latency: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"  Max delivery latency: {max(latencies) * 1000:.1f} ms")
+    print(f"  Redis commands/s: {commands / elapsed:.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare polling and push-based job delivery")
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--window", type=float, default=10.0, help="Seconds over which jobs finish")
+    parser.add_argument("--interval", type=float, default=2.0, help="Polling interval in seconds")
+    args = parser.parse_args()
+
+    for name in ("polling", "push"):
+        jobs = create_jobs(args.jobs)
+        before = commands_processed()
+        started = time.time()
+
+        if name == "polling":
+            finished_at, delivered_at = run_polling(jobs, args.window, args.interval)
+        else:
+            finished_at, delivered_at = run_push(jobs, args.window)
+
+        report(name, finished_at, delivered_at, time.time() - started, commands_processed() - before)
+
+        for job in jobs:
+            job.delete()
+
+if __name__ == "__main__":
+    main()
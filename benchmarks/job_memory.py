@@ -0,0 +1,110 @@
+import sys
+import os
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rq import Queue, Callback
+from rq.job import Job
+from rq.utils import utcnow
+from termcolor import colored
+from compact_job import CompactJob, CompactSerializer
+from task_queue import redis_client, process_ai_request, report_job_success, report_job_failure
+
+WORDS = "merhaba bu bir deneme cevabıdır ve kuyrukta bekleyen işlerin bellek kullanımını ölçmek için yazılmıştır".split()
+
+def make_text(words, seed):
+    return ' '.join(WORDS[(seed + i) % len(WORDS)] for i in range(words))
+
+def finish_jobs(label, serializer, compact, count, result_ttl, prompt_words, response_words):
+    queue = Queue(f"memory_bench_{label}", connection=redis_client, serializer=serializer,
+                  job_class=CompactJob if compact else Job)
+    job_ids = []
+
+    for start in range(0, count, 500):
+        with redis_client.pipeline() as pipe:
+            for i in range(start, min(count, start + 500)):
+                extra = {'result_ttl': result_ttl, 'description': f"ai_request user={i}"} if compact else {}
+                job = queue.create_job(
+                    process_ai_request,
+                    args=(i, make_text(prompt_words, i), None, i),
+                    timeout=300,
+                    job_id=f"memory_bench_{label}_{i}",
+                    on_success=Callback(report_job_success),
+                    on_failure=Callback(report_job_failure),
+                    **extra
+                )
+                job.started_at = utcnow()
+                job.ended_at = utcnow()
+                job._result = {
+                    'success': True,
+                    'response': make_text(response_words, i),
+                    'model': 'llama3.2:1b',
+                    'tokens': response_words,
+                    'duration': 1.234,
+                    'user_id': i
+                }
+                job._handle_success(job.get_result_ttl(500), pipeline=pipe)
+                job_ids.append(job.id)
+            pipe.execute()
+
+    return queue, job_ids
+
+def time_status_reads(job_class, serializer, job_ids):
+    started = time.perf_counter()
+    for job_id in job_ids:
+        job = job_class.fetch(job_id, connection=redis_client, serializer=serializer)
+        job.get_status()
+        job.result
+    return (time.perf_counter() - started) / len(job_ids)
+
+def delete_jobs(queue, job_ids):
+    with redis_client.pipeline() as pipe:
+        for job_id in job_ids:
+            pipe.delete(Job.key_for(job_id), f"rq:results:{job_id}")
+        pipe.delete(queue.finished_job_registry.key)
+        pipe.execute()
+
+def measure(label, serializer, compact, args):
+    used_before = redis_client.info('memory')['used_memory']
+    queue, job_ids = finish_jobs(label, serializer, compact, args.jobs, args.result_ttl,
+                                 args.prompt_words, args.response_words)
+    used_after = redis_client.info('memory')['used_memory']
+    read_time = time_status_reads(queue.job_class, serializer, job_ids[:1000])
+    delete_jobs(queue, job_ids)
+
+    per_job = (used_after - used_before) / args.jobs
+    ttl = args.result_ttl if compact else 500
+    return {
+        'label': label,
+        'per_job': per_job,
+        'per_100k_mb': per_job * 100000 / 1e6,
+        'steady_state_mb': per_job * args.rate * ttl / 1e6,
+        'ttl': ttl,
+        'read_ms': read_time * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis memory per finished job: pickled jobs with result streams vs compact jobs")
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--prompt-words", type=int, default=20)
+    parser.add_argument("--response-words", type=int, default=150)
+    parser.add_argument("--result-ttl", type=int, default=120, help="Result TTL of the compact configuration")
+    parser.add_argument("--rate", type=float, default=10, help="Completed jobs per second used for the steady-state estimate")
+    args = parser.parse_args()
+
+    results = [
+        measure('pickle', None, False, args),
+        measure('compact', CompactSerializer, True, args)
+    ]
+
+    print(colored(f"{args.jobs} finished jobs, {args.prompt_words}-word prompts, {args.response_words}-word answers", "cyan"))
+    for result in results:
+        print(f"  {result['label']:<8} {result['per_job']:7.0f} bytes/job  {result['per_100k_mb']:7.1f} MB per 100k jobs  "
+              f"{result['steady_state_mb']:6.1f} MB resident at {args.rate:g} jobs/s with {result['ttl']}s TTL  "
+              f"status read {result['read_ms']:.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import sys
+import os
+import json
+import time
+import random
+import logging
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+from fake_telegram import FakeTelegramServer
+from bot_load import start_bot, start_workers, percentile
+
+STAGES = ('ack', 'queue_wait', 'first_token', 'generation', 'answer')
+REJECTION_PREFIXES = ('⏳ Your previous question', '🚦', '🚧')
+VOCABULARY = (
+    "how what why when where explain compare describe list summarize python redis queue worker model "
+    "token latency cache answer question message telegram server memory network request response"
+).split()
+
+def parse_prompt_mix(spec):
+    mix = []
+    for part in spec.split(','):
+        weight, words = part.split(':')
+        mix.append((float(weight), int(words)))
+    return mix
+
+def build_workload(args):
+    rng = random.Random(args.seed)
+    lengths, weights = [words for _, words in args.prompt_mix], [weight for weight, _ in args.prompt_mix]
+    hot_prompts = []
+    workload = []
+    at = 0.0
+
+    for i in range(args.messages):
+        at += rng.expovariate(args.rate)
+        if hot_prompts and rng.random() < args.repeat_ratio:
+            prompt = rng.choice(hot_prompts)
+        else:
+            words = rng.choices(lengths, weights)[0]
+            prompt = f"q{args.seed}-{i} " + ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+            if len(hot_prompts) < args.hot_prompts:
+                hot_prompts.append(prompt)
+        workload.append((at, prompt))
+
+    return workload
+
+class LoadRun:
+    def __init__(self, telegram, users, tokens, seed):
+        self.telegram = telegram
+        self.tokens = tokens
+        self.rng = random.Random(seed)
+        self.idle = list(range(1, users + 1))
+        self.pending = {}
+        self.samples = {stage: [] for stage in STAGES}
+        self.counts = {'sent': 0, 'answered': 0, 'instant': 0, 'rejected': 0, 'skipped': 0}
+        self.seen = 0
+
+    def send(self, prompt):
+        if not self.idle:
+            self.counts['skipped'] += 1
+            return
+        user_id = self.idle.pop(self.rng.randrange(len(self.idle)))
+        self.pending[user_id] = {'sent_at': self.telegram.inject_message(user_id, prompt)}
+        self.counts['sent'] += 1
+
+    def finish(self, chat_id):
+        del self.pending[chat_id]
+        self.idle.append(chat_id)
+
+    def collect(self):
+        outbox = self.telegram.outbox[self.seen:]
+        self.seen += len(outbox)
+
+        for sent_at, method, chat_id, text in outbox:
+            state = self.pending.get(chat_id)
+            if state is None:
+                continue
+
+            if 'ack' not in state:
+                state['ack'] = sent_at
+                self.samples['ack'].append(sent_at - state['sent_at'])
+
+            if text.startswith(REJECTION_PREFIXES):
+                self.counts['rejected'] += 1
+                self.finish(chat_id)
+                continue
+
+            final = text.count('token') >= self.tokens
+            if final and state['ack'] == sent_at:
+                self.counts['instant'] += 1
+            elif 'token' in text and 'first_token' not in state:
+                state['first_token'] = sent_at
+                self.samples['first_token'].append(sent_at - state['sent_at'])
+
+            if final:
+                if 'first_token' in state:
+                    self.samples['generation'].append(sent_at - state['first_token'])
+                self.samples['answer'].append(sent_at - state['sent_at'])
+                self.counts['answered'] += 1
+                self.finish(chat_id)
+
+    def run(self, workload, timeout):
+        started = time.time()
+        deadline = started + workload[-1][0] + timeout
+        next_message = 0
+
+        while (next_message < len(workload) or self.pending) and time.time() < deadline:
+            now = time.time() - started
+            while next_message < len(workload) and workload[next_message][0] <= now:
+                self.send(workload[next_message][1])
+                next_message += 1
+            self.collect()
+            time.sleep(0.005)
+
+        return time.time() - started
+
+def summarize(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99)
+    }
+
+def queue_wait_samples(redis_client, fair_scheduler, queue_names):
+    with redis_client.pipeline(transaction=False) as pipe:
+        for name in queue_names:
+            pipe.lrange(fair_scheduler.wait_key(name), 0, -1)
+        return [float(value) for values in pipe.execute() for value in values]
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a synthetic message workload against fake Telegram and Ollama servers")
+    parser.add_argument("--runtime", choices=["async", "sync"], default="async")
+    parser.add_argument("--worker-mode", choices=["rq", "simple", "pool", "batch"], default="simple")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes to start")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=10, help="Mean message arrivals per second (Poisson)")
+    parser.add_argument("--prompt-mix", type=parse_prompt_mix, default="0.7:8,0.25:60,0.05:600",
+                        help="Prompt length distribution as weight:words pairs")
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="Share of messages repeating a hot prompt")
+    parser.add_argument("--hot-prompts", type=int, default=20, help="Distinct prompts that repeats are drawn from")
+    parser.add_argument("--tokens", type=int, default=30, help="Tokens per answer")
+    parser.add_argument("--token-rate", type=float, default=100, help="Fake Ollama tokens per second (0 = instant)")
+    parser.add_argument("--prompt-latency", type=float, default=0.0005, help="Fake Ollama seconds per prompt word")
+    parser.add_argument("--parallel", type=int, default=4, help="Fake Ollama concurrent generations (0 = unlimited)")
+    parser.add_argument("--send-latency", type=float, default=0.02, help="Fake Telegram API latency in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for answers after the last message")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    workload = build_workload(args)
+    ollama = StubOllamaServer(tokens=args.tokens, token_latency=1 / args.token_rate if args.token_rate else 0.0,
+                              parallel=args.parallel, prompt_latency=args.prompt_latency).start()
+    telegram = FakeTelegramServer(send_latency=args.send_latency).start()
+
+    os.environ.setdefault('API_TOKEN', '123456:LOADTEST')
+    os.environ['OLLAMA_HOST'], os.environ['OLLAMA_PORT'] = ollama.server_address[0], str(ollama.server_address[1])
+    os.environ['RESPONSE_CACHE_ENABLED'] = str(not args.no_cache)
+    os.environ['CONVERSATION_ENABLED'] = 'False'
+    os.environ['RATE_LIMIT_ENABLED'] = 'False'
+    os.environ['WORKER_MODE'] = args.worker_mode
+    os.environ['WAIT_TIME_SAMPLES'] = str(max(1000, args.messages))
+    os.environ['METRICS_ENABLED'] = 'False'
+    os.environ.setdefault('MIN_OUTPUT_TOKENS', str(args.tokens))
+    os.environ.setdefault('OLLAMA_MODEL', ollama.model)
+    ollama.model = os.environ['OLLAMA_MODEL']
+
+    from task_queue import redis_client, fair_scheduler, task_queues
+    queue_names = [queue.name for queue in task_queues]
+    redis_client.delete(*[fair_scheduler.wait_key(name) for name in queue_names])
+
+    workers = start_workers(args.workers, dict(os.environ))
+    try:
+        start_bot(args.runtime, telegram.api_url)
+        time.sleep(1)
+        run = LoadRun(telegram, args.users, args.tokens, args.seed)
+        elapsed = run.run(workload, args.timeout)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+
+    run.samples['queue_wait'] = queue_wait_samples(redis_client, fair_scheduler, queue_names)
+    stages = {stage: summarize(run.samples[stage]) for stage in STAGES}
+    unanswered = len(run.pending)
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key != 'json'},
+        'elapsed': elapsed,
+        'counts': dict(run.counts, unanswered=unanswered),
+        'throughput': {
+            'answers_per_second': run.counts['answered'] / elapsed,
+            'tokens_per_second': run.counts['answered'] * args.tokens / elapsed
+        },
+        'stages': stages,
+        'telegram_calls': dict(sorted(telegram.calls.items())),
+        'ollama_requests': dict(sorted(ollama.requests.items()))
+    }
+
+    print(colored(f"[{args.runtime} bot, {args.workers} {args.worker_mode} worker(s)] {args.messages} messages "
+                  f"at {args.rate:g}/s from {args.users} users, seed {args.seed}", "cyan"))
+    counts = results['counts']
+    print(f"  Sent: {counts['sent']}, answered: {counts['answered']} ({counts['instant']} instantly), "
+          f"rejected: {counts['rejected']}, skipped: {counts['skipped']}, unanswered: {unanswered}")
+    print(f"  Throughput: {results['throughput']['answers_per_second']:.1f} answers/s, "
+          f"{results['throughput']['tokens_per_second']:.0f} tokens/s over {elapsed:.1f}s")
+    for stage, stats in stages.items():
+        if stats['count']:
+            print(f"  {stage:<12} n={stats['count']:<5} p50 {stats['p50'] * 1000:7.0f} ms  "
+                  f"p95 {stats['p95'] * 1000:7.0f} ms  p99 {stats['p99'] * 1000:7.0f} ms")
+    print(f"  Telegram API calls: {results['telegram_calls']}")
+    print(f"  Ollama requests: {results['ollama_requests']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if unanswered else 0)
+
+if __name__ == "__main__":
+    main()
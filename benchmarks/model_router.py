@@ -0,0 +1,79 @@
+import sys
+import os
+import time
+import socket
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def unused_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+def main():
+    parser = argparse.ArgumentParser(description="Route requests across several stub Ollama servers")
+    parser.add_argument("--strategy", choices=["least_outstanding", "ewma"], default="least_outstanding")
+    parser.add_argument("--latencies", default="0.01,0.02,0.05", help="Per-token latency of each stub server")
+    parser.add_argument("--dead", type=int, default=1, help="Unreachable backends added to the pool")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--parallel", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    servers = [
+        StubOllamaServer(tokens=args.tokens, token_latency=float(latency), parallel=args.parallel).start()
+        for latency in args.latencies.split(',')
+    ]
+    urls = [server.url for server in servers] + [f"http://127.0.0.1:{unused_port()}" for _ in range(args.dead)]
+
+    os.environ['OLLAMA_HOSTS'] = ','.join(urls)
+    os.environ['ROUTER_STRATEGY'] = args.strategy
+    os.environ.setdefault('OLLAMA_MODEL', servers[0].model)
+    for server in servers:
+        server.model = os.environ['OLLAMA_MODEL']
+
+    from ai_service import OllamaService
+    service = OllamaService()
+    service.ensure_model_ready()
+
+    def timed_request(i):
+        started = time.time()
+        result = service.generate_response(f"question {i}", on_chunk=lambda piece: None)
+        return time.time() - started, result['success']
+
+    started = time.time()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        results = list(executor.map(timed_request, range(args.requests)))
+    elapsed = time.time() - started
+
+    latencies = [latency for latency, success in results if success]
+    print(colored(f"[{args.strategy}] {args.requests} requests, {len(servers)} live + {args.dead} dead backends", "cyan"))
+    print(f"  Succeeded: {len(latencies)}/{args.requests} in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)")
+    print(f"  Latency p50: {percentile(latencies, 50) * 1000:.0f} ms, p99: {percentile(latencies, 99) * 1000:.0f} ms")
+    for server, latency in zip(servers, args.latencies.split(',')):
+        print(f"  {server.url} (token latency {latency}s): {server.requests.get('/api/chat', 0)} requests")
+    for stats in service.router.stats()[len(servers):]:
+        print(f"  {stats['url']} (dead): circuit open={stats['circuit_open']}, failures={stats['consecutive_failures']}")
+
+    for server in servers:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import sys
+import os
+import time
+import socket
+import argparse
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+from status_roundtrips import RoundTripCounter
+
+def hung_host():
+    # Accepts connections into the backlog but never answers, like an Ollama host stuck loading a model
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(16)
+    return listener, f"http://127.0.0.1:{listener.getsockname()[1]}"
+
+def serial_refresh(monitor, get_queue_stats):
+    # The refresh before the live monitor: every host checked in turn with a 5 s timeout
+    monitor.check_redis()
+    [monitor.check_ollama_host(url) for url in monitor.ollama_urls]
+    get_queue_stats()
+    monitor.get_running_jobs()
+
+def timed(call, cycles):
+    with RoundTripCounter() as counter:
+        durations = []
+        for _ in range(cycles):
+            started = time.perf_counter()
+            call()
+            durations.append(time.perf_counter() - started)
+    durations.sort()
+    return counter.count / cycles, durations[len(durations) // 2] * 1000, durations[int(len(durations) * 0.95)] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of one monitor refresh: serial status checks vs the live sampler")
+    parser.add_argument("--hosts", type=int, default=3, help="Healthy stub Ollama hosts")
+    parser.add_argument("--hung", type=int, default=1, help="Ollama hosts that accept connections but never answer")
+    parser.add_argument("--cycles", type=int, default=3, help="Full status refreshes per mode")
+    parser.add_argument("--samples", type=int, default=200, help="Live samples to time")
+    args = parser.parse_args()
+
+    stubs = [StubOllamaServer().start() for _ in range(args.hosts)]
+    hung = [hung_host() for _ in range(args.hung)]
+    os.environ['OLLAMA_HOSTS'] = ",".join([stub.url for stub in stubs] + [url for _, url in hung])
+
+    from monitor import SystemMonitor, LiveMonitor
+    from task_queue import get_queue_stats
+
+    print(colored(f"Monitor refresh against {args.hosts} healthy and {args.hung} hung Ollama host(s)", "cyan"))
+
+    serial = SystemMonitor()
+    serial.ollama_timeout = 5
+    round_trips, p50, _ = timed(lambda: serial_refresh(serial, get_queue_stats), args.cycles)
+    print(f"  serial status refresh:      {p50:8.1f} ms, {round_trips:.0f} Redis round-trips")
+
+    round_trips, p50, _ = timed(SystemMonitor().get_system_status, args.cycles)
+    print(f"  concurrent status refresh:  {p50:8.1f} ms, {round_trips:.0f} Redis round-trips")
+
+    # The live monitor checks Ollama on its own thread, so a hung host never delays a sample
+    live = LiveMonitor()
+    threading.Thread(target=live.watch_ollama, daemon=True).start()
+    round_trips, p50, p95 = timed(live.sample, args.samples)
+    live.stopped.set()
+    print(f"  live sample:                {p50:8.1f} ms (p95 {p95:.1f} ms), {round_trips:.0f} Redis round-trip(s)")
+    print(f"  live history: {len(live.samples)} samples, "
+          f"{(sys.getsizeof(live.samples) + sum(sys.getsizeof(sample) for sample in live.samples)) / 1024:.0f} KiB")
+
+    for stub in stubs:
+        stub.stop()
+    for listener, _ in hung:
+        listener.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import sys
+import os
+import time
+import argparse
+import statistics
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+
+def run_jobs(name, server, jobs, make_service):
+    server.requests = {}
+    server.connections = 0
+    durations = []
+
+    for _ in range(jobs):
+        started = time.perf_counter()
+        service = make_service()
+        service.ensure_model_ready()
+        service.generate_response("Hello!", "You are a helpful assistant.")
+        durations.append(time.perf_counter() - started)
+
+    print(colored(f"[{name}]", "cyan"))
+    print(f"  Mean per job: {statistics.mean(durations) * 1000:.2f} ms")
+    print(f"  Median per job: {statistics.median(durations) * 1000:.2f} ms")
+    print(f"  TCP connections: {server.connections}")
+    print(f"  Requests: {dict(sorted(server.requests.items()))}")
+    return statistics.mean(durations)
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-job Ollama client overhead against a stub server")
+    parser.add_argument("--jobs", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    server = StubOllamaServer(tokens=1).start()
+    host, port = server.server_address
+    os.environ['OLLAMA_HOST'] = host
+    os.environ['OLLAMA_PORT'] = str(port)
+    os.environ.setdefault('OLLAMA_MODEL', server.model)
+    server.model = os.environ['OLLAMA_MODEL']
+
+    import ai_service
+
+    cold = run_jobs("per-job OllamaService", server, args.jobs, ai_service.OllamaService)
+    warm = run_jobs("process-wide service", server, args.jobs, ai_service.get_ollama_service)
+
+    print(colored(f"Overhead removed per job: {(cold - warm) * 1000:.2f} ms", "green"))
+    server.stop()
+
+if __name__ == "__main__":
+    main()
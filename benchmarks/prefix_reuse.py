@@ -0,0 +1,114 @@
+import sys
+import os
+import time
+import random
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+
+MODES = {
+    'sliding': {'CONVERSATION_WINDOW_STEP': '2', 'ROUTER_AFFINITY_SLACK': '-1'},
+    'stable': {'CONVERSATION_WINDOW_STEP': '8', 'ROUTER_AFFINITY_SLACK': '-1'},
+    'stable+affinity': {'CONVERSATION_WINDOW_STEP': '8', 'ROUTER_AFFINITY_SLACK': '2'}
+}
+
+WORDS = "model kuyruk cevap soru bellek önbellek sohbet işlem zaman sunucu istek yanıt".split()
+
+def question(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)) + '?'
+
+def run_mode(mode, args):
+    os.environ.update(MODES[mode])
+    from ai_service import OllamaService
+    from conversation import ConversationStore
+    from prompts import DEFAULT_SYSTEM_PROMPT
+    from task_queue import redis_client
+
+    service = OllamaService()
+    store = ConversationStore(redis_client)
+    chat_ids = [900000 + i for i in range(args.chats)]
+    for chat_id in chat_ids:
+        store.reset(chat_id)
+
+    samples = []
+    lock = threading.Lock()
+
+    def converse(chat_id):
+        rng = random.Random(args.seed * 1000 + chat_id)
+        for _ in range(args.turns):
+            text = question(rng, args.question_words)
+            history = store.get_context(chat_id)
+            started = time.time()
+            result = service.generate_response(text, DEFAULT_SYSTEM_PROMPT, history=history,
+                                               options={'num_predict': args.tokens})
+            elapsed = time.time() - started
+            if not result['success']:
+                raise RuntimeError(result['error'])
+            store.append_exchange(chat_id, text, result['response'])
+            with lock:
+                samples.append((elapsed, result['prompt_tokens'], result['prompt_eval_duration'] / 1e9))
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(converse, chat_ids))
+    elapsed = time.time() - started
+
+    for chat_id in chat_ids:
+        store.reset(chat_id)
+
+    latencies = sorted(sample[0] for sample in samples)
+    return {
+        'mode': mode,
+        'turns': len(samples),
+        'elapsed': elapsed,
+        'evaluated_words': sum(sample[1] for sample in samples),
+        'prompt_eval': sum(sample[2] for sample in samples) / len(samples),
+        'p50': latencies[len(latencies) // 2],
+        'p95': latencies[int(len(latencies) * 0.95)]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt evaluation with sliding vs stable conversation prefixes against stub Ollama hosts with a prefix cache")
+    parser.add_argument("--chats", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=24)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hosts", type=int, default=2)
+    parser.add_argument("--cache-slots", type=int, default=8, help="Cached prefixes per stub host")
+    parser.add_argument("--tokens", type=int, default=40, help="Answer tokens")
+    parser.add_argument("--question-words", type=int, default=20)
+    parser.add_argument("--prompt-latency", type=float, default=0.0005, help="Seconds of prompt evaluation per evaluated word")
+    parser.add_argument("--token-latency", type=float, default=0.001)
+    parser.add_argument("--modes", default="sliding,stable,stable+affinity")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(colored(f"{args.chats} chats x {args.turns} turns on {args.hosts} stub host(s) "
+                  f"with {args.cache_slots} cached prefixes each", "cyan"))
+
+    for mode in args.modes.split(','):
+        hosts = [StubOllamaServer(tokens=args.tokens, token_latency=args.token_latency,
+                                  prompt_latency=args.prompt_latency, prefix_cache=args.cache_slots).start()
+                 for _ in range(args.hosts)]
+        os.environ['OLLAMA_HOSTS'] = ','.join(host.url for host in hosts)
+        os.environ.setdefault('OLLAMA_MODEL', hosts[0].model)
+        try:
+            result = run_mode(mode, args)
+        finally:
+            for host in hosts:
+                host.stop()
+
+        print(f"  {result['mode']:<16} prompt words evaluated {result['evaluated_words']:>7}  "
+              f"prompt eval {result['prompt_eval'] * 1000:6.1f} ms/turn  "
+              f"turn p50 {result['p50'] * 1000:6.1f} ms  p95 {result['p95'] * 1000:6.1f} ms  "
+              f"({result['turns']} turns in {result['elapsed']:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import sys
+import os
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import redis.connection
+from rq.utils import utcnow
+from termcolor import colored
+from compact_job import CompactJob, CompactSerializer
+from task_queue import (
+    redis_client,
+    task_queues,
+    interactive_queue,
+    fair_scheduler,
+    admission_controller,
+    process_ai_request,
+    get_jobs_status,
+    get_queue_stats,
+    COALESCED_COUNTER_KEY
+)
+
+class RoundTripCounter:
+    def __init__(self):
+        self.count = 0
+        self.send_packed_command = redis.connection.AbstractConnection.send_packed_command
+
+    def __enter__(self):
+        counter = self
+        original = self.send_packed_command
+
+        def counted(connection, command, check_health=True):
+            counter.count += 1
+            return original(connection, command, check_health)
+
+        redis.connection.AbstractConnection.send_packed_command = counted
+        return self
+
+    def __exit__(self, *exc_info):
+        redis.connection.AbstractConnection.send_packed_command = self.send_packed_command
+
+def per_job_status(job_id):
+    job = CompactJob.fetch(job_id, connection=redis_client, serializer=CompactSerializer)
+    status = {'job_id': job_id, 'status': job.get_status()}
+    if job.is_finished:
+        status['result'] = job.result
+    elif job.is_failed:
+        status['error'] = str(job.exc_info)
+    return status
+
+def per_call_queue_stats():
+    return {
+        'queue_length': sum(len(queue) + fair_scheduler.staged_count(queue) for queue in task_queues),
+        'failed_jobs': sum(len(queue.failed_job_registry) for queue in task_queues),
+        'finished_jobs': sum(len(queue.finished_job_registry) for queue in task_queues),
+        'started_jobs': sum(len(queue.started_job_registry) for queue in task_queues),
+        'deferred_jobs': sum(len(queue.deferred_job_registry) for queue in task_queues),
+        'coalesced_requests': int(redis_client.get(COALESCED_COUNTER_KEY) or 0),
+        'estimated_wait': admission_controller.estimate()['estimated_wait'],
+        'queues': {queue.name: len(queue) + fair_scheduler.staged_count(queue) for queue in task_queues},
+        'wait_times': fair_scheduler.wait_stats([queue.name for queue in task_queues]),
+    }
+
+def create_jobs(count):
+    job_ids = []
+    with redis_client.pipeline() as pipe:
+        for i in range(count):
+            job = interactive_queue.create_job(
+                process_ai_request,
+                args=(i, f"status benchmark {i}", None, i),
+                job_id=f"status_bench_{i}",
+                result_ttl=600
+            )
+            if i % 2:
+                job.started_at = utcnow()
+                job.ended_at = utcnow()
+                job._result = {'success': True, 'response': 'token ' * 50, 'user_id': i}
+                job._handle_success(600, pipeline=pipe)
+            else:
+                job.save(pipeline=pipe)
+            job_ids.append(job.id)
+        pipe.execute()
+    return job_ids
+
+def delete_jobs(job_ids):
+    with redis_client.pipeline() as pipe:
+        for job_id in job_ids:
+            pipe.delete(CompactJob.key_for(job_id))
+            pipe.zrem(interactive_queue.finished_job_registry.key, job_id)
+        pipe.execute()
+
+def measure(cycle, cycles):
+    with RoundTripCounter() as counter:
+        started = time.perf_counter()
+        for _ in range(cycles):
+            cycle()
+        elapsed = time.perf_counter() - started
+    return counter.count / cycles, elapsed / cycles * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis round-trips per monitor cycle: per-job reads vs pipelined reads")
+    parser.add_argument("--jobs", default="10,100,1000", help="Active job counts to test")
+    parser.add_argument("--cycles", type=int, default=20)
+    args = parser.parse_args()
+
+    print(colored("Round-trips and time per cycle (job statuses + queue stats)", "cyan"))
+    for count in [int(value) for value in args.jobs.split(',')]:
+        job_ids = create_jobs(count)
+        try:
+            per_job = measure(lambda: ([per_job_status(job_id) for job_id in job_ids], per_call_queue_stats()), args.cycles)
+            batched = measure(lambda: (get_jobs_status(job_ids), get_queue_stats()), args.cycles)
+        finally:
+            delete_jobs(job_ids)
+
+        print(f"  {count:>5} jobs: per-job {per_job[0]:7.0f} round-trips {per_job[1]:8.1f} ms | "
+              f"pipelined {batched[0]:4.0f} round-trips {batched[1]:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
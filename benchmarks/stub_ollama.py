@@ -0,0 +1,257 @@
+import json
+import zlib
+import contextlib
+import time
+import socket
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+KEEP_ALIVE_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+def parse_keep_alive(value):
+    if value is None:
+        return 300.0
+    if isinstance(value, str) and value[-1:] in KEEP_ALIVE_UNITS:
+        return float(value[:-1]) * KEEP_ALIVE_UNITS[value[-1]]
+    return float(value)
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.count_request(self.path)
+        if self.path == '/api/tags':
+            self.send_json({'models': [{'name': self.server.model}]})
+        elif self.path == '/api/ps':
+            self.send_json({'models': [{'name': self.server.model}] if self.server.is_loaded() else []})
+        else:
+            self.send_json({'error': 'not found'}, status=404)
+
+    def do_POST(self):
+        self.server.count_request(self.path)
+        request = self.read_body()
+
+        if self.path == '/api/show':
+            self.send_json({'details': {'parameter_size': '1.2B', 'family': 'llama'}})
+        elif self.path == '/api/chat':
+            self.handle_chat(request)
+        elif self.path == '/api/generate':
+            if not request.get('prompt') and parse_keep_alive(request.get('keep_alive')) == 0:
+                self.server.unload()
+                self.send_json({'model': request.get('model'), 'response': '', 'done': True})
+                return
+            with self.server.slot(request.get('keep_alive')) as load_duration:
+                self.send_json({'model': request.get('model'), 'response': '', 'done': True,
+                                'load_duration': int(load_duration * 1e9)})
+        elif self.path == '/api/embeddings':
+            self.send_json({'embedding': self.server.embed(request.get('prompt', ''))})
+        elif self.path == '/api/pull':
+            self.send_json({'status': 'success'})
+        else:
+            self.send_json({'error': 'not found'}, status=404)
+
+    def handle_chat(self, request):
+        with self.server.slot(request.get('keep_alive')) as load_duration:
+            self.generate_chat(request, load_duration)
+
+    def generate_chat(self, request, load_duration=0.0):
+        started = time.time()
+        tokens = min(self.server.tokens, (request.get('options') or {}).get('num_predict') or self.server.tokens)
+        messages = [(m.get('role'), m.get('content', '')) for m in request.get('messages', [])]
+        cached = self.server.cached_prefix(messages, 'token ' * tokens)
+        prompt_words = sum(len(content.split()) for _, content in messages[cached:])
+        final_chunk = {
+            'model': request.get('model'),
+            'done': True,
+            'eval_count': tokens,
+            'prompt_eval_count': prompt_words,
+            'load_duration': int(load_duration * 1e9)
+        }
+        time.sleep(self.server.prompt_latency * prompt_words)
+        final_chunk['prompt_eval_duration'] = int((time.time() - started) * 1e9)
+        generation_started = time.time()
+
+        if not request.get('stream', True):
+            time.sleep(self.server.token_latency * tokens)
+            final_chunk['message'] = {'role': 'assistant', 'content': 'token ' * tokens}
+            final_chunk['eval_duration'] = int((time.time() - generation_started) * 1e9)
+            final_chunk['total_duration'] = int((time.time() - started) * 1e9)
+            self.send_json(final_chunk)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_chunk(payload):
+            line = json.dumps(payload).encode() + b'\n'
+            self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+            self.wfile.flush()
+
+        for _ in range(tokens):
+            time.sleep(self.server.token_latency)
+            write_chunk({'model': request.get('model'), 'done': False,
+                         'message': {'role': 'assistant', 'content': 'token '}})
+
+        final_chunk['message'] = {'role': 'assistant', 'content': ''}
+        final_chunk['eval_duration'] = int((time.time() - generation_started) * 1e9)
+        final_chunk['total_duration'] = int((time.time() - started) * 1e9)
+        write_chunk(final_chunk)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, model='llama3.2:1b', tokens=20, token_latency=0.0, parallel=0,
+                 load_delay=0.0, prompt_latency=0.0, prefix_cache=0):
+        super().__init__((host, port), StubOllamaHandler)
+        self.model = model
+        self.tokens = tokens
+        self.token_latency = token_latency
+        self.parallel = threading.BoundedSemaphore(parallel) if parallel else None
+        self.load_delay = load_delay
+        self.prompt_latency = prompt_latency
+        self.prefix_cache = prefix_cache
+        self.cached_sequences = OrderedDict()
+        self.loaded_until = 0.0
+        self.loads = 0
+        self.load_lock = threading.Lock()
+        self.requests = {}
+        self.connections = 0
+        self.generating = 0
+        self.peak_generating = 0
+        self.lock = threading.Lock()
+
+    def is_loaded(self):
+        return self.generating > 0 or time.time() < self.loaded_until
+
+    def load_model(self):
+        with self.load_lock:
+            if self.is_loaded():
+                return 0.0
+            started = time.time()
+            time.sleep(self.load_delay)
+            self.loads += 1
+            self.loaded_until = float('inf')
+            self.cached_sequences.clear()
+            return time.time() - started
+
+    def embed(self, text, dim=256):
+        # Hashed bag of words: questions that share words get similar vectors
+        vector = [0.0] * dim
+        for word in text.lower().split():
+            digest = zlib.crc32(word.strip('?!.,').encode())
+            vector[digest % dim] += 1.0 if digest & 1 else -1.0
+        return vector
+
+    def unload(self):
+        with self.load_lock:
+            self.loaded_until = 0.0
+
+    def cached_prefix(self, messages, answer):
+        # Like Ollama's KV cache slots: the longest cached message prefix is not evaluated again, and a
+        # slot is taken over when most of it matches, otherwise the least recently used one is replaced
+        if not self.prefix_cache:
+            return 0
+        with self.lock:
+            best, best_key = 0, None
+            for key in self.cached_sequences:
+                length = 0
+                while length < min(len(key), len(messages)) and key[length] == messages[length]:
+                    length += 1
+                if length > best:
+                    best, best_key = length, key
+            if best_key is not None and best * 2 >= len(best_key):
+                del self.cached_sequences[best_key]
+            self.cached_sequences[tuple(messages) + (('assistant', answer),)] = True
+            while len(self.cached_sequences) > self.prefix_cache:
+                self.cached_sequences.popitem(last=False)
+            return best
+
+    @contextlib.contextmanager
+    def slot(self, keep_alive=None):
+        load_duration = self.load_model()
+        if self.parallel:
+            self.parallel.acquire()
+        with self.lock:
+            self.generating += 1
+            self.peak_generating = max(self.peak_generating, self.generating)
+        try:
+            yield load_duration
+        finally:
+            expiry = parse_keep_alive(keep_alive)
+            with self.lock:
+                self.generating -= 1
+                self.loaded_until = float('inf') if expiry < 0 else time.time() + expiry
+            if self.parallel:
+                self.parallel.release()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def get_request(self):
+        with self.lock:
+            self.connections += 1
+        return super().get_request()
+
+    def count_request(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stub Ollama HTTP server")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="llama3.2:1b")
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--parallel", type=int, default=0, help="Concurrent generations, like OLLAMA_NUM_PARALLEL (0 = unlimited)")
+    parser.add_argument("--load-delay", type=float, default=0.0, help="Seconds the first generation spends loading the model")
+    parser.add_argument("--prompt-latency", type=float, default=0.0, help="Seconds of prompt evaluation per prompt word")
+    parser.add_argument("--prefix-cache", type=int, default=0, help="Cached conversation prefixes, like Ollama's KV cache slots (0 = off)")
+    args = parser.parse_args()
+
+    server = StubOllamaServer(port=args.port, model=args.model, tokens=args.tokens,
+                              token_latency=args.token_latency, parallel=args.parallel,
+                              load_delay=args.load_delay, prompt_latency=args.prompt_latency,
+                              prefix_cache=args.prefix_cache)
+    print(f"Stub Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import sys
+import os
+import time
+import logging
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import telebot
+import telebot.apihelper
+from termcolor import colored
+from fake_telegram import FakeTelegramServer
+
+def answer_chunks(chat_id, answer, chunks):
+    return [f"chat {chat_id} answer {answer} part {part}" for part in range(chunks)]
+
+def build_deliveries(args):
+    return [
+        (answer % args.chats + 1, answer // args.chats, 1000 + answer)
+        for answer in range(args.answers)
+    ]
+
+def deliver_serially(bot, deliveries, chunks):
+    lost = 0
+    for chat_id, answer, processing_msg_id in deliveries:
+        try:
+            try:
+                bot.delete_message(chat_id, processing_msg_id)
+            except:
+                pass
+            for text in answer_chunks(chat_id, answer, chunks):
+                bot.send_message(chat_id, text)
+        except Exception:
+            lost += 1
+    return lost
+
+def deliver_through_outbox(bot, deliveries, chunks, edit_in_place):
+    from outbox import Outbox, is_bad_request
+
+    def edit_or_send(chat_id, message_id, text):
+        try:
+            return bot.edit_message_text(text, chat_id, message_id)
+        except Exception as e:
+            if not is_bad_request(e):
+                raise
+            return bot.send_message(chat_id, text)
+
+    def delete_quietly(chat_id, message_id):
+        try:
+            bot.delete_message(chat_id, message_id)
+        except Exception as e:
+            if getattr(e, 'error_code', None) == 429:
+                raise
+
+    outbox = Outbox().start()
+    last_sends = []
+    for chat_id, answer, processing_msg_id in deliveries:
+        texts = answer_chunks(chat_id, answer, chunks)
+        if edit_in_place:
+            sent = outbox.submit(chat_id, edit_or_send, chat_id, processing_msg_id, texts[0])
+            texts = texts[1:]
+        else:
+            outbox.submit(chat_id, delete_quietly, chat_id, processing_msg_id)
+        for text in texts:
+            sent = outbox.submit(chat_id, bot.send_message, chat_id, text)
+        last_sends.append(sent)
+
+    lost = 0
+    for sent in last_sends:
+        try:
+            sent.result()
+        except Exception:
+            lost += 1
+    return lost
+
+def out_of_order_chats(telegram):
+    last_seen = {}
+    broken = set()
+    for _, _, chat_id, text in telegram.outbox:
+        words = text.split()
+        position = (int(words[3]), int(words[5]))
+        if position < last_seen.get(chat_id, (-1, -1)):
+            broken.add(chat_id)
+        last_seen[chat_id] = position
+    return len(broken)
+
+def run_mode(mode, args):
+    telegram = FakeTelegramServer(send_latency=args.send_latency, flood_ratio=args.flood_ratio,
+                                  chat_limit=args.chat_limit, flood_wait=args.flood_wait, seed=args.seed).start()
+    telebot.apihelper.API_URL = telegram.api_url
+    bot = telebot.TeleBot('123456:OUTBOX')
+    deliveries = build_deliveries(args)
+
+    started = time.time()
+    if mode == 'serial':
+        lost = deliver_serially(bot, deliveries, args.chunks)
+    else:
+        lost = deliver_through_outbox(bot, deliveries, args.chunks, edit_in_place=mode == 'outbox-edit')
+    elapsed = time.time() - started
+    telegram.stop()
+
+    return {
+        'mode': mode,
+        'elapsed': elapsed,
+        'delivered': len(deliveries) - lost,
+        'lost': lost,
+        'calls': sum(count for method, count in telegram.calls.items() if method != 'getMe'),
+        'flood_waits': telegram.flood_waits,
+        'out_of_order': out_of_order_chats(telegram)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer delivery through a flood-limited fake Telegram API: serial sends vs the outbox")
+    parser.add_argument("--answers", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=2, help="Messages per answer")
+    parser.add_argument("--send-latency", type=float, default=0.03, help="Fake Telegram API latency in seconds")
+    parser.add_argument("--flood-ratio", type=float, default=0.1, help="Share of calls answered with 429")
+    parser.add_argument("--chat-limit", type=int, default=2, help="Calls per chat per second before 429")
+    parser.add_argument("--flood-wait", type=int, default=1, help="retry_after returned with 429")
+    parser.add_argument("--workers", type=int, default=8, help="Outbox sender threads")
+    parser.add_argument("--global-rate", type=float, default=30, help="Outbox global sends per second")
+    parser.add_argument("--modes", default="serial,outbox-delete,outbox-edit")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ['OUTBOX_WORKERS'] = str(args.workers)
+    os.environ['OUTBOX_GLOBAL_RATE'] = str(args.global_rate)
+    logging.disable(logging.WARNING)
+
+    print(colored(f"{args.answers} answers of {args.chunks} messages to {args.chats} chats, "
+                  f"{args.flood_ratio:.0%} random 429s, {args.chat_limit} calls/s per chat", "cyan"))
+    for mode in args.modes.split(','):
+        result = run_mode(mode, args)
+        print(f"  {result['mode']:<14} {result['delivered'] / result['elapsed']:6.1f} answers/s  "
+              f"delivered {result['delivered']:>4}  lost {result['lost']:>4}  "
+              f"API calls {result['calls']:>5}  429s {result['flood_waits']:>4}  "
+              f"chats out of order {result['out_of_order']}  ({result['elapsed']:.1f}s)")
+
+if __name__ == "__main__":
+    main()
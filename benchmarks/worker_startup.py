@@ -0,0 +1,84 @@
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from rq import Worker
+from termcolor import colored
+from stub_ollama import StubOllamaServer
+from task_queue import redis_client, enqueue_ai_request, JOB_EVENTS_CHANNEL
+
+def wait_for_worker(worker, baseline, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if Worker.count(connection=redis_client) > baseline:
+            return True
+        if worker.poll() is not None:
+            return False
+        time.sleep(0.1)
+    return False
+
+def run_sequential_jobs(jobs):
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(JOB_EVENTS_CHANNEL)
+    latencies = []
+
+    for i in range(jobs):
+        started = time.time()
+        job_id = enqueue_ai_request(200000 + i, f"startup question {i} {started}", chat_id=200000 + i)
+        deadline = started + 60
+        while time.time() < deadline:
+            message = pubsub.get_message(timeout=deadline - time.time())
+            if message is None:
+                continue
+            event = json.loads(message['data'])
+            if event['job_id'] == job_id and event['status'] in ('finished', 'failed'):
+                latencies.append(time.time() - started)
+                break
+
+    pubsub.close()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-job start-up overhead of forking vs long-lived workers")
+    parser.add_argument("--mode", choices=["rq", "simple", "pool"], default="simple")
+    parser.add_argument("--jobs", type=int, default=50)
+    parser.add_argument("--load-delay", type=float, default=2.0, help="Seconds the stub spends loading the model")
+    args = parser.parse_args()
+
+    ollama = StubOllamaServer(tokens=1, load_delay=args.load_delay).start()
+    env = dict(os.environ, WORKER_MODE=args.mode, CONVERSATION_ENABLED='False')
+    env['OLLAMA_HOST'], env['OLLAMA_PORT'] = ollama.server_address[0], str(ollama.server_address[1])
+    env.setdefault('OLLAMA_MODEL', ollama.model)
+    ollama.model = env['OLLAMA_MODEL']
+
+    os.makedirs(os.path.join(ROOT, 'logs'), exist_ok=True)
+    baseline = Worker.count(connection=redis_client)
+    worker = subprocess.Popen([sys.executable, 'worker.py'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready_started = time.time()
+        wait_for_worker(worker, baseline)
+        ready = time.time() - ready_started
+        latencies = run_sequential_jobs(args.jobs)
+    finally:
+        worker.terminate()
+        worker.wait()
+        ollama.stop()
+
+    steady = latencies[1:] or latencies
+    print(colored(f"[{args.mode} worker] {len(latencies)} sequential jobs", "cyan"))
+    print(f"  Worker ready after: {ready:.2f}s")
+    print(f"  First job: {latencies[0] * 1000:.1f} ms" if latencies else "  First job: no answer")
+    print(f"  Later jobs mean: {statistics.mean(steady) * 1000:.1f} ms")
+    print(f"  Later jobs median: {statistics.median(steady) * 1000:.1f} ms")
+    print(f"  Ollama requests: {dict(sorted(ollama.requests.items()))}")
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,46 @@
+import io
 import sys
+import math
 import time
+import json
 import logging
 import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from termcolor import colored
 import telebot
 from decouple import config
-from task_queue import enqueue_ai_request, get_job_status, get_queue_stats, clear_finished_jobs
+from task_queue import (
+    redis_client,
+    enqueue_ai_request,
+    get_jobs_status,
+    get_queue_stats,
+    cancel_ai_request,
+    clear_finished_jobs,
+    reset_conversation,
+    conversation_store,
+    rate_limiter,
+    admission_controller,
+    generation_budget,
+    JOB_EVENTS_CHANNEL,
+    DEFAULT_SYSTEM_PROMPT
+)
+from response_cache import ResponseCache, make_cache_key
+from faq_index import FaqIndex
+from job_state import PendingJobStore
+from delivery_journal import DeliveryJournal
+from outbox import Outbox, FollowUp, retry_after, is_bad_request, is_not_modified
+from splitter import MessageSplitter, split_message, render_html
+from metrics import (
+    ENQUEUE_LATENCY,
+    END_TO_END_LATENCY,
+    REJECTED_REQUESTS,
+    ERRORS,
+    QueueCollector,
+    start_metrics_server,
+    instrument_telebot
+)
 
-class TelegramBot:
-    def __init__(self):
-        self.API_TOKEN = config("API_TOKEN", cast=str)
-        self.bot = telebot.TeleBot(self.API_TOKEN)
-        
-        self.active_jobs = {}
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('logs/bot.log'),
-                logging.StreamHandler(sys.stdout)
-            ]
-        )
-        self.logger = logging.getLogger(__name__)
-        
-        self.register_handlers()
-        
-        self.start_job_monitor()
-
-    def register_handlers(self):
-        @self.bot.message_handler(commands=['start'])
-        def send_welcome(message):
-            welcome_text = """
+WELCOME_TEXT = """
 🤖 *Welcome to AI Chat Bot!*
 
 This bot answers your questions using the Ollama AI model.
@@ -42,15 +51,14 @@ This bot answers your questions using the Ollama AI model.
 • `/stats` - Queue statistics
 • `/model` - Model information
 • `/clear` - Clear completed jobs
+• `/reset` - Forget the conversation history
+• `/cancel` - Cancel your pending question
 
 💬 *Usage:*
 Type any question and wait for the AI response!
-            """
-            self.bot.reply_to(message, welcome_text, parse_mode='Markdown')
+"""
 
-        @self.bot.message_handler(commands=['help'])
-        def send_help(message):
-            help_text = """
+HELP_TEXT = """
 🆘 *Help*
 
 This bot answers your questions using the AI model.
@@ -62,18 +70,20 @@ This bot answers your questions using the AI model.
 4. The response is sent to you
 
 ⏱️ *Wait Times:*
-• Normal: 5-30 seconds
-• Busy times: 1-3 minutes
+• Answers take longer and get shorter as the queue grows
+• Check the current expected answer time with `/stats`
 
 ❓ *Having issues?* Try again or check the status with `/stats`.
-            """
-            self.bot.reply_to(message, help_text, parse_mode='Markdown')
+"""
 
-        @self.bot.message_handler(commands=['stats'])
-        def send_stats(message):
-            try:
-                stats = get_queue_stats()
-                stats_text = f"""
+def format_wait_times(stats):
+    return "\n".join(
+        f"⏳ {name}: {stats.get('queues', {}).get(name, 0)} queued, p99 wait {wait['p99']:.1f}s"
+        for name, wait in stats.get('wait_times', {}).items()
+    )
+
+def format_stats_text(stats, cache_stats, active_jobs_count, faq_stats=None):
+    return f"""
 📊 *Queue Statistics*
 
 🔄 Pending jobs: {stats.get('queue_length', 0)}
@@ -81,9 +91,148 @@ This bot answers your questions using the AI model.
 ❌ Failed jobs: {stats.get('failed_jobs', 0)}
 🏃 Running jobs: {stats.get('started_jobs', 0)}
 ⏸️ Deferred jobs: {stats.get('deferred_jobs', 0)}
+🔗 Coalesced requests: {stats.get('coalesced_requests', 0)}
+⏱️ Estimated wait: {stats.get('estimated_wait', 0):.0f}s
+🕒 Expected answer time: {stats.get('answer_eta', 0):.0f}s
+✂️ Answer budget: {stats.get('output_budget', 0)} tokens at {stats.get('tokens_per_second', 0):.1f} tokens/s
+
+{format_wait_times(stats)}
 
-👤 Active user jobs: {len(self.active_jobs)}
-                """
+👤 Active user jobs: {active_jobs_count}
+
+💾 Cache hits: {cache_stats['hits']}
+🔍 Cache misses: {cache_stats['misses']}
+📈 Hit rate: {cache_stats['hit_rate']:.0%}
+📦 Cached answers: {cache_stats['size']}
+{format_faq_stats(faq_stats)}"""
+
+def format_faq_stats(faq_stats):
+    if not faq_stats:
+        return ""
+    return f"🧭 FAQ answers: {faq_stats['hits']} of {faq_stats['hits'] + faq_stats['misses']} lookups, {faq_stats['size']} indexed\n"
+
+def format_model_info_text(model_info):
+    if not model_info['success']:
+        return f"❌ Could not retrieve model information: {model_info.get('error', 'Unknown error')}"
+    
+    return f"""
+🧠 *AI Model Information*
+
+📝 Model: `{model_info['model']}`
+👥 Parameters: {model_info['parameters']}
+📏 Size: {model_info['size']}
+🏷️ Family: {model_info['family']}
+"""
+
+def rate_limited_text(wait_seconds):
+    return f"🚦 You are sending messages too quickly. Please try again in {math.ceil(wait_seconds)} seconds."
+
+def overloaded_text(admission):
+    return (
+        f"🚧 The bot is very busy right now (estimated wait ~{math.ceil(admission['estimated_wait'])}s). "
+        "Please try again in a few minutes."
+    )
+
+def thinking_text(admission, budget):
+    if admission['notify']:
+        return f"🤔 Thinking... Please wait.\n⏳ Expected answer in ~{math.ceil(budget['eta'])}s"
+    return "🤔 Thinking... Please wait."
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_plain(self, status, body=b"ok"):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_plain(200)
+        else:
+            self.send_plain(404, b"not found")
+
+    def do_POST(self):
+        telegram_bot = self.server.telegram_bot
+        
+        if self.path != telegram_bot.webhook_path:
+            self.send_plain(404, b"not found")
+            return
+        
+        if telegram_bot.webhook_secret and \
+                self.headers.get('X-Telegram-Bot-Api-Secret-Token') != telegram_bot.webhook_secret:
+            self.send_plain(403, b"forbidden")
+            return
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            update = telebot.types.Update.de_json(self.rfile.read(length).decode('utf-8'))
+            telegram_bot.bot.process_new_updates([update])
+            self.send_plain(200)
+        except Exception as e:
+            telegram_bot.logger.error(f"Webhook update error: {e}")
+            self.send_plain(500, b"error")
+
+class TelegramBot:
+    def __init__(self):
+        self.API_TOKEN = config("API_TOKEN", cast=str)
+        self.bot = telebot.TeleBot(self.API_TOKEN)
+        
+        self.pending_jobs = PendingJobStore(redis_client)
+        self.delivery_journal = DeliveryJournal(redis_client, self.pending_jobs.consumer)
+        self.active_jobs = {}
+        self.job_owners = {}
+        self.early_events = {}
+        self.local_deliveries = {}
+        self.jobs_lock = threading.Lock()
+        self.job_sweep_interval = config("JOB_SWEEP_INTERVAL", default=30, cast=int)
+        self.delivery_grace = config("DELIVERY_GRACE", default=3, cast=float)
+        self.supersede_pending = config("SUPERSEDE_PENDING", default=False, cast=bool)
+        self.bot_mode = config("BOT_MODE", default="polling")
+        self.webhook_path = config("WEBHOOK_PATH", default="/telegram")
+        self.webhook_secret = config("WEBHOOK_SECRET", default="")
+        self.response_cache = ResponseCache()
+        self.model_name = config("OLLAMA_MODEL")
+        self.faq_index = FaqIndex(f"{self.model_name}\x00{DEFAULT_SYSTEM_PROMPT}")
+        self.outbox = Outbox()
+        self.edit_in_place = config("EDIT_IN_PLACE", default=True, cast=bool)
+        self.stream_edit_interval = config("STREAM_EDIT_INTERVAL", default=1.5, cast=float)
+        self.stream_max_edits_per_second = config("STREAM_MAX_EDITS_PER_SECOND", default=20, cast=int)
+        self.parse_mode = 'HTML' if config("ANSWER_HTML", default=False, cast=bool) else None
+        self.document_after = config("DOCUMENT_AFTER_MESSAGES", default=3, cast=int)
+        
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=[
+                logging.FileHandler('logs/bot.log'),
+                logging.StreamHandler(sys.stdout)
+            ]
+        )
+        self.logger = logging.getLogger(__name__)
+        
+        self.register_handlers()
+        
+        self.start_job_monitor()
+
+    def register_handlers(self):
+        @self.bot.message_handler(commands=['start'])
+        def send_welcome(message):
+            self.bot.reply_to(message, WELCOME_TEXT, parse_mode='Markdown')
+
+        @self.bot.message_handler(commands=['help'])
+        def send_help(message):
+            self.bot.reply_to(message, HELP_TEXT, parse_mode='Markdown')
+
+        @self.bot.message_handler(commands=['stats'])
+        def send_stats(message):
+            try:
+                stats = get_queue_stats()
+                cache_stats = self.response_cache.stats()
+                stats_text = format_stats_text(stats, cache_stats, self.pending_jobs.count(), self.faq_index.stats())
                 self.bot.reply_to(message, stats_text, parse_mode='Markdown')
             except Exception as e:
                 self.bot.reply_to(message, f"Error getting statistics: {str(e)}")
@@ -91,22 +240,11 @@ This bot answers your questions using the AI model.
         @self.bot.message_handler(commands=['model'])
         def send_model_info(message):
             try:
-                from ai_service import OllamaService
-                ai_service = OllamaService()
+                from ai_service import get_ollama_service
+                ai_service = get_ollama_service()
                 model_info = ai_service.get_model_info()
                 
-                if model_info['success']:
-                    info_text = f"""
-🧠 *AI Model Information*
-
-📝 Model: `{model_info['model']}`
-👥 Parameters: {model_info['parameters']}
-📏 Size: {model_info['size']}
-🏷️ Family: {model_info['family']}
-                    """
-                else:
-                    info_text = f"❌ Could not retrieve model information: {model_info.get('error', 'Unknown error')}"
-                
+                info_text = format_model_info_text(model_info)
                 self.bot.reply_to(message, info_text, parse_mode='Markdown')
             except Exception as e:
                 self.bot.reply_to(message, f"Error getting model information: {str(e)}")
@@ -119,142 +257,584 @@ This bot answers your questions using the AI model.
             except Exception as e:
                 self.bot.reply_to(message, f"❌ Job clearing error: {str(e)}")
 
+        @self.bot.message_handler(commands=['reset'])
+        def reset_history(message):
+            try:
+                reset_conversation(message.chat.id)
+                self.bot.reply_to(message, "🧹 Conversation history cleared!")
+            except Exception as e:
+                self.bot.reply_to(message, f"❌ Conversation reset error: {str(e)}")
+
+        @self.bot.message_handler(commands=['cancel'])
+        def cancel_request(message):
+            try:
+                if not self.cancel_user_job(message.from_user.id, "🛑 Your question was cancelled."):
+                    self.bot.reply_to(message, "ℹ️ You have no pending question to cancel.")
+            except Exception as e:
+                self.bot.reply_to(message, f"❌ Cancel error: {str(e)}")
+
         @self.bot.message_handler(func=lambda message: True)
         def handle_message(message):
             user_id = message.from_user.id
             message_text = message.text
+            received_at = time.time()
             
             try:
-                if user_id in self.active_jobs:
+                wait_seconds = rate_limiter.acquire(user_id, message.chat.id)
+                if wait_seconds:
+                    REJECTED_REQUESTS.labels('rate_limited').inc()
+                    self.bot.reply_to(message, rate_limited_text(wait_seconds))
+                    return
+                
+                if not self.acquire_user(user_id):
+                    REJECTED_REQUESTS.labels('busy').inc()
+                    rate_limiter.refund(user_id, message.chat.id)
                     self.bot.reply_to(
                         message, 
                         "⏳ Your previous question is still being processed. Please wait..."
                     )
                     return
+            except Exception as e:
+                self.logger.error(f"Message processing error: {e}")
+                self.bot.reply_to(message, "❌ An error occurred. Please try again.")
+                return
+            
+            try:
+                cache_key = self.get_cache_key(message)
+                faq_vector = None
+                if cache_key:
+                    source = 'cache'
+                    cached_response = self.response_cache.get(cache_key)
+                    if cached_response is None and self.faq_index.enabled:
+                        source = 'faq'
+                        cached_response, faq_vector = self.faq_index.lookup(message_text)
+                        if cached_response is not None:
+                            self.response_cache.put(cache_key, cached_response)
+                    if cached_response is not None:
+                        self.send_cached_response(message, cached_response)
+                        self.pending_jobs.release_user(user_id)
+                        END_TO_END_LATENCY.labels(source).observe(time.time() - received_at)
+                        return
+                
+                admission = admission_controller.check()
+                if not admission['admitted']:
+                    self.logger.warning(f"Request rejected for user {user_id}: queue {admission['queue_length']}, estimated wait {admission['estimated_wait']:.0f}s")
+                    self.pending_jobs.release_user(user_id)
+                    REJECTED_REQUESTS.labels('overloaded').inc()
+                    self.bot.reply_to(message, overloaded_text(admission))
+                    return
                 
-                processing_msg = self.bot.reply_to(
-                    message, 
-                    "🤔 Thinking... Please wait."
-                )
+                budget = generation_budget.plan(admission, message_text)
+                processing_msg = self.bot.reply_to(message, thinking_text(admission, budget))
                 
-                job_id = enqueue_ai_request(user_id, message_text)
+                start_time = time.time()
+                job_id = enqueue_ai_request(
+                    user_id,
+                    message_text,
+                    chat_id=message.chat.id,
+                    coalesce_key=cache_key,
+                    budget=budget
+                )
+                ENQUEUE_LATENCY.observe(time.time() - start_time)
                 
-                self.active_jobs[user_id] = {
+                self.track_job(user_id, {
                     'job_id': job_id,
+                    'user_id': user_id,
+                    'message_text': message_text,
                     'message_id': message.message_id,
                     'processing_msg_id': processing_msg.message_id,
                     'chat_id': message.chat.id,
-                    'start_time': time.time()
-                }
+                    'start_time': start_time,
+                    'deadline': start_time + budget['expires_in'],
+                    'received_at': received_at,
+                    'cache_key': cache_key,
+                    'faq_vector': faq_vector
+                })
                 
                 self.logger.info(f"AI request enqueued for user {user_id}: {job_id}")
                 
             except Exception as e:
                 self.logger.error(f"Message processing error: {e}")
+                self.pending_jobs.release_user(user_id)
                 self.bot.reply_to(
                     message, 
                     "❌ An error occurred. Please try again."
                 )
 
+    def acquire_user(self, user_id):
+        if self.pending_jobs.acquire_user(user_id):
+            return True
+        return (
+            self.supersede_pending
+            and self.cancel_user_job(user_id, "↪️ Replaced by your newer question.")
+            and self.pending_jobs.acquire_user(user_id)
+        )
+
+    def cancel_user_job(self, user_id, notice):
+        job_id = self.pending_jobs.active_job(user_id)
+        if job_id is None:
+            return False
+
+        job_info = self.pending_jobs.claim_user(job_id, user_id)
+        if job_info is None:
+            return False
+
+        job_info = self.forget_local_job(job_id, user_id) or job_info
+        self.cancel_job(job_id)
+        self.replace_processing_message(job_info, notice)
+
+        self.logger.info(f"Job {job_id} cancelled for user {user_id}")
+        return True
+
+    def cancel_job(self, job_id):
+        try:
+            if self.pending_jobs.waiters(job_id):
+                return
+            outcome = cancel_ai_request(job_id)
+            self.logger.info(f"Cancel requested for job {job_id}: {outcome}")
+        except Exception as e:
+            self.logger.error(f"Job cancel error for {job_id}: {e}")
+
+    def get_cache_key(self, message):
+        if conversation_store.has_history(message.chat.id):
+            return None
+        return make_cache_key(message.text, DEFAULT_SYSTEM_PROMPT, self.model_name)
+
+    def send_cached_response(self, message, response_text):
+        chat_id = message.chat.id
+        
+        chunks = split_message(response_text) or [response_text]
+        sent = self.outbox.submit(chat_id, self.bot.send_message, chat_id, self.format_answer(chunks[0]),
+                                  parse_mode=self.parse_mode)
+        self.send_remaining_chunks(chat_id, chunks, response_text, sent)
+        
+        try:
+            conversation_store.append_exchange(chat_id, message.text, response_text)
+        except Exception as e:
+            self.logger.error(f"Conversation update error for cached response: {e}")
+        
+        self.logger.info(f"Cached AI response sent for user {message.from_user.id}")
+
+    def track_job(self, user_id, job_info):
+        job_id = job_info['job_id']
+        self.pending_jobs.track(user_id, job_info)
+        
+        with self.jobs_lock:
+            self.active_jobs[user_id] = job_info
+            self.job_owners.setdefault(job_id, set()).add(user_id)
+            early_event = self.early_events.get(job_id)
+        
+        if early_event:
+            self.deliver_job(job_id, early_event)
+
+    def forget_local_job(self, job_id, user_id):
+        with self.jobs_lock:
+            owners = self.job_owners.get(job_id, set())
+            owners.discard(user_id)
+            if not owners:
+                self.job_owners.pop(job_id, None)
+            
+            job_info = self.active_jobs.get(user_id)
+            if job_info is not None and job_info['job_id'] == job_id:
+                return self.active_jobs.pop(user_id)
+            return None
+
+    def dispatch_job_event(self, event):
+        job_id = event.get('job_id')
+        
+        if event['status'] == 'streaming':
+            self.apply_stream_event(event)
+            return
+        
+        if event['status'] not in ('finished', 'failed'):
+            return
+        
+        with self.jobs_lock:
+            is_local = job_id in self.job_owners
+            if not is_local:
+                self.early_events[job_id] = event
+        
+        if is_local:
+            self.deliver_job(job_id, event)
+
+    def deliver_job(self, job_id, event):
+        for user_id, job_info in self.pending_jobs.claim_job(job_id):
+            self.deliver_user(job_id, user_id, job_info, event)
+
+    def deliver_user(self, job_id, user_id, job_info, event):
+        job_info = self.forget_local_job(job_id, user_id) or job_info
+        with self.jobs_lock:
+            self.local_deliveries[job_id] = self.local_deliveries.get(job_id, 0) + 1
+        
+        if event['status'] == 'finished' and 'result' in event:
+            sent = self.handle_job_completion(user_id, job_info, event['result'])
+        else:
+            sent = self.handle_job_failure(user_id, job_info, event.get('error', 'Unknown error'))
+        
+        # The claim is settled once the last message went out, so a crash before that replays the delivery
+        settle = lambda sent=None: self.settle_delivery(job_id, user_id, event.get('delivery_id'), sent)
+        if sent is None:
+            settle()
+        else:
+            sent.add_done_callback(settle)
+        
+        self.logger.info(
+            f"Job {job_id} delivered to user {user_id} in {time.time() - job_info['start_time']:.2f}s "
+            f"({time.time() - event.get('published_at', time.time()):.3f}s after completion)"
+        )
+
+    def settle_delivery(self, job_id, user_id, delivery_id, sent=None):
+        with self.jobs_lock:
+            self.local_deliveries[job_id] -= 1
+            if not self.local_deliveries[job_id]:
+                del self.local_deliveries[job_id]
+        
+        if sent is not None and (sent.cancelled() or sent.exception() is not None):
+            # The claim and journal entry stay in place, so the lease takeover retries the delivery
+            self.logger.warning(f"Delivery of job {job_id} to user {user_id} failed, leaving it for a retry")
+            return
+        
+        try:
+            if not self.pending_jobs.settle(job_id, user_id) and delivery_id:
+                self.delivery_journal.ack([delivery_id])
+        except Exception as e:
+            self.logger.error(f"Delivery settle error for job {job_id}: {e}")
+
+    def resolve_deliveries(self, entries):
+        # Journal entries inside the grace period are left to the pub/sub path and returned for a later pass
+        now = time.time()
+        waiting, stale, events = [], [], {}
+        with self.jobs_lock:
+            for entry_id, event in entries:
+                if event is None:
+                    stale.append(entry_id)
+                elif now - event['published_at'] < self.delivery_grace:
+                    waiting.append((entry_id, event))
+                elif event['job_id'] not in self.local_deliveries:
+                    events[event['job_id']] = event
+        
+        for job_id, (claims, delivering) in self.pending_jobs.recover(list(events)).items():
+            if not claims and not delivering:
+                # Nobody is waiting for this answer any more, or it already went out
+                stale.append(events[job_id]['delivery_id'])
+            for user_id, job_info in claims:
+                self.deliver_user(job_id, user_id, job_info, events[job_id])
+        
+        self.delivery_journal.ack(stale)
+        return waiting
+
+    def replay_deliveries(self):
+        # Walks this consumer's unacknowledged entries, including those left behind by a previous run
+        waiting = []
+        after = '0'
+        while True:
+            entries = self.delivery_journal.pending(after)
+            if not entries:
+                return waiting
+            after = entries[-1][0]
+            waiting.extend(self.resolve_deliveries(entries))
+
+    def claim_orphaned_events(self):
+        now = time.time()
+        
+        with self.jobs_lock:
+            due_events = [
+                event for event in self.early_events.values()
+                if now - event.get('published_at', now) >= self.delivery_grace
+            ]
+            for event in due_events:
+                del self.early_events[event['job_id']]
+        
+        for event in due_events:
+            self.deliver_job(event['job_id'], event)
+
+    def apply_stream_event(self, event):
+        with self.jobs_lock:
+            for user_id in self.job_owners.get(event['job_id'], ()):
+                job_info = self.active_jobs.get(user_id)
+                if job_info is None or job_info.get('stream_broken'):
+                    continue
+                
+                if 'stream' not in job_info:
+                    job_info['stream'] = MessageSplitter(max_chunks=self.document_after)
+                if event['offset'] != job_info['stream'].length:
+                    job_info['stream_broken'] = True
+                    continue
+                
+                job_info['stream'].feed(event['text'])
+
+    def render_stream(self, job_info, chunks, final=False):
+        if job_info.get('stream_final'):
+            return
+        
+        chat_id = job_info['chat_id']
+        message_ids = job_info.setdefault('stream_message_ids', [job_info['processing_msg_id']])
+        shown = job_info.setdefault('stream_segments', {})
+        
+        called = False
+        for index, chunk, sealed in chunks:
+            text = self.format_answer(chunk).strip()
+            if shown.get(index) is True:
+                continue
+            
+            if shown.get(index) != text:
+                if called:
+                    # The outbox paces every request, so the remaining segments go out on its next turns
+                    return FollowUp(self.render_stream, job_info, chunks, final)
+                called = True
+                if index < len(message_ids):
+                    self.edit_stream_message(text, chat_id, message_ids[index])
+                else:
+                    sent = self.bot.send_message(chat_id, text, parse_mode=self.parse_mode)
+                    message_ids.append(sent.message_id)
+                    self.pending_jobs.update(job_info['user_id'], job_info)
+            
+            # Sealed chunks are final; only the last, growing chunk is kept for comparison
+            shown[index] = True if sealed else text
+            if sealed and 'stream' in job_info:
+                with self.jobs_lock:
+                    job_info['stream'].delivered(index)
+        
+        # Set only after every segment went out, so a retried render picks up where it stopped
+        job_info['stream_final'] = final
+        
+        if 'first_edit_time' not in job_info:
+            job_info['first_edit_time'] = time.time()
+            self.logger.info(
+                f"First tokens shown for job {job_info['job_id']} "
+                f"after {job_info['first_edit_time'] - job_info['start_time']:.2f}s"
+            )
+
+    def edit_stream_message(self, text, chat_id, message_id):
+        try:
+            self.bot.edit_message_text(text, chat_id, message_id, parse_mode=self.parse_mode)
+        except Exception as e:
+            if not is_not_modified(e):
+                raise
+
+    def flush_streams(self):
+        now = time.time()
+        edit_budget = max(1, int(self.stream_max_edits_per_second * self.stream_edit_interval))
+        
+        with self.jobs_lock:
+            dirty_jobs = sorted((
+                job_info for job_info in self.active_jobs.values()
+                if 'stream' in job_info and job_info['stream'].total()
+                and job_info.get('stream_rendered') != job_info['stream'].length
+                and now - job_info.get('stream_edited_at', 0) >= self.stream_edit_interval
+                and not job_info.get('stream_queued')
+            ), key=lambda job_info: job_info.get('stream_edited_at', 0))[:edit_budget]
+            renders = [(job_info, job_info['stream'].chunks(), job_info['stream'].length) for job_info in dirty_jobs]
+        
+        for job_info, chunks, length in renders:
+            job_info['stream_queued'] = True
+            future = self.outbox.submit(job_info['chat_id'], self.render_stream, job_info, chunks)
+            future.add_done_callback(lambda _, job_info=job_info: job_info.pop('stream_queued', None))
+            job_info['stream_rendered'] = length
+            job_info['stream_edited_at'] = time.time()
+
+    def reconcile_active_jobs(self):
+        statuses = get_jobs_status(self.pending_jobs.pending_job_ids())
+        for job_id, status in statuses.items():
+            if status['status'] in ('finished', 'failed'):
+                self.deliver_job(job_id, status)
+
     def start_job_monitor(self):
-        def monitor_jobs():
+        self.outbox.start()
+        
+        def listen_job_events():
             while True:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
                 try:
-                    completed_jobs = []
+                    pubsub.subscribe(JOB_EVENTS_CHANNEL)
+                    self.reconcile_active_jobs()
                     
-                    for user_id, job_info in self.active_jobs.items():
-                        job_id = job_info['job_id']
-                        status = get_job_status(job_id)
-                        
-                        if status['status'] == 'finished' and 'result' in status:
-                            result = status['result']
-                            self.handle_job_completion(user_id, job_info, result)
-                            completed_jobs.append(user_id)
+                    for message in pubsub.listen():
+                        try:
+                            self.dispatch_job_event(json.loads(message['data']))
+                        except Exception as e:
+                            self.logger.error(f"Job event handling error: {e}")
                             
-                        elif status['status'] == 'failed':
-                            error_msg = status.get('error', 'Unknown error')
-                            self.handle_job_failure(user_id, job_info, error_msg)
-                            completed_jobs.append(user_id)
-                            
-                        elif time.time() - job_info['start_time'] > 300:
+                except Exception as e:
+                    self.logger.error(f"Job event listener error: {e}")
+                    time.sleep(5)
+                finally:
+                    pubsub.close()
+        
+        def sweep_jobs():
+            while True:
+                time.sleep(self.job_sweep_interval)
+                
+                try:
+                    self.reconcile_active_jobs()
+                    for job_id, user_id in self.pending_jobs.expired():
+                        job_info = self.pending_jobs.claim_user(job_id, user_id)
+                        if job_info is not None:
+                            job_info = self.forget_local_job(job_id, user_id) or job_info
+                            self.cancel_job(job_id)
                             self.handle_job_timeout(user_id, job_info)
-                            completed_jobs.append(user_id)
-                    
-                    for user_id in completed_jobs:
-                        if user_id in self.active_jobs:
-                            del self.active_jobs[user_id]
-                    
-                    time.sleep(2)
-                    
+                            
+                except Exception as e:
+                    self.logger.error(f"Job sweep error: {e}")
+        
+        listener_thread = threading.Thread(target=listen_job_events, daemon=True)
+        listener_thread.start()
+        
+        def stream_jobs():
+            while True:
+                time.sleep(self.stream_edit_interval)
+                
+                try:
+                    self.flush_streams()
+                except Exception as e:
+                    self.logger.error(f"Stream flush error: {e}")
+        
+        def claim_orphans():
+            while True:
+                time.sleep(self.delivery_grace)
+                
+                try:
+                    self.claim_orphaned_events()
+                except Exception as e:
+                    self.logger.error(f"Orphaned job claim error: {e}")
+        
+        def journal_deliveries():
+            while True:
+                try:
+                    self.delivery_journal.ensure_group()
+                    waiting, replayed_at = [], 0.0
+                    while True:
+                        if time.time() - replayed_at >= self.delivery_journal.claim_idle:
+                            self.delivery_journal.claim_stale()
+                            waiting = self.replay_deliveries()
+                            replayed_at = time.time()
+                        
+                        entries = self.delivery_journal.read(block=int(self.delivery_grace * 1000))
+                        waiting = self.resolve_deliveries(waiting + entries)
+                        
                 except Exception as e:
-                    self.logger.error(f"Job monitoring error: {e}")
+                    self.logger.error(f"Delivery journal error: {e}")
                     time.sleep(5)
         
-        monitor_thread = threading.Thread(target=monitor_jobs, daemon=True)
-        monitor_thread.start()
+        sweep_thread = threading.Thread(target=sweep_jobs, daemon=True)
+        sweep_thread.start()
+        
+        stream_thread = threading.Thread(target=stream_jobs, daemon=True)
+        stream_thread.start()
+        
+        orphan_thread = threading.Thread(target=claim_orphans, daemon=True)
+        orphan_thread.start()
+        
+        journal_thread = threading.Thread(target=journal_deliveries, daemon=True)
+        journal_thread.start()
 
     def handle_job_completion(self, user_id, job_info, result):
         try:
             chat_id = job_info['chat_id']
-            processing_msg_id = job_info['processing_msg_id']
             
-            try:
-                self.bot.delete_message(chat_id, processing_msg_id)
-            except:
-                pass
+            if result['success'] and job_info.get('cache_key'):
+                self.response_cache.put(job_info['cache_key'], result['response'])
+                if job_info.get('faq_vector') is not None:
+                    self.faq_index.add(job_info['message_text'], result['response'], job_info['faq_vector'])
             
-            if result['success']:
-                response_text = result['response']
-                
-                if len(response_text) > 4096:
-                    for i in range(0, len(response_text), 4096):
-                        self.bot.send_message(chat_id, response_text[i:i+4096])
-                else:
-                    self.bot.send_message(chat_id, response_text)
-                
-                self.logger.info(f"AI response sent for user {user_id}")
+            if result['success'] and result.get('user_id') != user_id:
+                try:
+                    conversation_store.append_exchange(chat_id, job_info['message_text'], result['response'])
+                except Exception as e:
+                    self.logger.error(f"Conversation update error for coalesced response: {e}")
+            
+            if not result['success'] or not result['response'].strip():
+                error_response = result.get('response', '').strip() or 'An error occurred.'
+                return self.replace_processing_message(job_info, f"❌ {error_response}")
+            
+            if 'stream_message_ids' in job_info or 'stream_rendered' in job_info:
+                sent = self.finish_stream(job_info, result['response'])
             else:
-                error_response = result.get('response', 'An error occurred.')
-                self.bot.send_message(chat_id, f"❌ {error_response}")
+                sent = self.send_answer(job_info, result['response'])
+            
+            sent.add_done_callback(lambda _: self.observe_delivery(user_id, job_info, result))
+            self.logger.info(f"AI response queued for user {user_id}")
+            return sent
                 
         except Exception as e:
             self.logger.error(f"Job completion handling error: {e}")
 
+    def format_answer(self, text):
+        return render_html(text) if self.parse_mode == 'HTML' else text
+
+    def finish_stream(self, job_info, response_text):
+        with self.jobs_lock:
+            splitter = job_info.setdefault('stream', MessageSplitter(max_chunks=self.document_after))
+            # The streamed text is a prefix of the final answer, so only the rest is split
+            splitter.feed(response_text[splitter.length:])
+            chunks, total = splitter.chunks(), splitter.total()
+        
+        chat_id = job_info['chat_id']
+        sent = self.outbox.submit(chat_id, self.render_stream, job_info, chunks, True)
+        if self.document_after and total > self.document_after:
+            sent = self.outbox.submit(chat_id, self.upload_answer, chat_id, response_text)
+        return sent
+
+    def upload_answer(self, chat_id, text):
+        return self.bot.send_document(chat_id, io.BytesIO(text.encode()), visible_file_name='answer.md',
+                                      caption="📎 The full answer is attached.")
+
+    def edit_or_send(self, chat_id, message_id, text, parse_mode=None):
+        try:
+            return self.bot.edit_message_text(text, chat_id, message_id, parse_mode=parse_mode)
+        except Exception as e:
+            if is_not_modified(e):
+                return None
+            if not is_bad_request(e):
+                raise
+            return FollowUp(self.bot.send_message, chat_id, text, parse_mode=parse_mode)
+
+    def delete_quietly(self, chat_id, message_id):
+        try:
+            self.bot.delete_message(chat_id, message_id)
+        except Exception as e:
+            if retry_after(e) is not None:
+                raise
+
+    def replace_processing_message(self, job_info, text, parse_mode=None):
+        chat_id = job_info['chat_id']
+        if self.edit_in_place:
+            return self.outbox.submit(chat_id, self.edit_or_send, chat_id, job_info['processing_msg_id'], text, parse_mode)
+        
+        self.outbox.submit(chat_id, self.delete_quietly, chat_id, job_info['processing_msg_id'])
+        return self.outbox.submit(chat_id, self.bot.send_message, chat_id, text, parse_mode=parse_mode)
+
+    def send_answer(self, job_info, text):
+        chunks = split_message(text) or [text]
+        sent = self.replace_processing_message(job_info, self.format_answer(chunks[0]), self.parse_mode)
+        return self.send_remaining_chunks(job_info['chat_id'], chunks, text, sent)
+
+    def send_remaining_chunks(self, chat_id, chunks, text, sent):
+        if self.document_after and len(chunks) > self.document_after:
+            return self.outbox.submit(chat_id, self.upload_answer, chat_id, text)
+        
+        for chunk in chunks[1:]:
+            sent = self.outbox.submit(chat_id, self.bot.send_message, chat_id, self.format_answer(chunk),
+                                      parse_mode=self.parse_mode)
+        return sent
+
+    def observe_delivery(self, user_id, job_info, result):
+        source = 'coalesced' if result.get('user_id') != user_id else 'generated'
+        END_TO_END_LATENCY.labels(source).observe(time.time() - job_info.get('received_at', job_info['start_time']))
+
     def handle_job_failure(self, user_id, job_info, error_msg):
+        ERRORS.labels('job', 'failed').inc()
         try:
-            chat_id = job_info['chat_id']
-            processing_msg_id = job_info['processing_msg_id']
-            
-            try:
-                self.bot.delete_message(chat_id, processing_msg_id)
-            except:
-                pass
-            
-            self.bot.send_message(
-                chat_id, 
-                "❌ Your request failed. Please try again."
-            )
-            
             self.logger.error(f"Job failed for user {user_id}: {error_msg}")
+            return self.replace_processing_message(job_info, "❌ Your request failed. Please try again.")
             
         except Exception as e:
             self.logger.error(f"Job failure handling error: {e}")
 
     def handle_job_timeout(self, user_id, job_info):
+        ERRORS.labels('job', 'timeout').inc()
         try:
-            chat_id = job_info['chat_id']
-            processing_msg_id = job_info['processing_msg_id']
-            
-            try:
-                self.bot.delete_message(chat_id, processing_msg_id)
-            except:
-                pass
-            
-            self.bot.send_message(
-                chat_id, 
-                "⏰ Your request timed out. Please try again."
-            )
-            
+            self.replace_processing_message(job_info, "⏰ Your request timed out. Please try again.")
             self.logger.warning(f"Job timed out for user {user_id}")
             
         except Exception as e:
@@ -264,9 +844,12 @@ This bot answers your questions using the AI model.
         try:
             print(colored("[+] Starting bot...", "blue"))
             
+            instrument_telebot()
+            start_metrics_server(config("BOT_METRICS_PORT", default=9100, cast=int), [QueueCollector(get_queue_stats)])
+            
             try:
-                from ai_service import OllamaService
-                ai_service = OllamaService()
+                from ai_service import get_ollama_service
+                ai_service = get_ollama_service()
                 if not ai_service.ensure_model_ready():
                     print(colored("[-] AI model not ready, but bot is starting...", "yellow"))
                 else:
@@ -274,9 +857,11 @@ This bot answers your questions using the AI model.
             except Exception as e:
                 print(colored(f"[-] AI service check failed, but bot is starting: {e}", "yellow"))
                 
-            print(colored("[+] Bot started and running...", "green"))
-            
-            self.bot.polling(none_stop=True, interval=0, timeout=20)
+            if self.bot_mode == "webhook":
+                self.run_webhook()
+            else:
+                print(colored("[+] Bot started and running...", "green"))
+                self.bot.polling(none_stop=True, interval=0, timeout=20)
             
         except KeyboardInterrupt:
             print(colored("\n[-] Bot stopped", "yellow"))
@@ -284,6 +869,25 @@ This bot answers your questions using the AI model.
             self.logger.error(f"Bot error: {e}")
             print(colored(f"[-] Bot error: {e}", "red"))
 
+    def run_webhook(self):
+        host = config("WEBHOOK_HOST", default="0.0.0.0")
+        port = config("WEBHOOK_PORT", default=8443, cast=int)
+        
+        if config("WEBHOOK_REGISTER", default=True, cast=bool):
+            webhook_url = config("WEBHOOK_URL").rstrip('/') + self.webhook_path
+            self.bot.set_webhook(url=webhook_url, secret_token=self.webhook_secret or None)
+            print(colored(f"[+] Webhook registered: {webhook_url}", "green"))
+        
+        server = ThreadingHTTPServer((host, port), WebhookHandler)
+        server.daemon_threads = True
+        server.telegram_bot = self
+        
+        print(colored(f"[+] Bot started, listening for webhooks on {host}:{port}{self.webhook_path}", "green"))
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
 if __name__ == "__main__":
     bot_instance = TelegramBot()
     bot_instance.run()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import math
+from decouple import config
+from typing import Optional, Dict, Any
+from conversation import estimate_tokens
+
+RECORD_THROUGHPUT_SCRIPT = """
+local alpha = tonumber(ARGV[1])
+for i = 2, #ARGV, 2 do
+    local sample = tonumber(ARGV[i + 1])
+    local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+    if current then
+        sample = current + alpha * (sample - current)
+    end
+    redis.call('HSET', KEYS[1], ARGV[i], sample)
+end
+return 1
+"""
+
+class GenerationBudget:
+    def __init__(self, connection):
+        self.connection = connection
+        self.max_output_tokens = config("MAX_OUTPUT_TOKENS", default=512, cast=int)
+        self.min_output_tokens = config("MIN_OUTPUT_TOKENS", default=128, cast=int)
+        self.shrink_depth = config("OUTPUT_BUDGET_SHRINK_DEPTH", default=4, cast=float)
+        self.max_generation_seconds = config("MAX_GENERATION_SECONDS", default=120, cast=float)
+        self.context_step = config("CONTEXT_TOKENS_STEP", default=2048, cast=int)
+        self.max_context_tokens = config("MAX_CONTEXT_TOKENS", default=2048, cast=int)
+        self.max_job_timeout = config("MAX_JOB_TIMEOUT", default=300, cast=int)
+        self.timeout_margin = config("JOB_TIMEOUT_MARGIN", default=2.0, cast=float)
+        self.timeout_floor = config("JOB_TIMEOUT_FLOOR", default=30, cast=int)
+        self.default_tokens_per_second = config("DEFAULT_TOKENS_PER_SECOND", default=10, cast=float)
+        self.default_prompt_tokens_per_second = config("DEFAULT_PROMPT_TOKENS_PER_SECOND", default=100, cast=float)
+        self.alpha = config("THROUGHPUT_ALPHA", default=0.2, cast=float)
+        self.stats_key = "ai_jobs:throughput"
+        self.record_script = connection.register_script(RECORD_THROUGHPUT_SCRIPT)
+
+    def record(self, result: Dict[str, Any]):
+        samples = []
+
+        tokens = result.get('tokens', 0)
+        eval_duration = result.get('eval_duration') or result.get('duration', 0)
+        if tokens and eval_duration:
+            samples.extend(['tokens_per_second', tokens / (eval_duration / 1e9), 'answer_tokens', tokens])
+
+        prompt_tokens = result.get('prompt_tokens', 0)
+        prompt_duration = result.get('prompt_eval_duration', 0)
+        if prompt_tokens and prompt_duration:
+            samples.extend(['prompt_tokens_per_second', prompt_tokens / (prompt_duration / 1e9)])
+
+        if samples:
+            self.record_script(keys=[self.stats_key], args=[self.alpha, *samples])
+
+    def parse_stats(self, raw: Dict[Any, Any]) -> Dict[str, float]:
+        stats = {
+            'tokens_per_second': self.default_tokens_per_second,
+            'prompt_tokens_per_second': self.default_prompt_tokens_per_second,
+            'answer_tokens': self.max_output_tokens / 2
+        }
+        for field, value in raw.items():
+            field = field.decode() if isinstance(field, bytes) else field
+            if float(value) > 0:
+                stats[field] = float(value)
+        return stats
+
+    def plan(self, estimate: Dict[str, Any], prompt: str, raw_stats: Optional[Dict[Any, Any]] = None) -> Dict[str, Any]:
+        if raw_stats is None:
+            raw_stats = self.connection.hgetall(self.stats_key)
+        stats = self.parse_stats(raw_stats)
+        tokens_per_second = stats['tokens_per_second']
+
+        # Output budgets shrink as the queue per worker deepens, so a backlog drains faster
+        depth = estimate.get('queue_length', 0) / max(estimate.get('workers', 1), 1)
+        num_predict = int(self.max_output_tokens / (1 + depth / self.shrink_depth))
+        num_predict = min(num_predict, int(self.max_generation_seconds * tokens_per_second))
+        num_predict = max(self.min_output_tokens, num_predict)
+
+        prompt_seconds = estimate_tokens(prompt) / stats['prompt_tokens_per_second']
+        generation_seconds = min(num_predict, stats['answer_tokens']) / tokens_per_second
+        estimated_wait = estimate.get('estimated_wait', 0.0)
+        queue_wait = max(0.0, estimated_wait - estimate.get('avg_duration', 0.0))
+        timeout = min(
+            self.max_job_timeout,
+            math.ceil(self.timeout_margin * (prompt_seconds + num_predict / tokens_per_second)) + self.timeout_floor
+        )
+
+        return {
+            'num_predict': num_predict,
+            'num_ctx': self.max_context_tokens if depth < self.shrink_depth else self.context_step,
+            'timeout': timeout,
+            'eta': queue_wait + prompt_seconds + generation_seconds,
+            'expires_in': min(self.max_job_timeout, timeout + self.timeout_margin * estimated_wait),
+            'tokens_per_second': tokens_per_second
+        }
+
+    def options(self, budget: Optional[Dict[str, Any]], prompt_tokens: int) -> Dict[str, int]:
+        budget = budget or {}
+        num_predict = budget.get('num_predict', self.max_output_tokens)
+        # num_ctx is rounded to coarse steps because every new value makes Ollama reload the model
+        needed = self.context_step * math.ceil((prompt_tokens + num_predict) / self.context_step)
+        return {
+            'num_predict': num_predict,
+            'num_ctx': min(budget.get('num_ctx', self.max_context_tokens), max(needed, self.context_step))
+        }
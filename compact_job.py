@@ -0,0 +1,37 @@
+import json
+import zlib
+import pickle
+from rq.job import Job
+from decouple import config
+
+COMPRESS_THRESHOLD = config("JOB_COMPRESS_THRESHOLD", default=1024, cast=int)
+COMPRESS_LEVEL = config("JOB_COMPRESS_LEVEL", default=6, cast=int)
+
+JSON_PREFIX = b'j'
+ZLIB_PREFIX = b'z'
+
+class CompactSerializer:
+    @staticmethod
+    def dumps(obj) -> bytes:
+        data = json.dumps(obj, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8')
+        if len(data) >= COMPRESS_THRESHOLD:
+            compressed = zlib.compress(data, COMPRESS_LEVEL)
+            if len(compressed) < len(data):
+                return ZLIB_PREFIX + compressed
+        return JSON_PREFIX + data
+
+    @staticmethod
+    def loads(data: bytes):
+        if data[:1] == ZLIB_PREFIX:
+            return json.loads(zlib.decompress(data[1:]))
+        if data[:1] == JSON_PREFIX:
+            return json.loads(data[1:])
+        # Jobs enqueued before the switch to JSON are still pickled
+        return pickle.loads(data)
+
+class CompactJob(Job):
+    # Keep results and exceptions in the job hash, which expires with the job, instead of
+    # a Redis stream per job that costs several KB even for a short answer
+    @property
+    def supports_redis_streams(self) -> bool:
+        return False
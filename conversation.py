@@ -0,0 +1,149 @@
+import json
+import math
+import logging
+from decouple import config
+from typing import Optional, Dict, List
+from prompts import normalize_text
+
+ROLE_CODES = {'user': 'u', 'assistant': 'a'}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 4
+
+class ConversationStore:
+    def __init__(self, connection):
+        self.connection = connection
+        self.enabled = config("CONVERSATION_ENABLED", default=True, cast=bool)
+        self.token_budget = config("CONVERSATION_TOKEN_BUDGET", default=1024, cast=int)
+        self.max_messages = config("CONVERSATION_MAX_MESSAGES", default=40, cast=int)
+        self.window_step = max(2, config("CONVERSATION_WINDOW_STEP", default=8, cast=int) // 2 * 2)
+        self.ttl = config("CONVERSATION_TTL", default=86400, cast=int)
+        self.summarize = config("CONVERSATION_SUMMARIZE", default=False, cast=bool)
+        self.logger = logging.getLogger(__name__)
+
+    def key(self, chat_id: int) -> str:
+        return f"conversation:{chat_id}"
+
+    def summary_key(self, chat_id: int) -> str:
+        return f"conversation:{chat_id}:summary"
+
+    def encode(self, role: str, content: str) -> str:
+        if role == 'user':
+            content = normalize_text(content)
+        return json.dumps([ROLE_CODES[role], content], ensure_ascii=False, separators=(',', ':'))
+
+    def decode(self, raw) -> Dict[str, str]:
+        code, content = json.loads(raw)
+        return {'role': ROLE_NAMES[code], 'content': content}
+
+    def get_context(self, chat_id: int) -> List[Dict[str, str]]:
+        if not self.enabled:
+            return []
+
+        with self.connection.pipeline() as pipe:
+            pipe.get(self.summary_key(chat_id))
+            pipe.lrange(self.key(chat_id), -self.max_messages, -1)
+            summary, raw_messages = pipe.execute()
+
+        budget = self.token_budget
+        if summary:
+            summary = summary.decode() if isinstance(summary, bytes) else summary
+            budget -= estimate_tokens(summary)
+
+        messages = [self.decode(raw) for raw in raw_messages]
+        start = len(messages)
+        while start > 0 and budget - estimate_tokens(messages[start - 1]['content']) >= 0:
+            start -= 1
+            budget -= estimate_tokens(messages[start]['content'])
+
+        # The window start moves in steps rather than one exchange at a time, so consecutive
+        # prompts share their prefix and Ollama can reuse the cached prompt evaluation
+        aligned = self.window_step * math.ceil(start / self.window_step)
+        messages = messages[aligned if aligned < len(messages) else start:]
+
+        if messages and messages[0]['role'] == 'assistant':
+            messages.pop(0)
+
+        if summary:
+            messages.insert(0, {
+                'role': 'system',
+                'content': f"Summary of the earlier conversation: {summary}"
+            })
+        return messages
+
+    def append_commands(self, pipe, key: str, user_text: str, assistant_text: str):
+        pipe.rpush(key, self.encode('user', user_text), self.encode('assistant', assistant_text))
+        pipe.expire(key, self.ttl)
+
+    def trim_count(self, length: int) -> int:
+        overflow = length - self.max_messages
+        if overflow <= 0:
+            return 0
+        # Trimming a whole step at once keeps the list start, and with it the prompt prefix, stable
+        return min(length, self.window_step * math.ceil(overflow / self.window_step))
+
+    def append_exchange(self, chat_id: int, user_text: str, assistant_text: str) -> List[Dict[str, str]]:
+        if not self.enabled:
+            return []
+
+        key = self.key(chat_id)
+        with self.connection.pipeline() as pipe:
+            self.append_commands(pipe, key, user_text, assistant_text)
+            length, _ = pipe.execute()
+
+        overflow = self.trim_count(length)
+        if not overflow:
+            return []
+
+        if not self.summarize:
+            self.connection.ltrim(key, overflow, -1)
+            return []
+
+        with self.connection.pipeline() as pipe:
+            pipe.lrange(key, 0, overflow - 1)
+            pipe.ltrim(key, overflow, -1)
+            dropped, _ = pipe.execute()
+        return [self.decode(raw) for raw in dropped]
+
+    def has_history(self, chat_id: int) -> bool:
+        return self.enabled and bool(self.connection.exists(self.key(chat_id), self.summary_key(chat_id)))
+
+    def get_summary(self, chat_id: int) -> Optional[str]:
+        summary = self.connection.get(self.summary_key(chat_id))
+        if isinstance(summary, bytes):
+            summary = summary.decode()
+        return summary
+
+    def set_summary(self, chat_id: int, summary: str):
+        self.connection.set(self.summary_key(chat_id), summary, ex=self.ttl)
+
+    def reset(self, chat_id: int):
+        self.connection.delete(self.key(chat_id), self.summary_key(chat_id))
+
+class AsyncConversationStore(ConversationStore):
+    async def append_exchange(self, chat_id: int, user_text: str, assistant_text: str) -> List[Dict[str, str]]:
+        if not self.enabled:
+            return []
+
+        key = self.key(chat_id)
+        async with self.connection.pipeline() as pipe:
+            self.append_commands(pipe, key, user_text, assistant_text)
+            length, _ = await pipe.execute()
+
+        overflow = self.trim_count(length)
+        if not overflow:
+            return []
+
+        if not self.summarize:
+            await self.connection.ltrim(key, overflow, -1)
+            return []
+
+        async with self.connection.pipeline() as pipe:
+            pipe.lrange(key, 0, overflow - 1)
+            pipe.ltrim(key, overflow, -1)
+            dropped, _ = await pipe.execute()
+        return [self.decode(raw) for raw in dropped]
+
+    async def has_history(self, chat_id: int) -> bool:
+        return self.enabled and bool(await self.connection.exists(self.key(chat_id), self.summary_key(chat_id)))
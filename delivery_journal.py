@@ -0,0 +1,122 @@
+import json
+from decouple import config
+from typing import Dict, Any, List, Tuple
+from redis.exceptions import ResponseError
+from job_state import as_text
+
+DELIVERY_STREAM = config("DELIVERY_STREAM", default="ai_jobs:deliveries")
+DELIVERY_GROUP = config("DELIVERY_GROUP", default="bots")
+DELIVERY_STREAM_MAXLEN = config("DELIVERY_STREAM_MAXLEN", default=50000, cast=int)
+
+def record_delivery(connection, job_id: str, status: str, payload: Dict[str, Any]) -> str:
+    fields = {'job_id': job_id, 'status': status, 'payload': json.dumps(payload, default=str)}
+    return as_text(connection.xadd(DELIVERY_STREAM, fields, maxlen=DELIVERY_STREAM_MAXLEN, approximate=True))
+
+def entry_time(entry_id: str) -> float:
+    return int(entry_id.split('-')[0]) / 1000
+
+class DeliveryJournal:
+    def __init__(self, connection, consumer: str):
+        self.connection = connection
+        self.consumer = consumer
+        self.batch_size = config("DELIVERY_BATCH_SIZE", default=500, cast=int)
+        self.claim_idle = config("DELIVERY_CLAIM_IDLE", default=60, cast=float)
+
+    def ensure_group(self):
+        try:
+            self.connection.xgroup_create(DELIVERY_STREAM, DELIVERY_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            self.ignore_existing_group(e)
+
+    def ignore_existing_group(self, error: ResponseError):
+        if 'BUSYGROUP' not in str(error):
+            raise error
+
+    def parse(self, response) -> List[Tuple[str, Dict[str, Any]]]:
+        entries = []
+        for entry_id, fields in (response[0][1] if response else []):
+            entry_id = as_text(entry_id)
+            if not fields:
+                # Trimmed by MAXLEN while unacknowledged; nothing is left to deliver
+                entries.append((entry_id, None))
+                continue
+            fields = {as_text(key): as_text(value) for key, value in fields.items()}
+            event = json.loads(fields['payload'])
+            event.update(job_id=fields['job_id'], status=fields['status'], published_at=entry_time(entry_id),
+                         delivery_id=entry_id)
+            entries.append((entry_id, event))
+        return entries
+
+    def read(self, block: int) -> List[Tuple[str, Dict[str, Any]]]:
+        return self.parse(self.connection.xreadgroup(DELIVERY_GROUP, self.consumer, {DELIVERY_STREAM: '>'},
+                                                     count=self.batch_size, block=block))
+
+    def pending(self, after: str = '0') -> List[Tuple[str, Dict[str, Any]]]:
+        # Entries this consumer received but did not acknowledge, including those from before a restart
+        return self.parse(self.connection.xreadgroup(DELIVERY_GROUP, self.consumer, {DELIVERY_STREAM: after},
+                                                     count=self.batch_size))
+
+    def claim_stale_args(self, cursor: str) -> Dict[str, Any]:
+        return {
+            'name': DELIVERY_STREAM,
+            'groupname': DELIVERY_GROUP,
+            'consumername': self.consumer,
+            'min_idle_time': int(self.claim_idle * 1000),
+            'start_id': cursor,
+            'count': self.batch_size
+        }
+
+    def claim_stale(self) -> int:
+        # Entries of replicas that stopped reading move to this consumer and show up in pending()
+        cursor, claimed = '0-0', 0
+        while True:
+            response = self.connection.xautoclaim(**self.claim_stale_args(cursor))
+            cursor = as_text(response[0])
+            claimed += len(response[1])
+            if cursor == '0-0':
+                return claimed
+
+    def ack_commands(self, pipe, entry_ids: List[str]):
+        pipe.xack(DELIVERY_STREAM, DELIVERY_GROUP, *entry_ids)
+        pipe.xdel(DELIVERY_STREAM, *entry_ids)
+
+    def ack(self, entry_ids: List[str]):
+        if not entry_ids:
+            return
+        with self.connection.pipeline() as pipe:
+            self.ack_commands(pipe, entry_ids)
+            pipe.execute()
+
+    def backlog(self) -> int:
+        return self.connection.xlen(DELIVERY_STREAM)
+
+class AsyncDeliveryJournal(DeliveryJournal):
+    async def ensure_group(self):
+        try:
+            await self.connection.xgroup_create(DELIVERY_STREAM, DELIVERY_GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            self.ignore_existing_group(e)
+
+    async def read(self, block: int) -> List[Tuple[str, Dict[str, Any]]]:
+        return self.parse(await self.connection.xreadgroup(DELIVERY_GROUP, self.consumer, {DELIVERY_STREAM: '>'},
+                                                           count=self.batch_size, block=block))
+
+    async def pending(self, after: str = '0') -> List[Tuple[str, Dict[str, Any]]]:
+        return self.parse(await self.connection.xreadgroup(DELIVERY_GROUP, self.consumer, {DELIVERY_STREAM: after},
+                                                           count=self.batch_size))
+
+    async def claim_stale(self) -> int:
+        cursor, claimed = '0-0', 0
+        while True:
+            response = await self.connection.xautoclaim(**self.claim_stale_args(cursor))
+            cursor = as_text(response[0])
+            claimed += len(response[1])
+            if cursor == '0-0':
+                return claimed
+
+    async def ack(self, entry_ids: List[str]):
+        if not entry_ids:
+            return
+        async with self.connection.pipeline() as pipe:
+            self.ack_commands(pipe, entry_ids)
+            await pipe.execute()
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import zlib
+import socket
+import hashlib
+import logging
+import importlib
+import threading
+import numpy as np
+from decouple import config
+from typing import Optional, List, Tuple, Dict, Any
+from response_cache import normalize_prompt
+from metrics import FAQ_LOOKUPS, FAQ_SIMILARITY
+
+class OllamaEmbedder:
+    def __init__(self, model: str):
+        self.name = f"ollama:{model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        from ai_service import get_ollama_service
+        return np.asarray(get_ollama_service().embed(texts), dtype=np.float32)
+
+class HashingEmbedder:
+    # Runs without a model: signed feature hashing of words and their character trigrams. Words of up
+    # to three letters are mostly function words that vary between rewordings, so they are left out
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing:{dim}"
+
+    def features(self, text: str):
+        for word in normalize_prompt(text).split():
+            if len(word) <= 3:
+                continue
+            yield word
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                digest = zlib.crc32(feature.encode())
+                vectors[row, digest % self.dim] += 1.0 if digest & 1 else -1.0
+        return vectors
+
+def make_embedder():
+    embedder = config("FAQ_EMBEDDER", default="ollama")
+    if embedder == "ollama":
+        return OllamaEmbedder(config("FAQ_EMBED_MODEL", default="nomic-embed-text"))
+    if embedder == "hashing":
+        return HashingEmbedder(config("FAQ_HASHING_DIM", default=512, cast=int))
+    # Any other value is a "module:Class" whose instances have a name and embed(texts) -> matrix
+    module, _, name = embedder.partition(':')
+    return getattr(importlib.import_module(module), name)()
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class FaqIndex:
+    def __init__(self, scope: str = "", embedder=None):
+        self.enabled = config("FAQ_ENABLED", default=False, cast=bool)
+        self.threshold = config("FAQ_SIMILARITY_THRESHOLD", default=0.92, cast=float)
+        self.capacity = config("FAQ_INDEX_SIZE", default=10000, cast=int)
+        self.ttl = config("FAQ_TTL", default=86400, cast=int)
+        # Replicas share the data volume, so each one keeps its index under its own name
+        replica = config("BOT_CONSUMER_NAME", default="") or socket.gethostname()
+        self.path = config("FAQ_INDEX_PATH", default=f"data/faq_index-{replica}.npy")
+        self.embedder = embedder or (make_embedder() if self.enabled else None)
+        self.scope = hashlib.sha1(scope.encode()).hexdigest()
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.questions = [None] * self.capacity
+        self.answers = [None] * self.capacity
+        self.added = np.zeros(self.capacity)
+        self.used = np.zeros(self.capacity)
+        self.size = 0
+        self.log = None
+        self.log_lines = 0
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger(__name__)
+
+        if self.enabled and self.path:
+            try:
+                self.load()
+            except Exception as e:
+                self.logger.error(f"FAQ index load error, starting empty: {e}")
+                self.vectors = None
+                self.size = 0
+
+    @property
+    def log_path(self) -> str:
+        return os.path.splitext(self.path)[0] + ".jsonl"
+
+    def header(self, dim: int) -> Dict[str, Any]:
+        return {'scope': self.scope, 'embedder': self.embedder.name, 'dim': dim, 'capacity': self.capacity}
+
+    def load(self):
+        if not os.path.exists(self.path) or not os.path.exists(self.log_path):
+            return
+
+        header, records = None, {}
+        with open(self.log_path, encoding='utf-8') as log:
+            for line in log:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if header is None:
+                    header = record
+                else:
+                    records[record['row']] = record
+
+        if header is None or header != self.header(header.get('dim')):
+            self.logger.info(f"FAQ index {self.path} was built for another model, embedder or size, starting empty")
+            return
+
+        # The vectors are paged in from the file on first use instead of being embedded again
+        self.vectors = np.lib.format.open_memmap(self.path, mode='r+')
+        if self.vectors.shape != (self.capacity, header['dim']):
+            raise ValueError(f"unexpected vector file shape {self.vectors.shape}")
+
+        for row, record in records.items():
+            self.questions[row] = record['question']
+            self.answers[row] = record['answer']
+            self.added[row] = self.used[row] = record['time']
+        self.size = max(records) + 1 if records else 0
+        self.compact()
+        self.logger.info(f"FAQ index loaded: {len(records)} answers from {self.path}")
+
+    def create(self, dim: int):
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.vectors = np.lib.format.open_memmap(self.path, mode='w+', dtype=np.float32,
+                                                     shape=(self.capacity, dim))
+            self.compact()
+        else:
+            self.vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+
+    def compact(self):
+        # Rewrites the append-only log with one line per row, so it stays proportional to the index
+        temporary = self.log_path + ".tmp"
+        with open(temporary, 'w', encoding='utf-8') as log:
+            log.write(json.dumps(self.header(self.vectors.shape[1])) + "\n")
+            for row in range(self.size):
+                if self.answers[row] is not None:
+                    log.write(json.dumps(self.record(row), ensure_ascii=False) + "\n")
+        if self.log:
+            self.log.close()
+        os.replace(temporary, self.log_path)
+        self.log = open(self.log_path, 'a', encoding='utf-8')
+        self.log_lines = self.size
+
+    def record(self, row: int) -> Dict[str, Any]:
+        return {'row': row, 'question': self.questions[row], 'answer': self.answers[row], 'time': self.added[row]}
+
+    def embed(self, questions: List[str]) -> np.ndarray:
+        return normalize_rows(np.asarray(self.embedder.embed(questions), dtype=np.float32))
+
+    def search(self, vectors: np.ndarray) -> List[Tuple[int, float]]:
+        with self.lock:
+            if self.vectors is None or not self.size or vectors.shape[1] != self.vectors.shape[1]:
+                return [(-1, 0.0)] * len(vectors)
+
+            # One matrix product scores every query against every indexed question
+            scores = self.vectors[:self.size] @ vectors.T
+            if self.ttl:
+                scores[self.added[:self.size] < time.time() - self.ttl] = -1.0
+            best = scores.argmax(axis=0)
+            return [(int(row), float(scores[row, column])) for column, row in enumerate(best)]
+
+    def lookup_many(self, questions: List[str]) -> List[Tuple[Optional[str], Optional[np.ndarray]]]:
+        try:
+            vectors = self.embed(questions)
+        except Exception as e:
+            self.logger.error(f"FAQ embedding error: {e}")
+            FAQ_LOOKUPS.labels('error').inc(len(questions))
+            return [(None, None)] * len(questions)
+
+        results = []
+        now = time.time()
+        for vector, (row, score) in zip(vectors, self.search(vectors)):
+            if row >= 0:
+                FAQ_SIMILARITY.observe(score)
+            with self.lock:
+                answer = self.answers[row] if row >= 0 and score >= self.threshold else None
+                if answer is None:
+                    self.misses += 1
+                else:
+                    self.used[row] = now
+                    self.hits += 1
+            FAQ_LOOKUPS.labels('miss' if answer is None else 'hit').inc()
+            results.append((answer, vector))
+        return results
+
+    def lookup(self, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        if not self.enabled:
+            return None, None
+        return self.lookup_many([question])[0]
+
+    def add(self, question: str, answer: str, vector: np.ndarray):
+        if not self.enabled or not answer.strip():
+            return
+
+        try:
+            row, score = self.search(vector[None, :])[0]
+            with self.lock:
+                if self.vectors is None:
+                    self.create(len(vector))
+                if len(vector) != self.vectors.shape[1]:
+                    return
+                if row < 0 or score < self.threshold:
+                    row = self.size if self.size < self.capacity else int(self.used.argmin())
+                    self.size = max(self.size, row + 1)
+
+                self.vectors[row] = vector
+                self.questions[row] = question
+                self.answers[row] = answer
+                self.added[row] = self.used[row] = time.time()
+
+                if self.log:
+                    self.log.write(json.dumps(self.record(row), ensure_ascii=False) + "\n")
+                    self.log.flush()
+                    self.log_lines += 1
+                    if self.log_lines > 2 * self.capacity:
+                        self.compact()
+        except Exception as e:
+            self.logger.error(f"FAQ index insert error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
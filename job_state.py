@@ -0,0 +1,278 @@
+import json
+import time
+import uuid
+import socket
+from decouple import config
+from typing import Optional, Dict, Any, List, Tuple
+
+PERSISTED_FIELDS = (
+    'job_id',
+    'user_id',
+    'message_text',
+    'message_id',
+    'processing_msg_id',
+    'chat_id',
+    'start_time',
+    'deadline',
+    'received_at',
+    'cache_key',
+    'stream_message_ids'
+)
+
+CLAIM_JOB_SCRIPT = """
+local entries = redis.call('HGETALL', KEYS[1])
+if #entries == 0 then
+    return {}
+end
+redis.call('DEL', KEYS[1])
+for i = 1, #entries, 2 do
+    local busy_key = ARGV[1] .. entries[i]
+    if redis.call('GET', busy_key) == ARGV[2] then
+        redis.call('DEL', busy_key)
+    end
+    redis.call('ZREM', KEYS[2], ARGV[2] .. ':' .. entries[i])
+    redis.call('HSET', KEYS[3], entries[i], entries[i + 1])
+    redis.call('HSET', KEYS[4], entries[i], ARGV[3])
+end
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+redis.call('EXPIRE', KEYS[4], ARGV[4])
+return entries
+"""
+
+TAKE_OVER_SCRIPT = """
+local taken = {}
+local owners = redis.call('HGETALL', KEYS[2])
+for i = 1, #owners, 2 do
+    local separator = string.find(owners[i + 1], '|', 1, true)
+    local expires = tonumber(string.sub(owners[i + 1], 1, separator - 1))
+    local owner = string.sub(owners[i + 1], separator + 1)
+    local restarted = owner ~= ARGV[1] and string.sub(owner, 1, #ARGV[2]) == ARGV[2]
+    if expires < tonumber(ARGV[3]) or restarted then
+        local info = redis.call('HGET', KEYS[1], owners[i])
+        if info then
+            redis.call('HSET', KEYS[2], owners[i], ARGV[4])
+            table.insert(taken, owners[i])
+            table.insert(taken, info)
+        end
+    end
+end
+return taken
+"""
+
+SETTLE_SCRIPT = """
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+return redis.call('HLEN', KEYS[1]) + redis.call('HLEN', KEYS[3])
+"""
+
+CLAIM_USER_SCRIPT = """
+local info = redis.call('HGET', KEYS[1], ARGV[1])
+if not info then
+    return false
+end
+redis.call('HDEL', KEYS[1], ARGV[1])
+if redis.call('GET', KEYS[2]) == ARGV[2] then
+    redis.call('DEL', KEYS[2])
+end
+redis.call('ZREM', KEYS[3], ARGV[2] .. ':' .. ARGV[1])
+return info
+"""
+
+UPDATE_USER_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('HEXISTS', key, ARGV[1]) == 1 then
+        return redis.call('HSET', key, ARGV[1], ARGV[2])
+    end
+end
+return 0
+"""
+
+def as_text(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+class PendingJobStore:
+    def __init__(self, connection):
+        self.connection = connection
+        self.busy_ttl = config("PENDING_JOB_TTL", default=330, cast=int)
+        self.index_key = "ai_jobs:pending_index"
+        self.busy_prefix = "ai_jobs:busy:"
+        self.consumer = config("BOT_CONSUMER_NAME", default="") or socket.gethostname()
+        # Claims carry a per-process token, so a restarted bot can tell its own unfinished deliveries apart
+        self.owner = f"{self.consumer}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = config("DELIVERY_LEASE", default=300, cast=int)
+        self.claim_job_script = connection.register_script(CLAIM_JOB_SCRIPT)
+        self.take_over_script = connection.register_script(TAKE_OVER_SCRIPT)
+        self.settle_script = connection.register_script(SETTLE_SCRIPT)
+        self.claim_user_script = connection.register_script(CLAIM_USER_SCRIPT)
+        self.update_user_script = connection.register_script(UPDATE_USER_SCRIPT)
+
+    def pending_key(self, job_id: str) -> str:
+        return f"ai_jobs:pending:{job_id}"
+
+    def delivering_key(self, job_id: str) -> str:
+        return f"ai_jobs:delivering:{job_id}"
+
+    def owners_key(self, job_id: str) -> str:
+        return f"ai_jobs:delivery_owners:{job_id}"
+
+    def lease(self) -> str:
+        return f"{time.time() + self.lease_ttl}|{self.owner}"
+
+    def busy_key(self, user_id: int) -> str:
+        return f"{self.busy_prefix}{user_id}"
+
+    def encode(self, job_info: Dict[str, Any]) -> str:
+        return json.dumps({field: job_info[field] for field in PERSISTED_FIELDS if field in job_info})
+
+    def acquire_user(self, user_id: int) -> bool:
+        return bool(self.connection.set(self.busy_key(user_id), "pending", nx=True, ex=self.busy_ttl))
+
+    def active_job(self, user_id: int) -> Optional[str]:
+        job_id = as_text(self.connection.get(self.busy_key(user_id)))
+        return job_id if job_id and job_id != "pending" else None
+
+    def waiters(self, job_id: str) -> int:
+        return self.connection.hlen(self.pending_key(job_id))
+
+    def release_user(self, user_id: int):
+        self.connection.delete(self.busy_key(user_id))
+
+    def track_commands(self, pipe, user_id: int, job_info: Dict[str, Any]):
+        job_id = job_info['job_id']
+        pipe.hset(self.pending_key(job_id), user_id, self.encode(job_info))
+        pipe.expire(self.pending_key(job_id), self.busy_ttl)
+        pipe.zadd(self.index_key, {f"{job_id}:{user_id}": job_info['deadline']})
+        pipe.set(self.busy_key(user_id), job_id, ex=self.busy_ttl)
+
+    def track(self, user_id: int, job_info: Dict[str, Any]):
+        with self.connection.pipeline() as pipe:
+            self.track_commands(pipe, user_id, job_info)
+            pipe.execute()
+
+    def update_call(self, user_id: int, job_info: Dict[str, Any]) -> Dict[str, list]:
+        return {
+            'keys': [self.pending_key(job_info['job_id']), self.delivering_key(job_info['job_id'])],
+            'args': [user_id, self.encode(job_info)]
+        }
+
+    def update(self, user_id: int, job_info: Dict[str, Any]):
+        self.update_user_script(**self.update_call(user_id, job_info))
+
+    def claim_job_call(self, job_id: str) -> Dict[str, list]:
+        return {
+            'keys': [self.pending_key(job_id), self.index_key, self.delivering_key(job_id), self.owners_key(job_id)],
+            'args': [self.busy_prefix, job_id, self.lease(), self.busy_ttl + self.lease_ttl]
+        }
+
+    def take_over_call(self, job_id: str) -> Dict[str, list]:
+        # Deliveries whose lease ran out, or that an earlier run of this consumer never finished
+        return {
+            'keys': [self.delivering_key(job_id), self.owners_key(job_id)],
+            'args': [self.owner, f"{self.consumer}:", time.time(), self.lease()]
+        }
+
+    def claim_job(self, job_id: str) -> List[Tuple[int, Dict[str, Any]]]:
+        # Claimed users stay recorded as delivering until settle(), so a crash mid-send is replayed
+        return self.parse_entries(self.claim_job_script(**self.claim_job_call(job_id)))
+
+    def settle_call(self, job_id: str, user_id: int) -> Dict[str, list]:
+        return {
+            'keys': [self.delivering_key(job_id), self.owners_key(job_id), self.pending_key(job_id)],
+            'args': [user_id]
+        }
+
+    def settle(self, job_id: str, user_id: int) -> int:
+        return self.settle_script(**self.settle_call(job_id, user_id))
+
+    def recover(self, job_ids: List[str]) -> Dict[str, Tuple[List[Tuple[int, Dict[str, Any]]], bool]]:
+        # Claims a batch of finished jobs in one round trip; the flag tells whether any user is still being delivered
+        with self.connection.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                self.claim_job_script(client=pipe, **self.claim_job_call(job_id))
+                self.take_over_script(client=pipe, **self.take_over_call(job_id))
+                pipe.exists(self.delivering_key(job_id))
+            return self.parse_recovered(job_ids, pipe.execute())
+
+    def parse_recovered(self, job_ids: List[str], replies) -> Dict[str, Tuple[List[Tuple[int, Dict[str, Any]]], bool]]:
+        return {
+            job_id: (self.parse_entries(replies[i * 3]) + self.parse_entries(replies[i * 3 + 1]), bool(replies[i * 3 + 2]))
+            for i, job_id in enumerate(job_ids)
+        }
+
+    def parse_entries(self, entries) -> List[Tuple[int, Dict[str, Any]]]:
+        return [
+            (int(as_text(entries[i])), json.loads(entries[i + 1]))
+            for i in range(0, len(entries), 2)
+        ]
+
+    def claim_user_call(self, job_id: str, user_id: int) -> Dict[str, list]:
+        return {'keys': [self.pending_key(job_id), self.busy_key(user_id), self.index_key], 'args': [user_id, job_id]}
+
+    def claim_user(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        info = self.claim_user_script(**self.claim_user_call(job_id, user_id))
+        return json.loads(info) if info else None
+
+    def parse_members(self, members) -> List[Tuple[str, int]]:
+        return [
+            (job_id, int(user_id))
+            for job_id, user_id in (as_text(member).rsplit(':', 1) for member in members)
+        ]
+
+    def expired(self) -> List[Tuple[str, int]]:
+        return self.parse_members(self.connection.zrangebyscore(self.index_key, 0, time.time()))
+
+    def pending_job_ids(self) -> List[str]:
+        return list({job_id for job_id, _ in self.parse_members(self.connection.zrange(self.index_key, 0, -1))})
+
+    def count(self) -> int:
+        return self.connection.zcard(self.index_key)
+
+class AsyncPendingJobStore(PendingJobStore):
+    # The same records on a redis.asyncio client, whose registered scripts are awaitable
+    async def acquire_user(self, user_id: int) -> bool:
+        return bool(await self.connection.set(self.busy_key(user_id), "pending", nx=True, ex=self.busy_ttl))
+
+    async def active_job(self, user_id: int) -> Optional[str]:
+        job_id = as_text(await self.connection.get(self.busy_key(user_id)))
+        return job_id if job_id and job_id != "pending" else None
+
+    async def waiters(self, job_id: str) -> int:
+        return await self.connection.hlen(self.pending_key(job_id))
+
+    async def release_user(self, user_id: int):
+        await self.connection.delete(self.busy_key(user_id))
+
+    async def track(self, user_id: int, job_info: Dict[str, Any]):
+        async with self.connection.pipeline() as pipe:
+            self.track_commands(pipe, user_id, job_info)
+            await pipe.execute()
+
+    async def update(self, user_id: int, job_info: Dict[str, Any]):
+        await self.update_user_script(**self.update_call(user_id, job_info))
+
+    async def claim_job(self, job_id: str) -> List[Tuple[int, Dict[str, Any]]]:
+        return self.parse_entries(await self.claim_job_script(**self.claim_job_call(job_id)))
+
+    async def settle(self, job_id: str, user_id: int) -> int:
+        return await self.settle_script(**self.settle_call(job_id, user_id))
+
+    async def recover(self, job_ids: List[str]) -> Dict[str, Tuple[List[Tuple[int, Dict[str, Any]]], bool]]:
+        async with self.connection.pipeline(transaction=False) as pipe:
+            for job_id in job_ids:
+                await self.claim_job_script(client=pipe, **self.claim_job_call(job_id))
+                await self.take_over_script(client=pipe, **self.take_over_call(job_id))
+                pipe.exists(self.delivering_key(job_id))
+            return self.parse_recovered(job_ids, await pipe.execute())
+
+    async def claim_user(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        info = await self.claim_user_script(**self.claim_user_call(job_id, user_id))
+        return json.loads(info) if info else None
+
+    async def expired(self) -> List[Tuple[str, int]]:
+        return self.parse_members(await self.connection.zrangebyscore(self.index_key, 0, time.time()))
+
+    async def pending_job_ids(self) -> List[str]:
+        return list({job_id for job_id, _ in self.parse_members(await self.connection.zrange(self.index_key, 0, -1))})
+
+    async def count(self) -> int:
+        return await self.connection.zcard(self.index_key)
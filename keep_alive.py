@@ -0,0 +1,51 @@
+import time
+import logging
+import threading
+from decouple import config
+
+LAST_ACTIVITY_KEY = "ai_jobs:last_activity"
+UNLOADED_KEY = "ai_jobs:unloaded_activity"
+
+class KeepAliveScheduler:
+    def __init__(self, connection):
+        self.connection = connection
+        self.idle_unload = config("OLLAMA_IDLE_UNLOAD", default=1800, cast=int)
+        self.check_interval = config("OLLAMA_IDLE_CHECK_INTERVAL", default=60, cast=float)
+        self.touch_interval = config("OLLAMA_ACTIVITY_INTERVAL", default=5, cast=float)
+        self.last_touch = 0.0
+        self.logger = logging.getLogger(__name__)
+
+    def touch(self):
+        now = time.time()
+        if now - self.last_touch < self.touch_interval:
+            return
+        self.last_touch = now
+        self.connection.set(LAST_ACTIVITY_KEY, now)
+
+    def check(self, ai_service) -> bool:
+        last_activity = self.connection.get(LAST_ACTIVITY_KEY)
+        if last_activity is None or time.time() - float(last_activity) < self.idle_unload:
+            return False
+
+        # Every worker runs this check; GETSET lets only the first one unload after each busy period
+        if self.connection.getset(UNLOADED_KEY, last_activity) == last_activity:
+            return False
+
+        unloaded = ai_service.unload()
+        self.logger.info(f"Idle for {time.time() - float(last_activity):.0f}s, unloaded {unloaded} model(s)")
+        return True
+
+    def run(self):
+        from ai_service import get_ollama_service
+
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.check(get_ollama_service())
+            except Exception as e:
+                self.logger.error(f"Keep-alive check error: {e}")
+
+    def start(self):
+        if self.idle_unload > 0:
+            threading.Thread(target=self.run, daemon=True, name="keep-alive").start()
+        return self
@@ -0,0 +1,209 @@
+import os
+import glob
+import time
+import logging
+from decouple import config
+from prometheus_client import (
+    Counter,
+    Histogram,
+    CollectorRegistry,
+    start_http_server,
+    multiprocess,
+    values
+)
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250)
+
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Forking RQ workers run every job in a new work horse. Horses of one worker never overlap, so
+# they share one file identity instead of leaving a set of files per job in the metrics directory
+process_identity = {'value': None}
+
+def metrics_process_id():
+    return process_identity['value'] or os.getpid()
+
+if MULTIPROC_DIR:
+    values.ValueClass = values.MultiProcessValue(metrics_process_id)
+
+def use_work_horse_metrics():
+    process_identity['value'] = f"horse{os.getppid()}"
+
+def clear_metrics_files():
+    # Counts from earlier runs would otherwise be added to this run's until the directory is emptied
+    if not MULTIPROC_DIR:
+        return
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, '*.db')):
+        if not path.endswith(f"_{metrics_process_id()}.db"):
+            os.remove(path)
+
+def mark_process_dead(pid: int):
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+
+ENQUEUE_LATENCY = Histogram(
+    'ai_bot_enqueue_seconds', 'Time to enqueue an AI request',
+    buckets=LATENCY_BUCKETS
+)
+QUEUE_WAIT = Histogram(
+    'ai_job_queue_wait_seconds', 'Time a job waited before a worker started it',
+    ['queue'], buckets=LATENCY_BUCKETS
+)
+GENERATION_TIME = Histogram(
+    'ai_generation_seconds', 'Wall time of one Ollama generation',
+    ['model'], buckets=LATENCY_BUCKETS
+)
+GENERATION_TOKENS_PER_SECOND = Histogram(
+    'ai_generation_tokens_per_second', 'Ollama eval_count divided by eval duration',
+    ['model'], buckets=THROUGHPUT_BUCKETS
+)
+EVAL_TIME = Histogram(
+    'ai_eval_seconds', 'Time Ollama spent generating answer tokens (eval_duration)',
+    ['model'], buckets=LATENCY_BUCKETS
+)
+PROMPT_EVAL_TIME = Histogram(
+    'ai_prompt_eval_seconds', 'Time Ollama spent evaluating the prompt (prompt_eval_duration)',
+    ['model'], buckets=LATENCY_BUCKETS
+)
+MODEL_LOAD_TIME = Histogram(
+    'ai_model_load_seconds', 'Time Ollama spent loading the model for a request (load_duration)',
+    ['model'], buckets=LATENCY_BUCKETS
+)
+PROMPT_TOKENS = Counter(
+    'ai_prompt_tokens', 'Prompt tokens evaluated by Ollama and estimated tokens reused from its prefix cache',
+    ['model', 'kind']
+)
+GENERATED_TOKENS = Counter(
+    'ai_generated_tokens', 'Tokens generated by Ollama',
+    ['model']
+)
+TELEGRAM_LATENCY = Histogram(
+    'telegram_api_seconds', 'Latency of Telegram Bot API calls',
+    ['method'], buckets=LATENCY_BUCKETS
+)
+END_TO_END_LATENCY = Histogram(
+    'ai_end_to_end_seconds', 'Time from receiving a message to delivering the full answer',
+    ['source'], buckets=LATENCY_BUCKETS
+)
+CACHE_LOOKUPS = Counter(
+    'response_cache_lookups', 'Response cache lookups',
+    ['result']
+)
+FAQ_LOOKUPS = Counter(
+    'faq_index_lookups', 'Semantic FAQ index lookups',
+    ['result']
+)
+FAQ_SIMILARITY = Histogram(
+    'faq_index_similarity', 'Cosine similarity of the closest indexed question',
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 1.0)
+)
+REJECTED_REQUESTS = Counter(
+    'ai_requests_rejected', 'Messages turned away before enqueueing',
+    ['reason']
+)
+ERRORS = Counter(
+    'ai_errors', 'Errors by component',
+    ['component', 'kind']
+)
+TELEGRAM_RETRIES = Counter(
+    'telegram_send_retries', 'Telegram calls retried by the outbox',
+    ['reason']
+)
+OUTBOX_DELAY = Histogram(
+    'telegram_outbox_seconds', 'Time from queueing a Telegram call until it succeeded',
+    buckets=LATENCY_BUCKETS
+)
+OLLAMA_BACKEND_REQUESTS = Counter(
+    'ollama_backend_requests', 'Ollama requests per backend',
+    ['backend', 'outcome']
+)
+
+logger = logging.getLogger(__name__)
+
+def observe_generation(model: str, elapsed: float, response, prompt_tokens: int = 0):
+    GENERATION_TIME.labels(model).observe(elapsed)
+    for histogram, field in ((EVAL_TIME, 'eval_duration'), (PROMPT_EVAL_TIME, 'prompt_eval_duration'),
+                             (MODEL_LOAD_TIME, 'load_duration')):
+        if response.get(field) is not None:
+            histogram.labels(model).observe(response[field] / 1e9)
+
+    # Ollama only counts the prompt tokens it had to evaluate; the rest came from the cached prefix
+    evaluated = response.get('prompt_eval_count') or 0
+    PROMPT_TOKENS.labels(model, 'evaluated').inc(evaluated)
+    if prompt_tokens > evaluated:
+        PROMPT_TOKENS.labels(model, 'reused').inc(prompt_tokens - evaluated)
+
+    tokens = response.get('eval_count', 0)
+    if tokens:
+        GENERATED_TOKENS.labels(model).inc(tokens)
+        eval_duration = response.get('eval_duration') or response.get('total_duration', 0)
+        if eval_duration:
+            GENERATION_TOKENS_PER_SECOND.labels(model).observe(tokens / (eval_duration / 1e9))
+
+def instrument_telebot():
+    import telebot.apihelper
+    import telebot.asyncio_helper
+
+    if getattr(telebot.apihelper._make_request, 'instrumented', False):
+        return
+
+    make_request = telebot.apihelper._make_request
+    process_request = telebot.asyncio_helper._process_request
+
+    def timed_make_request(token, method_name, *args, **kwargs):
+        started = time.time()
+        try:
+            return make_request(token, method_name, *args, **kwargs)
+        finally:
+            TELEGRAM_LATENCY.labels(method_name).observe(time.time() - started)
+
+    async def timed_process_request(token, method_name, *args, **kwargs):
+        started = time.time()
+        try:
+            return await process_request(token, method_name, *args, **kwargs)
+        finally:
+            TELEGRAM_LATENCY.labels(method_name).observe(time.time() - started)
+
+    timed_make_request.instrumented = True
+    telebot.apihelper._make_request = timed_make_request
+    telebot.asyncio_helper._process_request = timed_process_request
+
+class QueueCollector:
+    def __init__(self, get_queue_stats):
+        self.get_queue_stats = get_queue_stats
+
+    def collect(self):
+        stats = self.get_queue_stats()
+        if 'error' in stats:
+            return
+
+        queued = GaugeMetricFamily('ai_queue_jobs', 'Jobs waiting per queue', labels=['queue'])
+        for name, length in stats.get('queues', {}).items():
+            queued.add_metric([name], length)
+        yield queued
+
+        for key in ('started_jobs', 'finished_jobs', 'failed_jobs'):
+            yield GaugeMetricFamily(f"ai_queue_{key}", f"Jobs in the {key.split('_')[0]} registries", value=stats.get(key, 0))
+        yield GaugeMetricFamily('ai_queue_estimated_wait_seconds', 'Admission control wait estimate',
+                                value=stats.get('estimated_wait', 0))
+
+def start_metrics_server(port: int, collectors=()):
+    if not METRICS_ENABLED:
+        return
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+
+    try:
+        for collector in collectors:
+            registry.register(collector)
+        start_http_server(port, registry=registry)
+        logger.info(f"Metrics available on port {port}")
+    except (OSError, ValueError) as e:
+        logger.error(f"Metrics server error: {e}")
@@ -0,0 +1,152 @@
+import time
+import random
+import hashlib
+import threading
+import httpx
+import ollama
+import logging
+from decouple import config
+from typing import Optional, Dict, Any, Callable, List
+from metrics import OLLAMA_BACKEND_REQUESTS
+
+class NoBackendAvailable(Exception):
+    pass
+
+class Backend:
+    def __init__(self, url: str, limits: httpx.Limits):
+        self.url = url
+        self.limits = limits
+        self.client = ollama.Client(host=url, limits=limits)
+        self.async_client = None
+        self.outstanding = 0
+        self.latency_ewma = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.models = None
+
+    def get_async_client(self):
+        if self.async_client is None:
+            self.async_client = ollama.AsyncClient(host=self.url, limits=self.limits)
+        return self.async_client
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'latency_ewma': self.latency_ewma,
+            'circuit_open': time.time() < self.open_until,
+            'consecutive_failures': self.consecutive_failures
+        }
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500 or error.status_code == 404
+    return isinstance(error, (httpx.TransportError, ConnectionError))
+
+class ModelRouter:
+    def __init__(self, urls: List[str], limits: httpx.Limits):
+        self.backends = [Backend(url, limits) for url in urls]
+        self.strategy = config("ROUTER_STRATEGY", default="least_outstanding")
+        self.max_attempts = config("ROUTER_MAX_ATTEMPTS", default=2, cast=int)
+        self.ewma_alpha = config("ROUTER_EWMA_ALPHA", default=0.3, cast=float)
+        self.failure_threshold = config("CIRCUIT_FAILURE_THRESHOLD", default=3, cast=int)
+        self.open_seconds = config("CIRCUIT_OPEN_SECONDS", default=30, cast=float)
+        self.affinity_slack = config("ROUTER_AFFINITY_SLACK", default=2, cast=int)
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def score(self, backend: Backend):
+        latency = backend.latency_ewma or 0.0
+        if self.strategy == "ewma":
+            return (latency * (backend.outstanding + 1), random.random())
+        return (backend.outstanding, latency, random.random())
+
+    def affinity_rank(self, affinity: str, backend: Backend) -> bytes:
+        return hashlib.blake2b(f"{affinity}:{backend.url}".encode(), digest_size=8).digest()
+
+    def candidates(self, model: str, affinity: Optional[str] = None) -> List[Backend]:
+        now = time.time()
+        with self.lock:
+            serving = [backend for backend in self.backends if backend.serves(model)] or self.backends
+            closed = sorted((backend for backend in serving if backend.open_until <= now), key=self.score)
+            if closed and affinity and self.affinity_slack >= 0:
+                # Rendezvous hashing sends a conversation back to the host that holds its prompt
+                # prefix in the KV cache, unless that host is much busier than the best one
+                preferred = max(closed, key=lambda backend: self.affinity_rank(affinity, backend))
+                if preferred.outstanding <= closed[0].outstanding + self.affinity_slack:
+                    closed.remove(preferred)
+                    closed.insert(0, preferred)
+            if closed:
+                return closed[:self.max_attempts]
+            return sorted(serving, key=lambda backend: backend.open_until)[:1]
+
+    def acquire(self, backend: Backend) -> float:
+        with self.lock:
+            backend.outstanding += 1
+        return time.time()
+
+    def release(self, backend: Backend, started: float, error: Optional[Exception] = None):
+        OLLAMA_BACKEND_REQUESTS.labels(backend.url, 'success' if error is None else 'failure').inc()
+        with self.lock:
+            backend.outstanding -= 1
+            if error is None:
+                latency = time.time() - started
+                if backend.latency_ewma is None:
+                    backend.latency_ewma = latency
+                else:
+                    backend.latency_ewma += self.ewma_alpha * (latency - backend.latency_ewma)
+                backend.consecutive_failures = 0
+                backend.open_until = 0.0
+                return
+
+            if isinstance(error, ollama.ResponseError) and error.status_code == 404:
+                backend.models = None
+                return
+
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.failure_threshold:
+                backend.open_until = time.time() + self.open_seconds
+                self.logger.warning(f"Circuit opened for {backend.url} after {backend.consecutive_failures} failures")
+
+    def call(self, model: str, request: Callable[[Backend], Any], can_retry: Callable[[], bool] = lambda: True,
+             affinity: Optional[str] = None):
+        error = None
+        for backend in self.candidates(model, affinity):
+            started = self.acquire(backend)
+            try:
+                result = request(backend)
+            except Exception as e:
+                self.release(backend, started, e)
+                error = e
+                if not is_retryable(e) or not can_retry():
+                    raise
+                self.logger.warning(f"Ollama request to {backend.url} failed, trying another backend: {e}")
+                continue
+            self.release(backend, started)
+            return result
+        raise error or NoBackendAvailable(f"No Ollama backend available for {model}")
+
+    async def call_async(self, model: str, request, can_retry: Callable[[], bool] = lambda: True,
+                         affinity: Optional[str] = None):
+        error = None
+        for backend in self.candidates(model, affinity):
+            started = self.acquire(backend)
+            try:
+                result = await request(backend)
+            except Exception as e:
+                self.release(backend, started, e)
+                error = e
+                if not is_retryable(e) or not can_retry():
+                    raise
+                self.logger.warning(f"Ollama request to {backend.url} failed, trying another backend: {e}")
+                continue
+            self.release(backend, started)
+            return result
+        raise error or NoBackendAvailable(f"No Ollama backend available for {model}")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [backend.stats() for backend in self.backends]
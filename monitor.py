@@ -1,10 +1,19 @@
 import time
 import sys
-import redis
+import json
+import math
+import argparse
+import threading
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from termcolor import colored
-from decouple import config
-from task_queue import get_queue_stats, redis_client
+from decouple import config, Csv
+from typing import Dict, Any, List, Optional
+from task_queue import get_queue_stats, get_jobs_status, redis_client, task_queues
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
 
 class SystemMonitor:
     def __init__(self):
@@ -12,7 +21,9 @@ class SystemMonitor:
         self.redis_port = config("REDIS_PORT", default=6379, cast=int)
         self.ollama_host = config("OLLAMA_HOST", default="localhost")
         self.ollama_port = config("OLLAMA_PORT", default=11434, cast=int)
-        
+        self.ollama_urls = config("OLLAMA_HOSTS", default="", cast=Csv()) or [f"http://{self.ollama_host}:{self.ollama_port}"]
+        self.ollama_timeout = config("MONITOR_OLLAMA_TIMEOUT", default=3, cast=float)
+    
     def check_redis(self):
         try:
             redis_client.ping()
@@ -20,9 +31,9 @@ class SystemMonitor:
         except Exception as e:
             return {"status": "❌", "message": f"Redis error: {str(e)}"}
     
-    def check_ollama(self):
+    def check_ollama_host(self, url):
         try:
-            response = requests.get(f"http://{self.ollama_host}:{self.ollama_port}/api/tags", timeout=5)
+            response = requests.get(f"{url}/api/tags", timeout=self.ollama_timeout)
             if response.status_code == 200:
                 models = response.json().get('models', [])
                 model_count = len(models)
@@ -32,19 +43,44 @@ class SystemMonitor:
         except Exception as e:
             return {"status": "❌", "message": f"Ollama error: {str(e)}"}
     
-    def get_system_status(self):
-        redis_status = self.check_redis()
-        ollama_status = self.check_ollama()
+    def check_ollama(self):
+        if len(self.ollama_urls) == 1:
+            return self.check_ollama_host(self.ollama_urls[0])
         
+        # Hosts are checked in parallel, so one hung host costs a single timeout
+        with ThreadPoolExecutor(max_workers=len(self.ollama_urls)) as pool:
+            results = list(pool.map(self.check_ollama_host, self.ollama_urls))
+        running = sum(result["status"] == "✅" for result in results)
+        details = ", ".join(f"{url} {result['status']}" for url, result in zip(self.ollama_urls, results))
+        status = "✅" if running == len(results) else ("⚠️" if running else "❌")
+        return {"status": status, "message": f"{running}/{len(results)} Ollama hosts running ({details})"}
+    
+    def get_running_jobs(self):
         try:
-            queue_stats = get_queue_stats()
+            with redis_client.pipeline(transaction=False) as pipe:
+                for queue in task_queues:
+                    pipe.zrange(queue.started_job_registry.key, 0, -1)
+                job_ids = [job_id.decode() for ids in pipe.execute() for job_id in ids]
+            return list(get_jobs_status(job_ids).values())
         except Exception as e:
-            queue_stats = {"error": str(e)}
+            return [{"job_id": "-", "status": "unknown", "error": str(e)}]
+    
+    def get_system_status(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            ollama_status = pool.submit(self.check_ollama)
+            redis_status = self.check_redis()
+            
+            try:
+                queue_stats = get_queue_stats()
+            except Exception as e:
+                queue_stats = {"error": str(e)}
+            running_jobs = self.get_running_jobs()
         
         return {
             "redis": redis_status,
-            "ollama": ollama_status,
+            "ollama": ollama_status.result(),
             "queue": queue_stats,
+            "running_jobs": running_jobs,
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
         }
     
@@ -69,25 +105,274 @@ class SystemMonitor:
             print(f"  ❌ Failed: {queue_info.get('failed_jobs', 0)}")
             print(f"  🏃 Running: {queue_info.get('started_jobs', 0)}")
             print(f"  ⏸️ Deferred: {queue_info.get('deferred_jobs', 0)}")
+            for name, wait in queue_info.get('wait_times', {}).items():
+                print(f"  ⏳ {name}: {queue_info['queues'].get(name, 0)} queued, "
+                      f"wait p50 {wait['p50']:.1f}s / p95 {wait['p95']:.1f}s / p99 {wait['p99']:.1f}s")
         else:
             print(f"Queue: ❌ {queue_info['error']}")
         
+        if status['running_jobs']:
+            print(colored("\n🏃 Running Jobs:", "yellow"))
+            for job in status['running_jobs']:
+                print(f"  {job['job_id']}: {job['status']} since {job.get('started_at') or '-'}")
+        
         print(colored("=" * 60, "blue"))
 
+def sparkline(values: List[float], width: int) -> str:
+    values = values[-width:]
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    if high == low:
+        return SPARK_BLOCKS[0 if high == 0 else 3] * len(values)
+    return "".join(SPARK_BLOCKS[int((value - low) / (high - low) * (len(SPARK_BLOCKS) - 1))] for value in values)
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds // 60:.0f}m{seconds % 60:02.0f}s"
+    return f"{seconds // 3600:.0f}h{seconds % 3600 // 60:02.0f}m"
+
+class LiveMonitor(SystemMonitor):
+    def __init__(self, interval: Optional[float] = None, history: Optional[int] = None):
+        super().__init__()
+        self.interval = interval or config("MONITOR_INTERVAL", default=2, cast=float)
+        self.samples = deque(maxlen=history or config("MONITOR_HISTORY", default=1800, cast=int))
+        self.rate_window = config("MONITOR_RATE_WINDOW", default=60, cast=float)
+        self.trend_window = config("MONITOR_TREND_WINDOW", default=300, cast=float)
+        self.ollama_interval = config("MONITOR_OLLAMA_INTERVAL", default=15, cast=float)
+        self.ollama_status = {"status": "…", "message": "Ollama not checked yet"}
+        self.redis_status = {"status": "…", "message": "Redis not sampled yet"}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def sample(self) -> Optional[Dict[str, Any]]:
+        stats = get_queue_stats()
+        if 'error' in stats:
+            self.redis_status = {"status": "❌", "message": f"Redis error: {stats['error']}"}
+            return None
+
+        self.redis_status = {"status": "✅", "message": "Redis is running"}
+        totals = stats['totals']
+        waits = stats['wait_times'].values()
+        sample = {
+            'time': time.time(),
+            'queue_length': stats['queue_length'],
+            'queues': stats['queues'],
+            'running': stats['started_jobs'],
+            'workers': stats['workers'],
+            'finished': totals.get('finished', 0),
+            'errors': totals.get('errors', 0) + totals.get('failed', 0),
+            'cancelled': totals.get('cancelled', 0),
+            'tokens': totals.get('tokens', 0),
+            'wait_p95': max((wait['p95'] for wait in waits), default=0.0),
+            'run_p50': stats['run_times']['p50'],
+            'run_p95': stats['run_times']['p95'],
+            'run_p99': stats['run_times']['p99'],
+            'estimated_wait': stats['estimated_wait']
+        }
+        with self.lock:
+            self.samples.append(sample)
+        return sample
+
+    def rates(self, window: float) -> Dict[str, Any]:
+        with self.lock:
+            if not self.samples:
+                return {}
+            last = self.samples[-1]
+            first = next((sample for sample in self.samples if sample['time'] >= last['time'] - window), last)
+
+        elapsed = last['time'] - first['time']
+        if elapsed <= 0:
+            return {'window': 0.0}
+
+        # Counters restart from zero when Redis is flushed; a negative delta counts as no progress
+        def delta(key):
+            return max(0, last[key] - first[key])
+
+        completed = delta('finished') + delta('errors')
+        completion_rate = completed / elapsed
+        backlog_rate = (last['queue_length'] - first['queue_length']) / elapsed
+        arrival_rate = max(0.0, completion_rate + backlog_rate)
+        per_worker = completion_rate / last['workers'] if last['workers'] else 0.0
+
+        if not last['queue_length']:
+            drain_eta = 0.0
+        elif backlog_rate < 0:
+            drain_eta = last['queue_length'] / -backlog_rate
+        else:
+            drain_eta = None
+
+        return {
+            'window': elapsed,
+            'jobs_per_minute': completion_rate * 60,
+            'arrivals_per_minute': arrival_rate * 60,
+            'tokens_per_second': delta('tokens') / elapsed,
+            'error_rate': delta('errors') / completed if completed else 0.0,
+            'backlog_per_minute': backlog_rate * 60,
+            'drain_eta': drain_eta,
+            'workers_needed': math.ceil(arrival_rate / per_worker) if per_worker else None
+        }
+
+    def series(self, key: str) -> List[float]:
+        with self.lock:
+            return [sample[key] for sample in self.samples]
+
+    def rate_series(self, key: str) -> List[float]:
+        with self.lock:
+            samples = list(self.samples)
+        return [max(0, current[key] - previous[key]) / max(current['time'] - previous['time'], 1e-9)
+                for previous, current in zip(samples, samples[1:])]
+
+    def watch_ollama(self):
+        while not self.stopped.is_set():
+            self.ollama_status = self.check_ollama()
+            self.stopped.wait(self.ollama_interval)
+
+    def run_sampler(self):
+        while not self.stopped.is_set():
+            started = time.time()
+            try:
+                self.sample()
+            except Exception as e:
+                self.redis_status = {"status": "❌", "message": f"Sampling error: {e}"}
+            self.stopped.wait(max(0.0, self.interval - (time.time() - started)))
+
+    def start(self):
+        threading.Thread(target=self.watch_ollama, daemon=True).start()
+        threading.Thread(target=self.run_sampler, daemon=True).start()
+        return self
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            samples = list(self.samples)
+        return {
+            'redis': self.redis_status,
+            'ollama': self.ollama_status,
+            'current': samples[-1] if samples else None,
+            'rates': self.rates(self.rate_window),
+            'trend': self.rates(self.trend_window),
+            'samples': samples
+        }
+
+    def render(self, color: bool = True, width: int = 60) -> List[str]:
+        def paint(text, name):
+            return colored(text, name) if color else text
+
+        def trend(current, previous):
+            if previous is None or abs(current - previous) < max(abs(previous) * 0.05, 1e-9):
+                return "→"
+            return "↑" if current > previous else "↓"
+
+        lines = [
+            paint("=" * width, "blue"),
+            paint(f"📈 Live Monitor - {time.strftime('%Y-%m-%d %H:%M:%S')} "
+                  f"(every {self.interval:g}s, {len(self.samples)}/{self.samples.maxlen} samples)", "cyan"),
+            paint("=" * width, "blue"),
+            f"Redis: {self.redis_status['status']} {self.redis_status['message']}",
+            f"Ollama: {self.ollama_status['status']} {self.ollama_status['message']}"
+        ]
+
+        with self.lock:
+            current = self.samples[-1] if self.samples else None
+        if current is None:
+            return lines + ["Waiting for the first sample..."]
+
+        rates = self.rates(self.rate_window)
+        slow = self.rates(self.trend_window)
+        spark = width - 30
+
+        def rate_line(label, key, fmt, series):
+            value = rates.get(key, 0.0)
+            return (f"  {label:<16} {format(value, fmt):>9} {trend(value, slow.get(key))} "
+                    f"{paint(sparkline(series, spark), 'green')}")
+
+        lines += [
+            paint(f"\n📊 Queue (rates over {format_duration(rates.get('window'))}, trend against "
+                  f"{format_duration(slow.get('window'))}):", "yellow"),
+            f"  {'Backlog':<16} {current['queue_length']:>9} "
+            f"{trend(rates.get('backlog_per_minute', 0.0), 0.0)} {paint(sparkline(self.series('queue_length'), spark), 'green')}",
+            f"  {'Running/workers':<16} {current['running']:>4}/{current['workers']:<4} "
+            f"{paint(sparkline(self.series('running'), spark), 'green')}",
+            rate_line("Jobs/min", 'jobs_per_minute', '.1f', [rate * 60 for rate in self.rate_series('finished')]),
+            rate_line("Tokens/s", 'tokens_per_second', '.1f', self.rate_series('tokens')),
+            rate_line("Error rate", 'error_rate', '.1%', self.rate_series('errors')),
+            f"  {'Arrivals/min':<16} {rates.get('arrivals_per_minute', 0.0):>9.1f}   "
+            f"backlog {rates.get('backlog_per_minute', 0.0):+.1f}/min",
+            f"  {'Drain ETA':<16} {format_duration(rates.get('drain_eta')) if rates.get('drain_eta') is not None else 'not draining':>9}"
+            f"   admission estimate {format_duration(current['estimated_wait'])}",
+            f"  {'Workers needed':<16} {rates.get('workers_needed') or '-':>9}   to keep up with current arrivals",
+            paint("\n⏱️ Latency (recent jobs):", "yellow"),
+            f"  Queue wait p95 {current['wait_p95']:.1f}s {paint(sparkline(self.series('wait_p95'), spark), 'green')}",
+            f"  Run time p50 {current['run_p50']:.1f}s / p95 {current['run_p95']:.1f}s / p99 {current['run_p99']:.1f}s "
+            f"{paint(sparkline(self.series('run_p95'), max(spark - 30, 10)), 'green')}",
+            paint("=" * width, "blue")
+        ]
+        return lines
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        monitor = self.server.monitor
+        if self.path == '/series':
+            body = json.dumps(monitor.snapshot(), ensure_ascii=False).encode()
+            content_type = 'application/json'
+        elif self.path == '/':
+            text = "\n".join(monitor.render(color=False)).replace("&", "&amp;").replace("<", "&lt;")
+            body = (f"<!doctype html><html><head><meta charset=\"utf-8\">"
+                    f"<meta http-equiv=\"refresh\" content=\"{max(1, int(monitor.interval))}\">"
+                    f"<title>AI bot monitor</title></head><body><pre>{text}</pre>"
+                    f"<p><a href=\"/series\">raw samples (JSON)</a></p></body></html>").encode()
+            content_type = 'text/html; charset=utf-8'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve_dashboard(monitor: LiveMonitor, port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(('0.0.0.0', port), DashboardHandler)
+    server.daemon_threads = True
+    server.monitor = monitor
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
 def main():
-    monitor = SystemMonitor()
-    
-    if len(sys.argv) > 1 and sys.argv[1] == "--watch":
-        print(colored("🔍 Continuous monitoring mode (Ctrl+C to exit)", "green"))
-        try:
-            while True:
-                monitor.print_status()
-                time.sleep(10)
-                print("\n")
-        except KeyboardInterrupt:
-            print(colored("\n👋 Monitoring stopped", "yellow"))
-    else:
-        monitor.print_status()
+    parser = argparse.ArgumentParser(description="System status and live queue monitoring")
+    parser.add_argument("--watch", action="store_true", help="Live dashboard with rates and trends in the terminal")
+    parser.add_argument("--http", type=int, metavar="PORT", help="Serve the live dashboard and its samples over HTTP")
+    parser.add_argument("--interval", type=float, help="Seconds between samples (MONITOR_INTERVAL)")
+    parser.add_argument("--history", type=int, help="Samples kept in memory (MONITOR_HISTORY)")
+    args = parser.parse_args()
+
+    if not args.watch and not args.http:
+        SystemMonitor().print_status()
+        return
+
+    monitor = LiveMonitor(args.interval, args.history).start()
+    if args.http:
+        serve_dashboard(monitor, args.http)
+        print(colored(f"🌐 Dashboard on http://localhost:{args.http}/ (samples at /series)", "green"))
+
+    print(colored("🔍 Live monitoring mode (Ctrl+C to exit)", "green"))
+    try:
+        while True:
+            if args.watch:
+                sys.stdout.write("\033[H\033[2J" + "\n".join(monitor.render()) + "\n")
+                sys.stdout.flush()
+            time.sleep(monitor.interval)
+    except KeyboardInterrupt:
+        monitor.stopped.set()
+        print(colored("\n👋 Monitoring stopped", "yellow"))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
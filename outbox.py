@@ -0,0 +1,259 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+import requests
+import aiohttp
+import telebot.apihelper
+import telebot.asyncio_helper
+from collections import deque
+from concurrent.futures import Future
+from decouple import config
+from typing import Optional, Callable
+from metrics import TELEGRAM_RETRIES, OUTBOX_DELAY
+
+API_ERRORS = (telebot.apihelper.ApiTelegramException, telebot.asyncio_helper.ApiTelegramException)
+TRANSIENT_ERRORS = (
+    requests.exceptions.RequestException,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+    telebot.asyncio_helper.RequestTimeout
+)
+
+def retry_after(error: Exception) -> Optional[float]:
+    if isinstance(error, API_ERRORS) and error.error_code == 429:
+        parameters = (error.result_json or {}).get('parameters') or {}
+        return float(parameters.get('retry_after', 1))
+    return None
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, API_ERRORS):
+        return error.error_code >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+def is_bad_request(error: Exception) -> bool:
+    return isinstance(error, API_ERRORS) and error.error_code == 400
+
+def is_not_modified(error: Exception) -> bool:
+    # Editing a message to the text it already has, e.g. when a delivery is replayed after a restart
+    return is_bad_request(error) and 'message is not modified' in str(error.description)
+
+class FollowUp:
+    # Returned by a call that made one Telegram request and has another to make, so every request
+    # waits for its own chat token and global slot
+    def __init__(self, call: Callable, *args, **kwargs):
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+
+class SendOperation:
+    def __init__(self, future, call: Callable, args, kwargs):
+        self.future = future
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.queued_at = time.time()
+        self.attempts = 0
+
+    def follow(self, follow_up: FollowUp):
+        self.call = follow_up.call
+        self.args = follow_up.args
+        self.kwargs = follow_up.kwargs
+        self.attempts = 0
+
+class ChatLane:
+    def __init__(self, capacity: float, rate: float):
+        self.operations = deque()
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.time()
+        self.blocked_until = 0.0
+        self.scheduled = False
+
+    def ready_at(self) -> float:
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 or self.rate <= 0 else (1 - self.tokens) / self.rate
+        return max(now + wait, self.blocked_until)
+
+    def consume(self):
+        self.tokens -= 1
+
+    def idle(self) -> bool:
+        return not self.operations and not self.scheduled and self.ready_at() <= time.time() and self.tokens >= self.capacity
+
+class SendPacer:
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+            return slot - now
+
+class BaseOutbox:
+    def __init__(self):
+        self.workers = config("OUTBOX_WORKERS", default=8, cast=int)
+        self.chat_rate = config("OUTBOX_CHAT_RATE", default=1, cast=float)
+        self.chat_burst = config("OUTBOX_CHAT_BURST", default=3, cast=float)
+        self.max_retries = config("OUTBOX_MAX_RETRIES", default=3, cast=int)
+        self.backoff = config("OUTBOX_BACKOFF", default=0.5, cast=float)
+        self.pacer = SendPacer(config("OUTBOX_GLOBAL_RATE", default=30, cast=float))
+        self.lanes = {}
+        self.submitted = 0
+        self.logger = logging.getLogger(__name__)
+
+    def lane(self, chat_id: int) -> ChatLane:
+        self.submitted += 1
+        if self.submitted % 1000 == 0:
+            for idle_chat_id in [key for key, lane in self.lanes.items() if lane.idle()]:
+                del self.lanes[idle_chat_id]
+
+        lane = self.lanes.get(chat_id)
+        if lane is None:
+            lane = self.lanes[chat_id] = ChatLane(self.chat_burst, self.chat_rate)
+        return lane
+
+    def should_retry(self, chat_id: int, lane: ChatLane, operation: SendOperation, error: Exception) -> bool:
+        wait = retry_after(error)
+        if wait is not None:
+            # Flood waits only pause the chat that hit them; other chats keep sending
+            TELEGRAM_RETRIES.labels('rate_limited').inc()
+            lane.blocked_until = max(lane.blocked_until, time.time() + wait)
+            self.logger.warning(f"Telegram flood wait for chat {chat_id}: retrying in {wait:.1f}s")
+            return True
+
+        operation.attempts += 1
+        if is_transient(error) and operation.attempts <= self.max_retries:
+            TELEGRAM_RETRIES.labels('error').inc()
+            lane.blocked_until = max(lane.blocked_until, time.time() + self.backoff * 2 ** (operation.attempts - 1))
+            self.logger.warning(f"Telegram call for chat {chat_id} failed, retrying: {error}")
+            return True
+        return False
+
+    def complete(self, chat_id: int, operation: SendOperation, result=None, error: Optional[Exception] = None):
+        if error is None:
+            OUTBOX_DELAY.observe(time.time() - operation.queued_at)
+            operation.future.set_result(result)
+            return
+
+        self.logger.error(f"Telegram call for chat {chat_id} failed: {error}")
+        operation.future.set_exception(error)
+        # Mark the error as retrieved so unawaited futures do not log it again
+        operation.future.exception()
+
+class Outbox(BaseOutbox):
+    def __init__(self):
+        super().__init__()
+        self.ready = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def start(self):
+        for _ in range(self.workers):
+            threading.Thread(target=self.run_worker, daemon=True).start()
+        return self
+
+    def submit(self, chat_id: int, call: Callable, *args, **kwargs) -> Future:
+        operation = SendOperation(Future(), call, args, kwargs)
+        with self.condition:
+            lane = self.lane(chat_id)
+            lane.operations.append(operation)
+            if not lane.scheduled:
+                self.schedule(chat_id, lane)
+        return operation.future
+
+    def schedule(self, chat_id: int, lane: ChatLane):
+        lane.scheduled = True
+        heapq.heappush(self.ready, (lane.ready_at(), next(self.sequence), chat_id))
+        self.condition.notify()
+
+    def next_lane(self):
+        with self.condition:
+            while True:
+                now = time.time()
+                if self.ready and self.ready[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self.ready)
+                    return chat_id, self.lanes[chat_id]
+                self.condition.wait(self.ready[0][0] - now if self.ready else None)
+
+    def run_worker(self):
+        while True:
+            chat_id, lane = self.next_lane()
+            operation = lane.operations[0]
+            done = True
+
+            delay = self.pacer.reserve()
+            if delay:
+                time.sleep(delay)
+            lane.consume()
+
+            try:
+                result = operation.call(*operation.args, **operation.kwargs)
+                if isinstance(result, FollowUp):
+                    operation.follow(result)
+                    done = False
+                else:
+                    self.complete(chat_id, operation, result=result)
+            except Exception as e:
+                done = not self.should_retry(chat_id, lane, operation, e)
+                if done:
+                    self.complete(chat_id, operation, error=e)
+
+            with self.condition:
+                if done:
+                    lane.operations.popleft()
+                lane.scheduled = False
+                if lane.operations:
+                    self.schedule(chat_id, lane)
+
+class AsyncOutbox(BaseOutbox):
+    def __init__(self):
+        super().__init__()
+        self.semaphore = asyncio.Semaphore(self.workers)
+        self.tasks = {}
+
+    def submit(self, chat_id: int, call: Callable, *args, **kwargs) -> asyncio.Future:
+        operation = SendOperation(asyncio.get_running_loop().create_future(), call, args, kwargs)
+        lane = self.lane(chat_id)
+        lane.operations.append(operation)
+        if not lane.scheduled:
+            lane.scheduled = True
+            self.tasks[chat_id] = asyncio.create_task(self.run_lane(chat_id, lane))
+        return operation.future
+
+    async def run_lane(self, chat_id: int, lane: ChatLane):
+        try:
+            while lane.operations:
+                operation = lane.operations[0]
+                await asyncio.sleep(max(0.0, lane.ready_at() - time.time()))
+
+                async with self.semaphore:
+                    delay = self.pacer.reserve()
+                    if delay:
+                        await asyncio.sleep(delay)
+                    lane.consume()
+
+                    try:
+                        result = await operation.call(*operation.args, **operation.kwargs)
+                        if isinstance(result, FollowUp):
+                            operation.follow(result)
+                            continue
+                        self.complete(chat_id, operation, result=result)
+                    except Exception as e:
+                        if self.should_retry(chat_id, lane, operation, e):
+                            continue
+                        self.complete(chat_id, operation, error=e)
+
+                lane.operations.popleft()
+        finally:
+            lane.scheduled = False
+            self.tasks.pop(chat_id, None)
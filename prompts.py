@@ -0,0 +1,43 @@
+import hashlib
+from decouple import config
+from typing import Optional, Dict, List
+
+def normalize_text(text: str) -> str:
+    return '\n'.join(line.rstrip() for line in text.replace('\r\n', '\n').replace('\r', '\n').strip().split('\n'))
+
+DEFAULT_SYSTEM_PROMPT = normalize_text(config(
+    "SYSTEM_PROMPT",
+    default="You are a helpful AI assistant. Provide short and clear answers in Turkish."
+))
+
+def build_messages(prompt: str, system_prompt: Optional[str],
+                   history: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+    # The system prompt, summary and earlier turns come first and are sent byte for byte as before,
+    # so Ollama can reuse the KV cache of the previous turn and only evaluate the new question
+    messages = []
+
+    if system_prompt:
+        messages.append({
+            'role': 'system',
+            'content': normalize_text(system_prompt)
+        })
+
+    if history:
+        messages.extend(history)
+
+    messages.append({
+        'role': 'user',
+        'content': normalize_text(prompt)
+    })
+    return messages
+
+def prefix_key(messages: List[Dict[str, str]]) -> Optional[str]:
+    # Conversations are identified by the start of their history window, which stays fixed
+    # until the window moves; a bare system prompt is cached on every host and needs no affinity
+    if len(messages) < 3:
+        return None
+    digest = hashlib.blake2b(digest_size=8)
+    for message in messages[:2]:
+        digest.update(message['role'].encode())
+        digest.update(message['content'].encode())
+    return digest.hexdigest()
@@ -0,0 +1,189 @@
+import math
+import time
+from decouple import config
+from typing import Optional, Dict, Any, List, Tuple
+from rq.worker_registration import WORKERS_BY_QUEUE_KEY
+
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local states = {}
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        retry_after = math.max(retry_after, (1 - tokens) / rate)
+    end
+    states[i] = tokens
+end
+
+if retry_after > 0 then
+    return tostring(retry_after)
+end
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', states[i] - 1, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return '0'
+"""
+
+REFUND_TOKEN_SCRIPT = """
+for i, key in ipairs(KEYS) do
+    local tokens = tonumber(redis.call('HGET', key, 'tokens'))
+    if tokens then
+        redis.call('HSET', key, 'tokens', math.min(tonumber(ARGV[i]), tokens + 1))
+    end
+end
+return 0
+"""
+
+RECORD_DURATION_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]))
+local sample = tonumber(ARGV[1])
+local alpha = tonumber(ARGV[2])
+if current then
+    sample = current + alpha * (sample - current)
+end
+redis.call('SET', KEYS[1], sample)
+return tostring(sample)
+"""
+
+class RateLimiter:
+    def __init__(self, connection):
+        self.connection = connection
+        self.enabled = config("RATE_LIMIT_ENABLED", default=True, cast=bool)
+        self.user_capacity = config("USER_RATE_CAPACITY", default=5, cast=int)
+        self.user_refill = config("USER_RATE_REFILL", default=0.1, cast=float)
+        self.chat_capacity = config("CHAT_RATE_CAPACITY", default=20, cast=int)
+        self.chat_refill = config("CHAT_RATE_REFILL", default=0.5, cast=float)
+        self.token_bucket = connection.register_script(TOKEN_BUCKET_SCRIPT)
+        self.refund_script = connection.register_script(REFUND_TOKEN_SCRIPT)
+
+    def buckets(self, user_id: int, chat_id: int) -> List[Tuple[str, int, float]]:
+        buckets = [(f"ratelimit:user:{user_id}", self.user_capacity, self.user_refill)]
+        if chat_id != user_id:
+            buckets.append((f"ratelimit:chat:{chat_id}", self.chat_capacity, self.chat_refill))
+        return buckets
+
+    def acquire_call(self, user_id: int, chat_id: int) -> Dict[str, list]:
+        buckets = self.buckets(user_id, chat_id)
+        args = []
+        for _, capacity, refill in buckets:
+            args.extend([capacity, refill])
+        return {'keys': [key for key, _, _ in buckets], 'args': args}
+
+    def refund_call(self, user_id: int, chat_id: int) -> Dict[str, list]:
+        buckets = self.buckets(user_id, chat_id)
+        return {'keys': [key for key, _, _ in buckets], 'args': [capacity for _, capacity, _ in buckets]}
+
+    def acquire(self, user_id: int, chat_id: int) -> float:
+        if not self.enabled:
+            return 0.0
+        return float(self.token_bucket(**self.acquire_call(user_id, chat_id)))
+
+    def refund(self, user_id: int, chat_id: int):
+        # Gives back the token of a message that was turned away for another reason
+        if self.enabled:
+            self.refund_script(**self.refund_call(user_id, chat_id))
+
+class AsyncRateLimiter(RateLimiter):
+    # The same buckets on a redis.asyncio client, whose registered scripts are awaitable
+    async def acquire(self, user_id: int, chat_id: int) -> float:
+        if not self.enabled:
+            return 0.0
+        return float(await self.token_bucket(**self.acquire_call(user_id, chat_id)))
+
+    async def refund(self, user_id: int, chat_id: int):
+        if self.enabled:
+            await self.refund_script(**self.refund_call(user_id, chat_id))
+
+class AdmissionController:
+    def __init__(self, connection, queues, scheduler):
+        self.connection = connection
+        self.queues = queues
+        self.scheduler = scheduler
+        self.enabled = config("ADMISSION_CONTROL_ENABLED", default=True, cast=bool)
+        self.max_queue_depth = config("MAX_QUEUE_DEPTH", default=200, cast=int)
+        self.max_estimated_wait = config("MAX_ESTIMATED_WAIT", default=120, cast=float)
+        self.notice_wait = config("WAIT_NOTICE_THRESHOLD", default=15, cast=float)
+        self.default_duration = config("DEFAULT_JOB_DURATION", default=10, cast=float)
+        self.duration_alpha = config("JOB_DURATION_ALPHA", default=0.2, cast=float)
+        self.duration_key = "ai_jobs:avg_duration"
+        self.slots_key = "ai_jobs:batch_slots"
+        self.record_script = connection.register_script(RECORD_DURATION_SCRIPT)
+
+    def record_duration(self, seconds: float):
+        self.record_script(keys=[self.duration_key], args=[seconds, self.duration_alpha])
+
+    def register_slots(self, worker_name: str, slots: int, ttl: float):
+        with self.connection.pipeline() as pipe:
+            pipe.zremrangebyscore(self.slots_key, 0, time.time())
+            pipe.zadd(self.slots_key, {f"{worker_name}:{slots}": time.time() + ttl})
+            pipe.execute()
+
+    def unregister_slots(self, worker_name: str, slots: int):
+        self.connection.zrem(self.slots_key, f"{worker_name}:{slots}")
+
+    def queue_estimate_commands(self, pipe) -> int:
+        for queue in self.queues:
+            pipe.llen(queue.key)
+            pipe.get(self.scheduler.staged_key(queue.name))
+        pipe.scard(WORKERS_BY_QUEUE_KEY % self.queues[0].name)
+        pipe.zrangebyscore(self.slots_key, time.time(), '+inf')
+        pipe.get(self.duration_key)
+        return 2 * len(self.queues) + 3
+
+    def parse_estimate(self, replies: List[Any]) -> Dict[str, Any]:
+        *lengths, workers, batch_slots, avg_duration = replies
+        queues = {
+            queue.name: max(0, int(queued or 0)) + max(0, int(staged or 0))
+            for queue, queued, staged in zip(self.queues, lengths[0::2], lengths[1::2])
+        }
+        queue_length = sum(queues.values())
+        workers += sum(int(member.rsplit(b':', 1)[1]) for member in batch_slots)
+        avg_duration = float(avg_duration) if avg_duration else self.default_duration
+        waves = math.ceil((queue_length + 1) / max(workers, 1))
+        return {
+            'queue_length': queue_length,
+            'queues': queues,
+            'workers': workers,
+            'avg_duration': avg_duration,
+            'estimated_wait': waves * avg_duration
+        }
+
+    def estimate(self) -> Dict[str, Any]:
+        with self.connection.pipeline(transaction=False) as pipe:
+            self.queue_estimate_commands(pipe)
+            return self.parse_estimate(pipe.execute())
+
+    def admit(self, estimate: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if estimate is None:
+            return {'admitted': True, 'estimated_wait': 0.0, 'notify': False}
+
+        estimate['admitted'] = (
+            estimate['queue_length'] < self.max_queue_depth
+            and estimate['estimated_wait'] <= self.max_estimated_wait
+        )
+        estimate['notify'] = estimate['estimated_wait'] >= self.notice_wait
+        return estimate
+
+    def check(self) -> Dict[str, Any]:
+        return self.admit(self.estimate() if self.enabled else None)
+
+class AsyncAdmissionController(AdmissionController):
+    async def estimate(self) -> Dict[str, Any]:
+        async with self.connection.pipeline(transaction=False) as pipe:
+            self.queue_estimate_commands(pipe)
+            return self.parse_estimate(await pipe.execute())
+
+    async def check(self) -> Dict[str, Any]:
+        return self.admit(await self.estimate() if self.enabled else None)
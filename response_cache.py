@@ -0,0 +1,66 @@
+import re
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from decouple import config
+from typing import Optional, Dict, Any
+from metrics import CACHE_LOOKUPS
+
+def normalize_prompt(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+def make_cache_key(prompt: str, system_prompt: str, model: str) -> str:
+    raw = f"{model}\x00{system_prompt}\x00{normalize_prompt(prompt)}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+class ResponseCache:
+    def __init__(self):
+        self.enabled = config("RESPONSE_CACHE_ENABLED", default=True, cast=bool)
+        self.max_size = config("RESPONSE_CACHE_SIZE", default=1000, cast=int)
+        self.ttl = config("RESPONSE_CACHE_TTL", default=3600, cast=int)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                CACHE_LOOKUPS.labels('miss').inc()
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.labels('hit').inc()
+            return entry[1]
+
+    def put(self, key: str, response: str):
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
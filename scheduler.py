@@ -0,0 +1,130 @@
+from rq.utils import utcnow
+from decouple import config
+from typing import Dict, Any, List
+
+STAGE_JOB_SCRIPT = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+if redis.call('LLEN', KEYS[1]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[2])
+end
+return redis.call('INCR', KEYS[3])
+"""
+
+DISPATCH_SCRIPT = """
+local window = tonumber(ARGV[1])
+local dispatched = 0
+while redis.call('LLEN', KEYS[1]) < window do
+    local owner = redis.call('LPOP', KEYS[2])
+    if not owner then
+        break
+    end
+    local owner_key = ARGV[2] .. owner
+    local job_id = redis.call('LPOP', owner_key)
+    if job_id then
+        redis.call('RPUSH', KEYS[1], job_id)
+        redis.call('DECR', KEYS[3])
+        dispatched = dispatched + 1
+    end
+    if redis.call('LLEN', owner_key) > 0 then
+        redis.call('RPUSH', KEYS[2], owner)
+    end
+end
+return dispatched
+"""
+
+UNSTAGE_JOB_SCRIPT = """
+local removed = redis.call('LREM', KEYS[1], 0, ARGV[1])
+if removed > 0 then
+    redis.call('DECRBY', KEYS[2], removed)
+end
+return removed
+"""
+
+class FairScheduler:
+    def __init__(self, connection):
+        self.connection = connection
+        self.window = config("FAIR_DISPATCH_WINDOW", default=2, cast=int)
+        self.wait_samples = config("WAIT_TIME_SAMPLES", default=1000, cast=int)
+        self.stage_script = connection.register_script(STAGE_JOB_SCRIPT)
+        self.dispatch_script = connection.register_script(DISPATCH_SCRIPT)
+        self.unstage_script = connection.register_script(UNSTAGE_JOB_SCRIPT)
+
+    def owner_prefix(self, queue_name: str) -> str:
+        return f"ai_jobs:fair:{queue_name}:owner:"
+
+    def ring_key(self, queue_name: str) -> str:
+        return f"ai_jobs:fair:{queue_name}:ring"
+
+    def staged_key(self, queue_name: str) -> str:
+        return f"ai_jobs:fair:{queue_name}:staged"
+
+    def wait_key(self, queue_name: str) -> str:
+        return f"ai_jobs:wait:{queue_name}"
+
+    def submit(self, queue, job, owner):
+        job.origin = queue.name
+        job.enqueued_at = utcnow()
+        job.redis_server_version = queue.get_redis_server_version()
+        if job.timeout is None:
+            job.timeout = queue._default_timeout
+
+        with self.connection.pipeline() as pipe:
+            pipe.sadd(queue.redis_queues_keys, queue.key)
+            job.save(pipeline=pipe)
+            pipe.execute()
+
+        self.stage_script(
+            keys=[self.owner_prefix(queue.name) + str(owner), self.ring_key(queue.name), self.staged_key(queue.name)],
+            args=[job.id, owner]
+        )
+        self.dispatch(queue)
+        return job
+
+    def dispatch(self, queue) -> int:
+        return self.dispatch_script(
+            keys=[queue.key, self.ring_key(queue.name), self.staged_key(queue.name)],
+            args=[self.window, self.owner_prefix(queue.name)]
+        )
+
+    def unstage(self, queue, job_id: str, owner) -> int:
+        return self.unstage_script(
+            keys=[self.owner_prefix(queue.name) + str(owner), self.staged_key(queue.name)],
+            args=[job_id]
+        )
+
+    def staged_count(self, queue) -> int:
+        return max(0, int(self.connection.get(self.staged_key(queue.name)) or 0))
+
+    def record_wait(self, queue_name: str, seconds: float):
+        with self.connection.pipeline() as pipe:
+            pipe.lpush(self.wait_key(queue_name), round(seconds, 3))
+            pipe.ltrim(self.wait_key(queue_name), 0, self.wait_samples - 1)
+            pipe.execute()
+
+    def wait_stats_commands(self, pipe, queue_names: List[str]) -> int:
+        for name in queue_names:
+            pipe.lrange(self.wait_key(name), 0, -1)
+        return len(queue_names)
+
+    def wait_stats(self, queue_names: List[str]) -> Dict[str, Dict[str, Any]]:
+        with self.connection.pipeline(transaction=False) as pipe:
+            self.wait_stats_commands(pipe, queue_names)
+            return self.parse_wait_stats(queue_names, pipe.execute())
+
+    def parse_wait_stats(self, queue_names: List[str], samples: List[Any]) -> Dict[str, Dict[str, Any]]:
+        return {name: summarize_samples(values) for name, values in zip(queue_names, samples)}
+
+def summarize_samples(values: List[Any]) -> Dict[str, Any]:
+    ordered = sorted(float(value) for value in values)
+    return {
+        'samples': len(ordered),
+        'p50': percentile(ordered, 50),
+        'p95': percentile(ordered, 95),
+        'p99': percentile(ordered, 99)
+    }
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
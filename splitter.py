@@ -0,0 +1,138 @@
+import re
+import html
+import bisect
+from typing import Optional, List, Tuple
+
+MESSAGE_LIMIT = 4096
+FENCE_LINE = re.compile(r'^[ \t]*```[ \t]*([\w+#.-]*)[^\n]*$', re.M)
+SENTENCE_END = re.compile(r'[.!?…][)"\'»\]]*[ \t]+')
+INLINE_CODE = re.compile(r'`([^`\n]+)`')
+BOLD = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+HEADING = re.compile(r'^#{1,6}[ \t]+(.+?)[ \t#]*$', re.M)
+JOINERS = '\u200d\ufe0f\ufe0e'
+
+def utf16_length(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+def prefix_within(text: str, limit: int) -> int:
+    # Telegram counts UTF-16 code units, so characters outside the BMP (most emoji) count twice
+    if len(text) * 2 <= limit:
+        return len(text)
+    end = min(len(text), limit)
+    while utf16_length(text[:end]) > limit:
+        end -= (utf16_length(text[:end]) - limit + 1) // 2
+    return end
+
+def open_fence(text: str) -> Optional[str]:
+    language = None
+    for match in FENCE_LINE.finditer(text):
+        language = match.group(1) if language is None else None
+    return language
+
+def is_grapheme_break(text: str, index: int) -> bool:
+    if index <= 0 or index >= len(text):
+        return True
+    following, previous = text[index], text[index - 1]
+    return not (following in JOINERS or previous == '\u200d' or 0x0300 <= ord(following) <= 0x036f
+                or 0x1f3fb <= ord(following) <= 0x1f3ff)
+
+def find_cut(text: str, end: int) -> int:
+    window = text[:end]
+    floor = end // 2
+
+    fences = [match.start() for match in FENCE_LINE.finditer(window)]
+    candidates = []
+    for pattern in ('\n\n', '\n'):
+        position = window.rfind(pattern)
+        while position >= floor:
+            candidates.append(position + len(pattern))
+            position = window.rfind(pattern, 0, position)
+    if candidates:
+        # Line breaks outside code blocks first, then ones inside them (the block is closed and reopened)
+        return max(candidates, key=lambda cut: (bisect.bisect_left(fences, cut) % 2 == 0, cut))
+
+    sentences = [match.end() for match in SENTENCE_END.finditer(window, floor)]
+    if sentences:
+        return sentences[-1]
+
+    space = max(window.rfind(' '), window.rfind('\t'))
+    if space >= floor:
+        return space + 1
+
+    while end > 1 and not is_grapheme_break(text, end):
+        end -= 1
+    return end
+
+class MessageSplitter:
+    def __init__(self, limit: int = MESSAGE_LIMIT, max_chunks: int = 0):
+        self.limit = limit
+        self.max_chunks = max_chunks
+        self.sealed = {}
+        self.count = 0
+        self.tail = ''
+        self.length = 0
+
+    def feed(self, text: str):
+        self.length += len(text)
+        self.tail += text
+        while utf16_length(self.tail) > self.limit:
+            cut = find_cut(self.tail, prefix_within(self.tail, self.limit - 4))
+            chunk = self.tail[:cut]
+            language = open_fence(chunk)
+            if language is not None:
+                chunk = chunk.rstrip('\n') + '\n```'
+            if not self.max_chunks or self.count < self.max_chunks:
+                self.sealed[self.count] = chunk
+            self.count += 1
+            self.tail = (f"```{language}\n" if language is not None else '') + self.tail[cut:]
+
+    def total(self) -> int:
+        return self.count + (1 if self.tail.strip() else 0)
+
+    def chunks(self) -> List[Tuple[int, str, bool]]:
+        # Sealed chunks never change again, so each message is edited only while it is the last one
+        items = [(index, text, True) for index, text in sorted(self.sealed.items())]
+        if self.tail.strip() and (not self.max_chunks or self.count < self.max_chunks):
+            items.append((self.count, self.tail, False))
+        return items
+
+    def delivered(self, index: int):
+        self.sealed.pop(index, None)
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    splitter = MessageSplitter(limit)
+    splitter.feed(text)
+    return [chunk for _, chunk, _ in splitter.chunks()]
+
+def render_inline(text: str) -> str:
+    parts = INLINE_CODE.split(text)
+    for index, part in enumerate(parts):
+        if index % 2:
+            parts[index] = f"<code>{html.escape(part, quote=False)}</code>"
+        else:
+            part = html.escape(part, quote=False)
+            part = HEADING.sub(r'<b>\1</b>', part)
+            parts[index] = BOLD.sub(r'<b>\1</b>', part)
+    return ''.join(parts)
+
+def render_html(text: str) -> str:
+    # Every tag is closed within the chunk, including a code block that continues in the next message
+    output = []
+    position = 0
+    language = None
+    for match in FENCE_LINE.finditer(text):
+        body = text[position:match.start()]
+        if language is None:
+            output.append(render_inline(body))
+            language = match.group(1)
+            attribute = f' class="language-{html.escape(language)}"' if language else ''
+            output.append(f"<pre><code{attribute}>")
+        else:
+            output.append(html.escape(body.strip('\n'), quote=False) + "</code></pre>")
+            language = None
+        position = match.end() + 1
+    if language is None:
+        output.append(render_inline(text[position:]))
+    else:
+        output.append(html.escape(text[position:].strip('\n'), quote=False) + "</code></pre>")
+    return ''.join(output).strip()
@@ -1,10 +1,23 @@
 import redis
-from rq import Queue
-from rq.job import Job
-from decouple import config
+from rq import Queue, Callback, get_current_job
+from rq.registry import clean_registries
+from rq.exceptions import NoSuchJobError
+from rq.utils import utcnow
+from decouple import config, Csv
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List
 import json
+import time
+import asyncio
+from conversation import ConversationStore, estimate_tokens
+from rate_limit import RateLimiter, AdmissionController
+from scheduler import FairScheduler, summarize_samples
+from budget import GenerationBudget
+from keep_alive import KeepAliveScheduler
+from prompts import DEFAULT_SYSTEM_PROMPT
+from metrics import QUEUE_WAIT
+from compact_job import CompactJob, CompactSerializer
+from delivery_journal import record_delivery
 
 redis_host = config("REDIS_HOST", default="localhost")
 redis_port = config("REDIS_PORT", default=6379, cast=int)
@@ -19,21 +32,86 @@ redis_client = redis.Redis(
     encoding='utf-8'
 )
 
-task_queue = Queue(
-    connection=redis_client,
-    default_timeout=300
-)
+generation_budget = GenerationBudget(redis_client)
+
+queue_options = {
+    'connection': redis_client,
+    'default_timeout': generation_budget.max_job_timeout,
+    'job_class': CompactJob,
+    'serializer': CompactSerializer
+}
+
+admin_queue = Queue('admin', **queue_options)
+interactive_queue = Queue('interactive', **queue_options)
+bulk_queue = Queue('bulk', **queue_options)
+
+task_queues = [admin_queue, interactive_queue, bulk_queue]
+queues_by_name = {queue.name: queue for queue in task_queues}
+
+ADMIN_USER_IDS = config("ADMIN_USER_IDS", default="", cast=Csv(int))
+BULK_PROMPT_TOKENS = config("BULK_PROMPT_TOKENS", default=400, cast=int)
+
+RESULT_TTL = config("RESULT_TTL", default=120, cast=int)
+FAILURE_TTL = config("FAILURE_TTL", default=3600, cast=int)
+REGISTRY_PRUNE_INTERVAL = config("REGISTRY_PRUNE_INTERVAL", default=60, cast=int)
+
+conversation_store = ConversationStore(redis_client)
+fair_scheduler = FairScheduler(redis_client)
+rate_limiter = RateLimiter(redis_client)
+admission_controller = AdmissionController(redis_client, task_queues, fair_scheduler)
+keep_alive_scheduler = KeepAliveScheduler(redis_client)
+
+JOB_EVENTS_CHANNEL = config("JOB_EVENTS_CHANNEL", default="ai_jobs:events")
+STREAM_RESPONSES = config("STREAM_RESPONSES", default=True, cast=bool)
+STREAM_PUBLISH_INTERVAL = config("STREAM_PUBLISH_INTERVAL", default=0.3, cast=float)
+
+COALESCE_REQUESTS = config("COALESCE_REQUESTS", default=True, cast=bool)
+INFLIGHT_TTL = config("INFLIGHT_TTL", default=330, cast=int)
+COALESCED_COUNTER_KEY = "ai_jobs:coalesced"
+
+JOB_TOTALS_KEY = "ai_jobs:totals"
+RUN_TIMES_KEY = "ai_jobs:run_times"
+RUN_TIME_SAMPLES = config("RUN_TIME_SAMPLES", default=1000, cast=int)
+
+CANCEL_TTL = config("CANCEL_TTL", default=600, cast=int)
+CANCEL_CHECK_INTERVAL = config("CANCEL_CHECK_INTERVAL", default=0.5, cast=float)
+
+ATTACH_INFLIGHT_SCRIPT = """
+local leader = redis.call('GET', KEYS[1])
+if leader then
+    redis.call('INCR', KEYS[2])
+    return leader
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+
+RELEASE_INFLIGHT_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+attach_inflight = redis_client.register_script(ATTACH_INFLIGHT_SCRIPT)
+release_inflight = redis_client.register_script(RELEASE_INFLIGHT_SCRIPT)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def process_ai_request(user_id: int, message_text: str, system_prompt: str = None) -> Dict[str, Any]:
+def process_ai_request(user_id: int, message_text: str, system_prompt: str = None, chat_id: int = None) -> Dict[str, Any]:
     try:
         logger.info(f"Processing AI request - User: {user_id}, Message: {message_text[:50]}...")
         
-        from ai_service import OllamaService
+        from ai_service import get_ollama_service
+        
+        job = get_current_job()
+        if job is not None:
+            record_job_start(job)
+            if is_cancelled(job.id):
+                return cancelled_result(job.id, user_id)
         
-        ai_service = OllamaService()
+        ai_service = get_ollama_service()
         
         if not ai_service.ensure_model_ready():
             return {
@@ -43,11 +121,25 @@ def process_ai_request(user_id: int, message_text: str, system_prompt: str = Non
             }
         
         if not system_prompt:
-            system_prompt = "You are a helpful AI assistant. Provide short and clear answers in Turkish."
+            system_prompt = DEFAULT_SYSTEM_PROMPT
+        
+        conversation_id = chat_id if chat_id is not None else user_id
+        history = conversation_store.get_context(conversation_id)
+        
+        options = generation_options(job, system_prompt, message_text, history)
         
-        result = ai_service.generate_response(message_text, system_prompt)
+        if STREAM_RESPONSES and job is not None:
+            publisher = StreamPublisher(redis_client, job.id)
+            result = ai_service.generate_response(message_text, system_prompt, on_chunk=publisher.push, history=history,
+                                                  should_stop=CancelSignal(redis_client, job.id), options=options)
+            publisher.flush()
+        else:
+            result = ai_service.generate_response(message_text, system_prompt, history=history, options=options)
         result['user_id'] = user_id
         
+        if result['success']:
+            update_conversation(ai_service, conversation_id, message_text, result['response'])
+        
         logger.info(f"AI response generated - User: {user_id}")
         return result
         
@@ -60,48 +152,326 @@ def process_ai_request(user_id: int, message_text: str, system_prompt: str = Non
             'response': "An error occurred. Please try again later."
         }
 
-def get_job_status(job_id: str) -> Dict[str, Any]:
+async def process_ai_request_async(job, connection) -> Dict[str, Any]:
+    user_id, message_text, system_prompt, chat_id = job.args
     try:
-        job = Job.fetch(job_id, connection=redis_client)
+        logger.info(f"Processing AI request - User: {user_id}, Message: {message_text[:50]}...")
         
-        status_info = {
-            'job_id': job_id,
-            'status': job.get_status(),
-            'created_at': job.created_at.isoformat() if job.created_at else None,
-            'started_at': job.started_at.isoformat() if job.started_at else None,
-            'ended_at': job.ended_at.isoformat() if job.ended_at else None,
+        from ai_service import get_ollama_service
+        
+        await asyncio.to_thread(record_job_start, job)
+        if await asyncio.to_thread(is_cancelled, job.id):
+            return cancelled_result(job.id, user_id)
+        
+        ai_service = get_ollama_service()
+        
+        if not await asyncio.to_thread(ai_service.ensure_model_ready):
+            return {
+                'success': False,
+                'error': 'AI model not ready',
+                'user_id': user_id
+            }
+        
+        if not system_prompt:
+            system_prompt = DEFAULT_SYSTEM_PROMPT
+        
+        conversation_id = chat_id if chat_id is not None else user_id
+        history = await asyncio.to_thread(conversation_store.get_context, conversation_id)
+        
+        options = generation_options(job, system_prompt, message_text, history)
+        
+        if STREAM_RESPONSES:
+            publisher = AsyncStreamPublisher(connection, job.id)
+            async with AsyncCancelSignal(connection, job.id) as should_stop:
+                result = await ai_service.generate_response_async(message_text, system_prompt, on_chunk=publisher.push,
+                                                                  history=history, should_stop=should_stop,
+                                                                  options=options)
+            await publisher.aclose()
+        else:
+            result = await ai_service.generate_response_async(message_text, system_prompt, history=history, options=options)
+        result['user_id'] = user_id
+        
+        if result['success']:
+            await asyncio.to_thread(update_conversation, ai_service, conversation_id, message_text, result['response'])
+        
+        logger.info(f"AI response generated - User: {user_id}")
+        return result
+        
+    except Exception as e:
+        logger.error(f"AI processing error - User: {user_id}, Error: {e}")
+        return {
+            'success': False,
+            'error': str(e),
+            'user_id': user_id,
+            'response': "An error occurred. Please try again later."
         }
+
+def record_job_start(job):
+    try:
+        wait = (utcnow() - job.enqueued_at).total_seconds()
+        QUEUE_WAIT.labels(job.origin).observe(wait)
+        fair_scheduler.record_wait(job.origin, wait)
+        fair_scheduler.dispatch(queues_by_name[job.origin])
+        keep_alive_scheduler.touch()
+    except Exception as e:
+        logger.error(f"Job start bookkeeping error - Job ID: {job.id}, Error: {e}")
+
+def generation_options(job, system_prompt: str, message_text: str, history) -> Dict[str, int]:
+    prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(message_text)
+    prompt_tokens += sum(estimate_tokens(message['content']) for message in history or [])
+    return generation_budget.options(job.meta.get('budget') if job is not None else None, prompt_tokens)
+
+def select_queue(user_id: int, message_text: str) -> Queue:
+    if user_id in ADMIN_USER_IDS:
+        return admin_queue
+    if estimate_tokens(message_text) > BULK_PROMPT_TOKENS:
+        return bulk_queue
+    return interactive_queue
+
+def update_conversation(ai_service, conversation_id: int, message_text: str, response_text: str):
+    try:
+        dropped = conversation_store.append_exchange(conversation_id, message_text, response_text)
+        if dropped:
+            summary = ai_service.summarize_conversation(conversation_store.get_summary(conversation_id), dropped)
+            if summary:
+                conversation_store.set_summary(conversation_id, summary)
+    except Exception as e:
+        logger.error(f"Conversation update error - Conversation: {conversation_id}, Error: {e}")
+
+def job_event(job_id: str, status: str, payload: Dict[str, Any]) -> str:
+    event = {
+        'job_id': job_id,
+        'status': status,
+        'published_at': time.time(),
+    }
+    event.update(payload)
+    return json.dumps(event, default=str)
+
+def publish_job_event(connection, job_id: str, status: str, payload: Dict[str, Any]):
+    connection.publish(JOB_EVENTS_CHANNEL, job_event(job_id, status, payload))
+
+def publish_final_event(connection, job_id: str, status: str, payload: Dict[str, Any]):
+    # Pub/sub is lost while no bot listens; the journal entry stays until a bot acknowledges the delivery
+    payload['delivery_id'] = record_delivery(connection, job_id, status, payload)
+    publish_job_event(connection, job_id, status, payload)
+
+class StreamPublisher:
+    def __init__(self, connection, job_id: str, interval: float = STREAM_PUBLISH_INTERVAL):
+        self.connection = connection
+        self.job_id = job_id
+        self.interval = interval
+        self.offset = 0
+        self.pending = []
+        self.last_publish = 0.0
+        self.started_at = time.time()
+        self.first_token_at = None
+    
+    def push(self, piece: str):
+        if self.first_token_at is None:
+            self.first_token_at = time.time()
+            logger.info(f"First token - Job ID: {self.job_id}, TTFT: {self.first_token_at - self.started_at:.2f}s")
         
-        if job.is_finished:
+        self.pending.append(piece)
+        if time.time() - self.last_publish >= self.interval:
+            self.flush()
+    
+    def flush(self):
+        if not self.pending:
+            return
+        
+        text = ''.join(self.pending)
+        self.pending = []
+        self.publish(self.offset, text)
+        self.offset += len(text)
+        self.last_publish = time.time()
+    
+    def publish(self, offset: int, text: str):
+        try:
+            publish_job_event(self.connection, self.job_id, 'streaming', {'offset': offset, 'text': text})
+        except Exception as e:
+            logger.error(f"Stream publish error - Job ID: {self.job_id}, Error: {e}")
+
+class AsyncStreamPublisher(StreamPublisher):
+    # Chunks arrive through a plain callback, so each publish runs as a task on an asyncio Redis
+    # connection, chained to the previous one to keep the offsets in order
+    def __init__(self, connection, job_id: str, interval: float = STREAM_PUBLISH_INTERVAL):
+        super().__init__(connection, job_id, interval)
+        self.sending = None
+    
+    def publish(self, offset: int, text: str):
+        self.sending = asyncio.create_task(self.send(self.sending, offset, text))
+    
+    async def send(self, previous, offset: int, text: str):
+        if previous is not None:
+            await previous
+        try:
+            await self.connection.publish(JOB_EVENTS_CHANNEL, job_event(self.job_id, 'streaming', {
+                'offset': offset,
+                'text': text
+            }))
+        except Exception as e:
+            logger.error(f"Stream publish error - Job ID: {self.job_id}, Error: {e}")
+    
+    async def aclose(self):
+        self.flush()
+        if self.sending is not None:
+            await self.sending
+
+def cancel_key(job_id: str) -> str:
+    return f"ai_jobs:cancel:{job_id}"
+
+def is_cancelled(job_id: str) -> bool:
+    return bool(redis_client.exists(cancel_key(job_id)))
+
+def cancelled_result(job_id: str, user_id: int) -> Dict[str, Any]:
+    logger.info(f"Skipping cancelled job - Job ID: {job_id}")
+    return {
+        'success': False,
+        'cancelled': True,
+        'error': 'Cancelled',
+        'user_id': user_id
+    }
+
+class CancelSignal:
+    def __init__(self, connection, job_id: str, interval: float = CANCEL_CHECK_INTERVAL):
+        self.connection = connection
+        self.key = cancel_key(job_id)
+        self.interval = interval
+        self.last_check = time.time()
+        self.cancelled = False
+    
+    def __call__(self) -> bool:
+        if not self.cancelled and time.time() - self.last_check >= self.interval:
+            self.last_check = time.time()
             try:
-                result = job.result
-                if result is None:
-                    status_info['result'] = {'error': 'Result not found'}
-                else:
-                    status_info['result'] = result
+                self.cancelled = bool(self.connection.exists(self.key))
             except Exception as e:
-                logger.error(f"Job result processing error: {e}")
-                status_info['result'] = {'error': 'Result could not be processed'}
-                
-        elif job.is_failed:
+                logger.error(f"Cancel check error - Key: {self.key}, Error: {e}")
+        return self.cancelled
+
+class AsyncCancelSignal:
+    # The chunk loop calls should_stop() synchronously, so a background task keeps the flag fresh
+    def __init__(self, connection, job_id: str, interval: float = CANCEL_CHECK_INTERVAL):
+        self.connection = connection
+        self.key = cancel_key(job_id)
+        self.interval = interval
+        self.cancelled = False
+        self.task = None
+    
+    def __call__(self) -> bool:
+        return self.cancelled
+    
+    async def watch(self):
+        while not self.cancelled:
+            await asyncio.sleep(self.interval)
             try:
-                error = str(job.exc_info)
-                status_info['error'] = error
+                self.cancelled = bool(await self.connection.exists(self.key))
             except Exception as e:
-                logger.error(f"Job error processing error: {e}")
-                status_info['error'] = 'Error detail could not be retrieved'
+                logger.error(f"Cancel check error - Key: {self.key}, Error: {e}")
+    
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self.watch())
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.task.cancel()
+
+def inflight_key(coalesce_key: str) -> str:
+    return f"ai_jobs:inflight:{coalesce_key}"
+
+def release_inflight_job(job, connection):
+    coalesce_key = job.meta.get('coalesce_key')
+    if coalesce_key:
+        release_inflight(keys=[inflight_key(coalesce_key)], args=[job.id], client=connection)
+
+def record_job_outcome(connection, job, outcome: str, tokens: int = 0):
+    # Monotonic counters and recent run times; monitors turn their deltas into rates
+    with connection.pipeline(transaction=False) as pipe:
+        pipe.hincrby(JOB_TOTALS_KEY, outcome, 1)
+        if tokens:
+            pipe.hincrby(JOB_TOTALS_KEY, 'tokens', tokens)
+        if job.started_at and outcome != 'cancelled':
+            pipe.lpush(RUN_TIMES_KEY, round((utcnow() - job.started_at).total_seconds(), 3))
+            pipe.ltrim(RUN_TIMES_KEY, 0, RUN_TIME_SAMPLES - 1)
+        pipe.execute()
+
+def report_job_success(job, connection, result, *args, **kwargs):
+    try:
+        release_inflight_job(job, connection)
+        publish_final_event(connection, job.id, 'finished', {'result': result})
+        if job.started_at and not result.get('cancelled'):
+            admission_controller.record_duration((utcnow() - job.started_at).total_seconds())
+        if result.get('success'):
+            generation_budget.record(result)
+        outcome = 'cancelled' if result.get('cancelled') else ('finished' if result.get('success') else 'errors')
+        record_job_outcome(connection, job, outcome, result.get('tokens', 0))
+    except Exception as e:
+        logger.error(f"Job success event error - Job ID: {job.id}, Error: {e}")
+
+def report_job_failure(job, connection, type, value, traceback):
+    try:
+        release_inflight_job(job, connection)
+        publish_final_event(connection, job.id, 'failed', {'error': str(value)})
+        record_job_outcome(connection, job, 'failed')
+    except Exception as e:
+        logger.error(f"Job failure event error - Job ID: {job.id}, Error: {e}")
+
+def job_status_info(job_id: str, job) -> Dict[str, Any]:
+    if job is None:
+        return {
+            'job_id': job_id,
+            'status': 'unknown',
+            'error': f"No such job: {job_id}"
+        }
+    
+    status = job.get_status(refresh=False)
+    status_info = {
+        'job_id': job_id,
+        'status': status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'ended_at': job.ended_at.isoformat() if job.ended_at else None,
+    }
+    
+    if status == 'finished':
+        try:
+            result = job.return_value()
+            if result is None:
+                status_info['result'] = {'error': 'Result not found'}
+            else:
+                status_info['result'] = result
+        except Exception as e:
+            logger.error(f"Job result processing error: {e}")
+            status_info['result'] = {'error': 'Result could not be processed'}
             
-        return status_info
+    elif status == 'failed':
+        try:
+            status_info['error'] = str(job.exc_info)
+        except Exception as e:
+            logger.error(f"Job error processing error: {e}")
+            status_info['error'] = 'Error detail could not be retrieved'
         
+    return status_info
+
+def get_jobs_status(job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    if not job_ids:
+        return {}
+    
+    try:
+        jobs = CompactJob.fetch_many(job_ids, connection=redis_client, serializer=CompactSerializer)
+        return {job_id: job_status_info(job_id, job) for job_id, job in zip(job_ids, jobs)}
     except Exception as e:
         logger.error(f"Job status check error: {e}")
         return {
-            'job_id': job_id,
-            'status': 'unknown',
-            'error': str(e)
+            job_id: {'job_id': job_id, 'status': 'unknown', 'error': str(e)}
+            for job_id in job_ids
         }
 
-def enqueue_ai_request(user_id: int, message_text: str, system_prompt: str = None) -> str:
+def get_job_status(job_id: str) -> Dict[str, Any]:
+    return get_jobs_status([job_id])[job_id]
+
+def enqueue_ai_request(user_id: int, message_text: str, system_prompt: str = None, chat_id: int = None,
+                       coalesce_key: str = None, budget: Dict[str, Any] = None) -> str:
     try:
         safe_message = str(message_text)
         safe_prompt = str(system_prompt) if system_prompt else None
@@ -110,39 +480,155 @@ def enqueue_ai_request(user_id: int, message_text: str, system_prompt: str = Non
         content_hash = hashlib.md5(f"{user_id}_{safe_message}".encode()).hexdigest()[:8]
         job_id = f"ai_request_{user_id}_{content_hash}"
         
-        job = task_queue.enqueue(
-            process_ai_request,
-            user_id,
-            safe_message,
-            safe_prompt,
-            job_timeout=300,
-            job_id=job_id
-        )
+        if not COALESCE_REQUESTS:
+            coalesce_key = None
+        
+        if coalesce_key:
+            leader_id = attach_inflight(
+                keys=[inflight_key(coalesce_key), COALESCED_COUNTER_KEY],
+                args=[job_id, INFLIGHT_TTL]
+            )
+            if leader_id:
+                leader_id = leader_id.decode() if isinstance(leader_id, bytes) else leader_id
+                logger.info(f"AI request coalesced - Job ID: {leader_id}, User: {user_id}")
+                return leader_id
+        
+        try:
+            if budget is None:
+                budget = generation_budget.plan(admission_controller.estimate(), safe_message)
+            meta = {'budget': {'num_predict': budget['num_predict'], 'num_ctx': budget['num_ctx']}}
+            if coalesce_key:
+                meta['coalesce_key'] = coalesce_key
+            
+            queue = select_queue(user_id, safe_message)
+            job = queue.create_job(
+                process_ai_request,
+                args=(user_id, safe_message, safe_prompt, chat_id),
+                timeout=budget['timeout'],
+                result_ttl=RESULT_TTL,
+                failure_ttl=FAILURE_TTL,
+                description=f"ai_request user={user_id}",
+                job_id=job_id,
+                meta=meta,
+                on_success=Callback(report_job_success),
+                on_failure=Callback(report_job_failure)
+            )
+            fair_scheduler.submit(queue, job, chat_id if chat_id is not None else user_id)
+        except Exception:
+            if coalesce_key:
+                release_inflight(keys=[inflight_key(coalesce_key)], args=[job_id])
+            raise
         
-        logger.info(f"AI request enqueued - Job ID: {job.id}, User: {user_id}")
+        logger.info(f"AI request enqueued - Job ID: {job.id}, Queue: {queue.name}, User: {user_id}")
         return job.id
         
     except Exception as e:
         logger.error(f"Enqueue error: {e}")
         raise
 
+def cancel_ai_request(job_id: str) -> str:
+    try:
+        job = CompactJob.fetch(job_id, connection=redis_client, serializer=CompactSerializer)
+    except NoSuchJobError:
+        return 'missing'
+    
+    status = job.get_status(refresh=False)
+    if status not in ('queued', 'started'):
+        return status
+    
+    try:
+        redis_client.set(cancel_key(job_id), 1, ex=CANCEL_TTL)
+        release_inflight_job(job, redis_client)
+        
+        user_id, _, _, chat_id = job.args
+        queue = queues_by_name[job.origin]
+        owner = chat_id if chat_id is not None else user_id
+        if fair_scheduler.unstage(queue, job_id, owner) or queue.remove(job_id):
+            job.delete(remove_from_queue=False)
+            # The freed dispatch window slot goes to the next staged job
+            fair_scheduler.dispatch(queue)
+            logger.info(f"AI request removed from queue - Job ID: {job_id}")
+            return 'removed'
+        
+        logger.info(f"AI request cancellation requested - Job ID: {job_id}")
+        return 'stopping'
+    except Exception as e:
+        logger.error(f"Cancel error - Job ID: {job_id}, Error: {e}")
+        raise
+
 def get_queue_stats() -> Dict[str, Any]:
+    queue_names = [queue.name for queue in task_queues]
+    registries = ('failed_job_registry', 'finished_job_registry', 'started_job_registry', 'deferred_job_registry')
+    
     try:
+        # Registry entries are counted without RQ's per-call cleanup; workers prune them periodically
+        with redis_client.pipeline(transaction=False) as pipe:
+            for queue in task_queues:
+                for registry in registries:
+                    pipe.zcard(getattr(queue, registry).key)
+            pipe.get(COALESCED_COUNTER_KEY)
+            estimate_replies = admission_controller.queue_estimate_commands(pipe)
+            pipe.hgetall(generation_budget.stats_key)
+            pipe.hgetall(JOB_TOTALS_KEY)
+            pipe.lrange(RUN_TIMES_KEY, 0, -1)
+            fair_scheduler.wait_stats_commands(pipe, queue_names)
+            replies = pipe.execute()
+        
+        registry_counts = replies[:len(task_queues) * len(registries)]
+        coalesced = replies[len(registry_counts)]
+        estimate_start = len(registry_counts) + 1
+        estimate = admission_controller.parse_estimate(replies[estimate_start:estimate_start + estimate_replies])
+        budget_stats, totals, run_times, *wait_samples = replies[estimate_start + estimate_replies:]
+        budget = generation_budget.plan(estimate, '', budget_stats)
+        
+        def registry_total(index):
+            return sum(registry_counts[index::len(registries)])
+        
         return {
-            'queue_length': len(task_queue),
-            'failed_jobs': len(task_queue.failed_job_registry),
-            'finished_jobs': len(task_queue.finished_job_registry),
-            'started_jobs': len(task_queue.started_job_registry),
-            'deferred_jobs': len(task_queue.deferred_job_registry),
+            'queue_length': estimate['queue_length'],
+            'failed_jobs': registry_total(0),
+            'finished_jobs': registry_total(1),
+            'started_jobs': registry_total(2),
+            'deferred_jobs': registry_total(3),
+            'coalesced_requests': int(coalesced or 0),
+            'estimated_wait': estimate['estimated_wait'],
+            'answer_eta': budget['eta'],
+            'output_budget': budget['num_predict'],
+            'tokens_per_second': budget['tokens_per_second'],
+            'queues': estimate['queues'],
+            'workers': estimate['workers'],
+            'wait_times': fair_scheduler.parse_wait_stats(queue_names, wait_samples),
+            'run_times': summarize_samples(run_times),
+            'totals': {key.decode(): int(value) for key, value in totals.items()},
         }
     except Exception as e:
         logger.error(f"Queue stats error: {e}")
         return {'error': str(e)}
 
+def prune_registries():
+    for queue in task_queues:
+        if not queue.acquire_maintenance_lock():
+            continue
+        try:
+            clean_registries(queue)
+        except Exception as e:
+            logger.error(f"Registry pruning error - Queue: {queue.name}, Error: {e}")
+        finally:
+            queue.release_maintenance_lock()
+
 def clear_finished_jobs():
     try:
-        task_queue.finished_job_registry.clear()
-        task_queue.failed_job_registry.clear()
+        for queue in task_queues:
+            queue.finished_job_registry.clear()
+            queue.failed_job_registry.clear()
         logger.info("Finished jobs cleared")
     except Exception as e:
-        logger.error(f"Job clearing error: {e}")
\ No newline at end of file
+        logger.error(f"Job clearing error: {e}")
+
+def reset_conversation(chat_id: int):
+    try:
+        conversation_store.reset(chat_id)
+        logger.info(f"Conversation reset - Chat: {chat_id}")
+    except Exception as e:
+        logger.error(f"Conversation reset error: {e}")
+        raise
\ No newline at end of file
@@ -1,10 +1,18 @@
 import sys
 import os
+import time
+import signal
+import asyncio
 import logging
-from rq import Worker, Connection
+import multiprocessing
+from rq import Worker, SimpleWorker, Connection
 from rq.job import Job
-from task_queue import redis_client, task_queue
+from task_queue import redis_client, task_queues, fair_scheduler, keep_alive_scheduler, REGISTRY_PRUNE_INTERVAL
+from compact_job import CompactJob, CompactSerializer
+from ai_service import get_ollama_service
+from metrics import start_metrics_server, clear_metrics_files, use_work_horse_metrics, mark_process_dead
 from termcolor import colored
+from decouple import config
 
 logging.basicConfig(
     level=logging.INFO,
@@ -17,6 +25,71 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+def warm_up_model():
+    started = time.time()
+    if get_ollama_service().warm_up():
+        keep_alive_scheduler.touch()
+        print(colored(f"[+] Model warmed up in {time.time() - started:.2f}s", "green"))
+    else:
+        print(colored("[-] Model warm-up failed, first job will load the model", "yellow"))
+
+class ForkingWorker(Worker):
+    def main_work_horse(self, job, queue):
+        use_work_horse_metrics()
+        super().main_work_horse(job, queue)
+
+def run_rq_worker(worker_class):
+    with Connection(redis_client):
+        for queue in task_queues:
+            fair_scheduler.dispatch(queue)
+        
+        worker = worker_class(task_queues, connection=redis_client, job_class=CompactJob,
+                              serializer=CompactSerializer, maintenance_interval=REGISTRY_PRUNE_INTERVAL)
+        print(colored(f"[+] Worker started - Queues: {', '.join(queue.name for queue in task_queues)}", "green"))
+        print(colored("[+] Waiting for jobs to be processed...", "yellow"))
+        
+        worker.work(with_scheduler=True)
+
+def run_pool_member():
+    try:
+        warm_up_model()
+        run_rq_worker(SimpleWorker)
+    except KeyboardInterrupt:
+        pass
+
+def run_pool(size):
+    restart_delay = config("WORKER_RESTART_DELAY", default=1.0, cast=float)
+    members = {}
+    
+    def spawn(slot):
+        process = multiprocessing.Process(target=run_pool_member, name=f"pool-worker-{slot}")
+        process.start()
+        members[slot] = process
+        print(colored(f"[+] Pool member {slot} started (pid {process.pid})", "green"))
+    
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    
+    signal.signal(signal.SIGTERM, stop)
+    
+    for slot in range(size):
+        spawn(slot)
+    
+    try:
+        while True:
+            time.sleep(1)
+            for slot, process in list(members.items()):
+                if not process.is_alive():
+                    logger.error(f"Pool member {slot} exited with code {process.exitcode}, restarting")
+                    mark_process_dead(process.pid)
+                    time.sleep(restart_delay)
+                    spawn(slot)
+    finally:
+        for process in members.values():
+            process.terminate()
+        for process in members.values():
+            process.join(timeout=30)
+
 def main():
     try:
         print(colored("[+] Starting RQ Worker...", "blue"))
@@ -24,12 +97,22 @@ def main():
         redis_client.ping()
         print(colored("[+] Redis connection successful", "green"))
         
-        with Connection(redis_client):
-            worker = Worker([task_queue], connection=redis_client)
-            print(colored(f"[+] Worker started - Queue: {task_queue.name}", "green"))
-            print(colored("[+] Waiting for jobs to be processed...", "yellow"))
-            
-            worker.work(with_scheduler=True)
+        mode = config("WORKER_MODE", default="rq")
+        clear_metrics_files()
+        start_metrics_server(config("WORKER_METRICS_PORT", default=9101, cast=int))
+        keep_alive_scheduler.start()
+        
+        if mode == "batch":
+            from batch_worker import BatchWorker
+            warm_up_model()
+            asyncio.run(BatchWorker().run())
+        elif mode == "pool":
+            run_pool(config("WORKER_POOL_SIZE", default=2, cast=int))
+        elif mode == "simple":
+            warm_up_model()
+            run_rq_worker(SimpleWorker)
+        else:
+            run_rq_worker(ForkingWorker)
             
     except KeyboardInterrupt:
         print(colored("\n[-] Worker stopped", "yellow"))
@@ -40,4 +123,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()